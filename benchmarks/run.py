@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import platform
+
+import numpy as np
+from typing import Callable, Dict
+
+from dataset import (
+    CadcDataset, CadcLidarCloud, LabelTable, LidarCloud, generate_synthetic_cadc, profile_loading
+)
+from geometry.transformations import rotate_points_3d, boxes_straight2rotated_3d
+from viz.bev import create_empty_bev, draw_pcl_on_bev
+
+
+def timeit(function: Callable, repeats: int = 5) -> Dict[str, float]:
+    """Wall time of repeated calls in seconds, first call is a warm up"""
+    function()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "mean": float(np.mean(times)), "repeats": repeats}
+
+
+def dataset_bytes(path: str, load_images: bool) -> int:
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            if file_name.endswith((".bin", ".json")) or load_images and file_name.endswith(".png"):
+                total += os.path.getsize(os.path.join(dir_path, file_name))
+    return total
+
+
+def bench_lazy_create(path: str, repeats: int, load_images: bool = False) -> Dict:
+    def load():
+        for scene in CadcDataset.lazy_create_from_path(path):
+            if load_images:
+                for camera in scene.cameras:
+                    camera.image.data
+
+    n_scenes = len(CadcDataset.get_scenes_info_list(path, use_index=False))
+    timing = timeit(load, repeats)
+    with profile_loading() as profiler:
+        load()
+    return dict(
+        timing,
+        scenes=n_scenes,
+        scenes_per_second=n_scenes / timing["min"],
+        megabytes_per_second=dataset_bytes(path, load_images) / timing["min"] / 2 ** 20,
+        stages=profiler.summary()
+    )
+
+
+def bench_labels(path: str, repeats: int) -> Dict:
+    n_boxes = len(LabelTable.from_path(path))
+    timing = timeit(lambda: LabelTable.from_path(path).describe("dimensions", ("date", "ride", "label")), repeats)
+    return dict(timing, boxes=n_boxes, boxes_per_second=n_boxes / timing["min"])
+
+
+def bench_from_binary(path: str, repeats: int, mmap: bool = False) -> Dict:
+    files = []
+    for dir_path, _, file_names in os.walk(path):
+        files += [os.path.join(dir_path, name) for name in sorted(file_names) if name.endswith(".bin")]
+
+    def load():
+        for file_name in files:
+            np.asarray(CadcLidarCloud.from_binary(file_name, mmap=mmap).points).sum()
+
+    timing = timeit(load, repeats)
+    size = sum(os.path.getsize(file_name) for file_name in files)
+    return dict(timing, files=len(files), megabytes_per_second=size / timing["min"] / 2 ** 20)
+
+
+def bench_rotate_points_3d(batch: int, points: int, repeats: int) -> Dict:
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(batch, points, 3)).astype(np.float32)
+    angles = rng.uniform(-np.pi, np.pi, batch).astype(np.float32)
+    timing = timeit(lambda: rotate_points_3d(data, angles, 'z'), repeats)
+    return dict(timing, points_per_second=batch * points / timing["min"])
+
+
+def bench_boxes_straight2rotated_3d(boxes: int, repeats: int) -> Dict:
+    rng = np.random.default_rng(0)
+    data = rng.uniform(0.5, 5, (boxes, 7))
+    timing = timeit(lambda: boxes_straight2rotated_3d(data), repeats)
+    return dict(timing, boxes_per_second=boxes / timing["min"])
+
+
+def bench_draw_pcl_on_bev(points: int, repeats: int, image_size=(800, 800), scene_size=(50, 50)) -> Dict:
+    rng = np.random.default_rng(0)
+    cloud = LidarCloud(rng.uniform(-60, 60, (points, 4)).astype(np.float32))
+    timing = timeit(lambda: draw_pcl_on_bev(create_empty_bev(list(image_size)), cloud, list(scene_size)), repeats)
+    return dict(timing, points_per_second=points / timing["min"])
+
+
+DATASET_PARAMS_FILE = "cadc_params.json"
+
+
+def prepare_dataset(root: str, frames: int, points: int, image_size) -> str:
+    """Synthetic dataset under root/cadc, its generation params are kept next to it in root/cadc_params.json
+    and a dataset generated with other params is generated again"""
+    path = os.path.join(root, "cadc")
+    params_path = os.path.join(root, DATASET_PARAMS_FILE)
+    params = {"frames": frames, "points": points, "image_size": list(image_size)}
+    if os.path.isdir(path):
+        existing = None
+        if os.path.isfile(params_path):
+            with open(params_path) as fr:
+                existing = json.load(fr)
+        if existing == params:
+            return path
+        # params are written back only after a complete generation, an interrupted one is redone
+        if os.path.isfile(params_path):
+            os.remove(params_path)
+        shutil.rmtree(path)
+    generate_synthetic_cadc(path, {"2018_03_06": ["0001"]}, frames, points, tuple(image_size))
+    with open(params_path, "w") as fw:
+        json.dump(params, fw)
+    return path
+
+
+def run_benchmarks(
+        root: str = None,
+        frames: int = 20,
+        points: int = 100000,
+        image_size=(1280, 1024),
+        repeats: int = 3,
+        load_images: bool = True
+) -> Dict:
+    """Runs all benchmarks, on a synthetic CADC shaped dataset generated under root
+    or in a temporary directory when root is not given. A dataset kept under root is reused
+    only when it was generated with the same frames, points and image_size"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = prepare_dataset(root or tmp_dir, frames, points, image_size)
+        results = {
+            "lazy_create_from_path": bench_lazy_create(path, repeats, load_images),
+            "labels_from_path": bench_labels(path, repeats),
+            "from_binary": bench_from_binary(path, repeats),
+            "from_binary_mmap": bench_from_binary(path, repeats, mmap=True),
+        }
+    results.update({
+        "rotate_points_3d": bench_rotate_points_3d(16, points, repeats),
+        "boxes_straight2rotated_3d": bench_boxes_straight2rotated_3d(10000, repeats),
+        "draw_pcl_on_bev": bench_draw_pcl_on_bev(points, repeats),
+    })
+    return {
+        "config": {"frames": frames, "points": points, "image_size": list(image_size),
+                   "repeats": repeats, "load_images": load_images},
+        "environment": {"python": sys.version.split()[0], "numpy": np.__version__, "platform": platform.platform()},
+        "results": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmarks')
+    parser.add_argument('--output', default=None, type=str, help="json file, stdout by default")
+    parser.add_argument('--root', default=None, type=str, help="keep the synthetic dataset in this directory")
+    parser.add_argument('--frames', default=20, type=int)
+    parser.add_argument('--points', default=100000, type=int)
+    parser.add_argument('--image_size', default=[1280, 1024], type=int, nargs=2)
+    parser.add_argument('--repeats', default=3, type=int)
+    parser.add_argument('--no_images', action='store_true')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.root, args.frames, args.points, args.image_size, args.repeats, not args.no_images)
+    if args.output:
+        with open(args.output, "w") as fw:
+            json.dump(report, fw, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import json
+import pytest
+
+from dataset import CadcDataset
+from . import run
+from .run import DATASET_PARAMS_FILE, prepare_dataset, run_benchmarks
+
+
+def test_run_benchmarks(tmp_path):
+    report = run_benchmarks(str(tmp_path), frames=2, points=256, image_size=(16, 8), repeats=1)
+    results = report["results"]
+    assert set(results) == {
+        "lazy_create_from_path", "labels_from_path", "from_binary", "from_binary_mmap",
+        "rotate_points_3d", "boxes_straight2rotated_3d", "draw_pcl_on_bev"
+    }
+    loading = results["lazy_create_from_path"]
+    assert loading["scenes"] == 2 and loading["scenes_per_second"] > 0
+    assert loading["stages"]["lidar_read"]["calls"] == 2
+    assert loading["stages"]["lidar_read"]["bytes"] == 2 * 256 * 16
+    assert loading["stages"]["image_open"]["calls"] == 16
+    assert loading["stages"]["json_parse"]["calls"] == 1
+    assert results["labels_from_path"]["boxes"] == 3
+    assert json.loads(json.dumps(report)) == report
+
+
+def test_dataset_regenerated_for_other_params(tmp_path, monkeypatch):
+    path = prepare_dataset(str(tmp_path), frames=2, points=16, image_size=(16, 8))
+    assert prepare_dataset(str(tmp_path), frames=2, points=16, image_size=(16, 8)) == path
+    assert len(CadcDataset.get_scenes_info_list(path)) == 2
+
+    prepare_dataset(str(tmp_path), frames=3, points=16, image_size=(16, 8))
+    assert len(CadcDataset.get_scenes_info_list(path)) == 3
+    with open(str(tmp_path / DATASET_PARAMS_FILE)) as fr:
+        assert json.load(fr) == {"frames": 3, "points": 16, "image_size": [16, 8]}
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(run, "generate_synthetic_cadc", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        prepare_dataset(str(tmp_path), frames=2, points=16, image_size=(16, 8))
+    assert not (tmp_path / DATASET_PARAMS_FILE).exists()
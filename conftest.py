@@ -0,0 +1,10 @@
+import os
+import pytest
+
+from dataset.synthetic import generate_synthetic_cadc
+
+
+@pytest.fixture
+def synthetic_dataset_path(tmp_path):
+    calib_source = os.path.join(os.environ['PROJECT_ROOT_DIR'], "resources/test_data/cadc/2018_03_06/calib")
+    return generate_synthetic_cadc(str(tmp_path / "cadc"), calib_source=calib_source)
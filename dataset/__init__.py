@@ -1,3 +1,15 @@
+from .profiling import *
 from .structures import *
 from .cadc import *
 from .download import *
+from .archive import *
+from .packed import *
+from .prefetch import *
+from .projection import *
+from .sweeps import *
+from .collate import *
+from .filters import *
+from .rectification import *
+from .range_image import *
+from .labels import *
+from .synthetic import *
@@ -0,0 +1,306 @@
+import os
+import json
+import zlib
+import struct
+import zipfile
+
+import numpy as np
+from functools import lru_cache
+from typing import List, Dict, Optional, Union, Callable, Iterable
+from dataclasses import dataclass, field
+
+from .structures import Scene, SceneID, RideID
+from .cadc import (
+    CadcDataset, CadcLidarCloud, CadcIntrinsics, CadcExtrinsics,
+    camera_dir, list_rides
+)
+from .download import CALIB_FILE, LABEL_FILE, ANN_FILE
+
+
+ZIP_INDEX_SUFFIX = ".index.json"
+ZIP_INDEX_VERSION = 1
+LOCAL_HEADER_SIZE = 30
+# parsed 3d_ann.json of this many recently read rides are kept by ArchiveCadcDataset
+CUBOID_CACHE_RIDES = 4
+
+
+@dataclass
+class ZipMember:
+    name: str
+    data_offset: int
+    compressed_size: int
+    file_size: int
+    compression: int
+
+
+@dataclass
+class ZipIndex:
+    """Central directory of a zip archive with absolute offsets of member data,
+    cached next to the archive and invalidated when the archive size or mtime change"""
+    archive_path: str
+    archive_size: int
+    archive_mtime: int
+    members: Dict[str, ZipMember]
+
+    @staticmethod
+    def build(archive_path: str) -> "ZipIndex":
+        stat = os.stat(archive_path)
+        members = {}
+        with zipfile.ZipFile(archive_path) as archive, open(archive_path, "rb") as fr:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                # local header has its own name and extra field lengths
+                fr.seek(info.header_offset + 26)
+                name_length, extra_length = struct.unpack("<HH", fr.read(4))
+                members[info.filename] = ZipMember(
+                    info.filename,
+                    info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length,
+                    info.compress_size,
+                    info.file_size,
+                    info.compress_type
+                )
+        return ZipIndex(archive_path, stat.st_size, stat.st_mtime_ns, members)
+
+    def save(self, path):
+        data = {
+            "version": ZIP_INDEX_VERSION,
+            "archive_size": self.archive_size,
+            "archive_mtime": self.archive_mtime,
+            "members": [
+                [member.name, member.data_offset, member.compressed_size, member.file_size, member.compression]
+                for member in self.members.values()
+            ]
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as fw:
+            json.dump(data, fw)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(archive_path: str, path) -> "ZipIndex":
+        with open(path) as fr:
+            data = json.load(fr)
+        if data["version"] != ZIP_INDEX_VERSION:
+            raise ValueError("Unsupported zip index version %s in %s" % (data["version"], path))
+        return ZipIndex(
+            archive_path,
+            data["archive_size"],
+            data["archive_mtime"],
+            {member[0]: ZipMember(*member) for member in data["members"]}
+        )
+
+    def is_valid(self) -> bool:
+        stat = os.stat(self.archive_path)
+        return stat.st_size == self.archive_size and stat.st_mtime_ns == self.archive_mtime
+
+    @staticmethod
+    def load_valid(archive_path: str) -> Optional["ZipIndex"]:
+        """Saved index of the archive if it is readable and matches the archive, None otherwise"""
+        index_path = archive_path + ZIP_INDEX_SUFFIX
+        if not os.path.isfile(index_path):
+            return None
+        try:
+            index = ZipIndex.load(archive_path, index_path)
+        except (ValueError, KeyError, TypeError):
+            return None
+        return index if index.is_valid() else None
+
+    @staticmethod
+    def load_or_build(archive_path: str, rebuild: bool = False) -> "ZipIndex":
+        """Saved index, rebuilt when it is missing, truncated, of another version or stale"""
+        index = None if rebuild else ZipIndex.load_valid(archive_path)
+        if index is not None:
+            return index
+        index_path = archive_path + ZIP_INDEX_SUFFIX
+        index = ZipIndex.build(archive_path)
+        try:
+            index.save(index_path)
+        except OSError:
+            pass
+        return index
+
+    def names(self, prefix: str = "") -> List[str]:
+        return sorted(name for name in self.members if name.startswith(prefix))
+
+    def read(self, name: str) -> bytes:
+        member = self.members[name]
+        with open(self.archive_path, "rb") as fr:
+            fr.seek(member.data_offset)
+            data = fr.read(member.compressed_size)
+        if member.compression == zipfile.ZIP_STORED:
+            return data
+        if member.compression == zipfile.ZIP_DEFLATED:
+            return zlib.decompressobj(-zlib.MAX_WBITS).decompress(data)
+        with zipfile.ZipFile(self.archive_path) as archive:
+            return archive.read(name)
+
+    def memmap(self, name: str, dtype, shape) -> np.memmap:
+        """Read-only map of an uncompressed member"""
+        member = self.members[name]
+        assert member.compression == zipfile.ZIP_STORED, "Only stored members can be mapped"
+        return np.memmap(self.archive_path, dtype=dtype, mode="r", offset=member.data_offset, shape=shape)
+
+
+@lru_cache(maxsize=64)
+def zip_index(archive_path: str) -> ZipIndex:
+    """In-process cache over ZipIndex.load_or_build"""
+    return ZipIndex.load_or_build(archive_path)
+
+
+@dataclass
+class ZipMemberSource:
+    """Picklable lazy reader of a member, usable as an Image source"""
+    archive_path: str
+    name: str
+
+    def __call__(self) -> bytes:
+        return zip_index(self.archive_path).read(self.name)
+
+
+def read_lidar_member(index: ZipIndex, name: str, mmap: bool = False) -> CadcLidarCloud:
+    member = index.members[name]
+    if mmap and member.compression == zipfile.ZIP_STORED:
+        row_size = CadcLidarCloud.NUMBER_OF_CHANNELS * np.dtype(np.float32).itemsize
+        count = member.file_size // row_size
+        if count == 0:
+            return CadcLidarCloud(np.empty((0, CadcLidarCloud.NUMBER_OF_CHANNELS), dtype=np.float32))
+        return CadcLidarCloud(index.memmap(name, np.float32, (count, CadcLidarCloud.NUMBER_OF_CHANNELS)))
+    return CadcLidarCloud.from_buffer(index.read(name))
+
+
+def read_archive_calib(date_path: str):
+    """Intrinsics and extrinsics of a date from calib directory or calib.zip"""
+    calib_path = os.path.join(date_path, "calib")
+    if os.path.isdir(calib_path):
+        cam2calib = CadcDataset.read_calib(calib_path)
+        return cam2calib, CadcDataset.read_extrinsics(calib_path, cam2calib)
+
+    index = zip_index(os.path.join(date_path, CALIB_FILE))
+    cam2calib = {
+        camera_idx: CadcIntrinsics.from_yaml(index.read("calib/" + str(camera_idx).rjust(2, '0') + ".yaml"))
+        for camera_idx in range(CadcDataset.NUMBER_OF_CAMERAS)
+    }
+    cam2extrinsics = {}
+    if "calib/extrinsics.yaml" in index.members:
+        cam2extrinsics = CadcExtrinsics.from_yaml(
+            index.read("calib/extrinsics.yaml"),
+            {camera_idx: calib.name.rstrip("_intrinsics") for camera_idx, calib in cam2calib.items()}
+        )
+    return cam2calib, cam2extrinsics
+
+
+def list_archive_rides(date_path: str) -> List[str]:
+    return [
+        ride for ride in list_rides(date_path)
+        if os.path.isfile(os.path.join(date_path, ride, LABEL_FILE))
+    ]
+
+
+@dataclass
+class ArchiveCadcDataset:
+    """Random access CADC dataset read straight from downloaded archives:
+    root/date/calib.zip (or extracted calib), root/date/ride/3d_ann.json and root/date/ride/labeled.zip.
+    Scenes are the same as CadcDataset.lazy_create_from_path gives for the extracted tree"""
+    path: str
+    cameras: List[int] = None
+    mmap_lidar: bool = False
+    scene_ids: List[SceneID] = field(default=None, init=False)
+    _positions: Dict[str, int] = field(default=None, init=False, repr=False)
+    _frames: List[int] = field(default=None, init=False, repr=False)
+    _calibs: Dict[str, tuple] = field(default_factory=dict, init=False, repr=False)
+    _cuboids: Dict[str, list] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        self.scene_ids = []
+        self._frames = []
+        for date in sorted(os.listdir(self.path)):
+            date_path = os.path.join(self.path, date)
+            if not os.path.isdir(date_path):
+                continue
+            for ride in list_archive_rides(date_path):
+                index = zip_index(os.path.join(date_path, ride, LABEL_FILE))
+                for frame, name in enumerate(index.names("labeled/lidar_points/data/")):
+                    self._frames.append(frame)
+                    self.scene_ids.append(SceneID(RideID(date, ride), os.path.basename(name).rstrip(".bin")))
+        self._positions = {str(scene_id): idx for idx, scene_id in enumerate(self.scene_ids)}
+
+    def __len__(self):
+        return len(self.scene_ids)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getstate__(self):
+        # zip indexes are cached per process, cuboids are reread by workers
+        state = dict(self.__dict__)
+        state["_cuboids"] = {}
+        return state
+
+    @property
+    def ride_ids(self) -> List[RideID]:
+        rides = []
+        for scene_id in self.scene_ids:
+            if not rides or rides[-1] != scene_id.ride_id:
+                rides.append(scene_id.ride_id)
+        return rides
+
+    def position(self, key: Union[int, SceneID, str]) -> int:
+        if isinstance(key, (int, np.integer)):
+            if not -len(self) <= key < len(self):
+                raise IndexError("Scene index %d out of range" % key)
+            return int(key) % len(self)
+        if str(key) not in self._positions:
+            raise KeyError("Unknown scene %s" % key)
+        return self._positions[str(key)]
+
+    def calib(self, date: str):
+        if date not in self._calibs:
+            self._calibs[date] = read_archive_calib(os.path.join(self.path, date))
+        return self._calibs[date]
+
+    def ride_cuboids(self, ride_id: RideID) -> list:
+        """Parsed 3d_ann.json of the ride, the least recently used ride is dropped
+        once more than CUBOID_CACHE_RIDES rides are kept"""
+        key = str(ride_id)
+        if key in self._cuboids:
+            # reinsert to mark the ride as the most recently used one
+            self._cuboids[key] = self._cuboids.pop(key)
+            return self._cuboids[key]
+        with open(os.path.join(self.path, ride_id.date, ride_id.ride_id, ANN_FILE)) as fr:
+            self._cuboids[key] = json.load(fr)
+        while len(self._cuboids) > CUBOID_CACHE_RIDES:
+            del self._cuboids[next(iter(self._cuboids))]
+        return self._cuboids[key]
+
+    def __getitem__(self, key: Union[int, SceneID, str]) -> Scene:
+        position = self.position(key)
+        scene_id = self.scene_ids[position]
+        ride_id = scene_id.ride_id
+        archive_path = os.path.join(self.path, ride_id.date, ride_id.ride_id, LABEL_FILE)
+        index = zip_index(archive_path)
+        cam2calib, cam2extrinsics = self.calib(ride_id.date)
+        return CadcDataset.build_scene(
+            scene_id,
+            cam2calib,
+            [
+                ZipMemberSource(archive_path, "labeled/%s/data/%s.png" % (camera_dir(camera_idx), scene_id.scene_id))
+                for camera_idx in range(CadcDataset.NUMBER_OF_CAMERAS)
+            ],
+            read_lidar_member(index, "labeled/lidar_points/data/%s.bin" % scene_id.scene_id, self.mmap_lidar),
+            self.ride_cuboids(ride_id)[self._frames[position]]['cuboids'],
+            self.cameras,
+            self.mmap_lidar,
+            cam2extrinsics
+        )
+
+
+def lazy_create_from_archives(path, grep: Callable = None, cameras: Iterable[int] = None,
+                              mmap_lidar: bool = False):
+    """Archive counterpart of CadcDataset.lazy_create_from_path"""
+    dataset = ArchiveCadcDataset(path, cameras, mmap_lidar)
+    for idx, scene_id in enumerate(dataset.scene_ids):
+        if grep and not grep(scene_id):
+            continue
+        yield dataset[idx]
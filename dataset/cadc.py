@@ -3,17 +3,25 @@ import yaml
 import json
 
 import numpy as np
-from PIL import Image as PILImage
-
-from typing import List, Callable
-from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, Union, Callable, Iterable
+from dataclasses import dataclass, field
 
+from geometry.transformations import invert_transforms
+from .filters import snow_mask
+from .profiling import profile_stage
+from .range_image import RangeImage, RangeImageConfig, CADC_RANGE_IMAGE, range_image
 from .structures import (
     Scene, SceneID, RideID, Camera, Image,
     LidarCloud, BBox, Transform, GT3D
 )
 
 
+CADC_LABELS = [
+    "Car", "Truck", "Bus", "Bicycle", "Horse_and_Buggy", "Pedestrian",
+    "Pedestrian_With_Object", "Animal", "Garbage_Containers_on_Wheels", "Traffic_Guidance_Objects"
+]
+
+
 @dataclass
 class CadcBBox(BBox):
     @staticmethod
@@ -32,31 +40,356 @@ class CadcBBox(BBox):
             cuboid['stationary']
         )
 
+    @staticmethod
+    def from_cuboids(cuboids) -> GT3D:
+        data = np.array([
+            (cuboid['position']['x'], cuboid['position']['y'], cuboid['position']['z'],
+             cuboid['dimensions']['x'], cuboid['dimensions']['y'], cuboid['dimensions']['z'],
+             cuboid['yaw'])
+            for cuboid in cuboids
+        ], dtype=np.float64).reshape(-1, 7)
+        return GT3D.from_arrays(
+            data,
+            [cuboid['label'] for cuboid in cuboids],
+            np.array([cuboid['stationary'] for cuboid in cuboids], dtype=bool),
+            CADC_LABELS
+        )
+
 
 @dataclass
 class CadcLidarCloud(LidarCloud):
+    NUMBER_OF_CHANNELS = 4
 
     @property
     def intensity(self):
         return self.points[:, 3]
 
+    def remove_snow(self, intensity_threshold: float = None, **kwargs) -> Tuple["CadcLidarCloud", np.array]:
+        """
+        :param intensity_threshold: only returns weaker than this can be removed, density alone by default
+        :param kwargs: other filters.snow_mask options
+        :return: cloud without snow returns and the mask of removed points
+        """
+        removed = snow_mask(self.points, self.intensity, intensity_threshold, **kwargs)
+        return type(self)(self.points[~removed]), removed
+
+    def to_range_image(self, config: RangeImageConfig = CADC_RANGE_IMAGE) -> RangeImage:
+        """Range image of the sweep in the VLP-32C beam layout by default, see range_image.RangeImage"""
+        return range_image(self, config)
+
+    @staticmethod
+    def from_binary(file_name: str, mmap: bool = False,
+                    rows: Tuple[int, int] = None, columns: Union[slice, List[int]] = None):
+        """
+        :param file_name: path to .bin sweep with float32 (x, y, z, intensity) points
+        :param mmap: map the file read-only instead of reading it to a private buffer,
+            workers reading the same sweep share the page cache
+        :param rows: (start, stop) range of points to load, whole cloud by default
+        :param columns: columns to keep, slice(0, 3) keeps xyz. Slices of a mapped cloud
+            are views, intensity is only meaningful when column 3 is kept at its place
+        :return: CadcLidarCloud
+        """
+        row_size = CadcLidarCloud.NUMBER_OF_CHANNELS * np.dtype(np.float32).itemsize
+        n_points = os.path.getsize(file_name) // row_size
+        start, stop = (0, n_points) if rows is None else slice(*rows).indices(n_points)[:2]
+        count = max(stop - start, 0)
+        with profile_stage("lidar_read", 0 if mmap else count * row_size):
+            if count == 0:
+                points = np.empty((0, CadcLidarCloud.NUMBER_OF_CHANNELS), dtype=np.float32)
+            elif mmap:
+                points = np.memmap(file_name, dtype=np.float32, mode="r", offset=start * row_size,
+                                   shape=(count, CadcLidarCloud.NUMBER_OF_CHANNELS))
+            else:
+                points = np.fromfile(
+                    file_name, dtype=np.float32,
+                    count=count * CadcLidarCloud.NUMBER_OF_CHANNELS, offset=start * row_size
+                ).reshape(-1, CadcLidarCloud.NUMBER_OF_CHANNELS)
+        if columns is not None:
+            points = points[:, columns]
+        return CadcLidarCloud(points)
+
     @staticmethod
-    def from_binary(file_name: str):
-        return CadcLidarCloud(np.fromfile(file_name, dtype=np.float32).reshape(-1, 4))
+    def from_buffer(buffer) -> "CadcLidarCloud":
+        """Cloud over the bytes of a .bin sweep, without a copy"""
+        return CadcLidarCloud(
+            np.frombuffer(buffer, dtype=np.float32).reshape(-1, CadcLidarCloud.NUMBER_OF_CHANNELS)
+        )
+
+
+def read_yaml(source: Union[str, bytes]):
+    """Parses a yaml file by path or its raw content"""
+    if isinstance(source, bytes):
+        return yaml.load(source, yaml.SafeLoader)
+    with open(source) as fr:
+        return yaml.load(fr, yaml.SafeLoader)
+
+
+def _yaml_matrix(data, key: str, default: np.array) -> np.array:
+    if key not in data:
+        return default
+    return np.array(data[key]['data'], dtype=np.float64).reshape(data[key]['rows'], data[key]['cols'])
+
+
+@dataclass
+class CadcCalibration:
+    """Full camera calibration of a calib yaml
+    image_size: (width, height) of raw images
+    camera_matrix: (3, 3) raw camera matrix
+    distortion: distortion coefficients, (k1, k2, p1, p2, k3) for plumb_bob
+    rectification: (3, 3) rotation from the camera frame to the rectified frame
+    projection: (3, 4) projection matrix of the rectified camera"""
+    camera_name: str
+    image_size: Tuple[int, int]
+    camera_matrix: np.array
+    distortion_model: str
+    distortion: np.array
+    rectification: np.array
+    projection: np.array
+
+    @staticmethod
+    def from_yaml(path) -> "CadcCalibration":
+        """
+        :param path: path to calib xx.yaml or its content, missing distortion,
+            rectification and projection default to an ideal pinhole camera
+        """
+        data = read_yaml(path)
+        camera_matrix = _yaml_matrix(data, 'camera_matrix', None)
+        return CadcCalibration(
+            data['camera_name'],
+            (int(data['image_width']), int(data['image_height'])),
+            camera_matrix,
+            data.get('distortion_model', "plumb_bob"),
+            _yaml_matrix(data, 'distortion_coefficients', np.zeros((1, 5))).reshape(-1),
+            _yaml_matrix(data, 'rectification_matrix', np.eye(3)),
+            _yaml_matrix(data, 'projection_matrix', np.hstack([camera_matrix, np.zeros((3, 1))]))
+        )
+
+    @property
+    def intrinsics(self) -> Transform:
+        return Transform(self.camera_name + "_intrinsics", self.camera_matrix.astype(np.float32))
 
 
 @dataclass
 class CadcIntrinsics(Transform):
     @staticmethod
     def from_yaml(path):
+        return CadcCalibration.from_yaml(path).intrinsics
+
+
+INDEX_FILE_NAME = ".cadc_index.json"
+INDEX_VERSION = 2
+
+
+def camera_dir(camera_idx: int) -> str:
+    return "image_" + str(camera_idx).rjust(2, "0")
+
+
+def list_dir(path: str) -> List[str]:
+    with profile_stage("listdir"):
+        return sorted(os.listdir(path))
+
+
+def list_rides(date_path: str) -> List[str]:
+    return list(filter(lambda dir_name: dir_name != "calib",
+                       list_dir(date_path)))
+
+
+def list_scene_ids(ride_path: str) -> List[str]:
+    return list(map(
+        lambda file_name: file_name.rstrip(".bin"),
+        list_dir(os.path.join(ride_path, "labeled", "lidar_points", "data"))
+    ))
+
+
+def annotation_offsets(path: str) -> List[Tuple[int, int]]:
+    """
+    :param path: path to 3d_ann.json with list of per frame annotations
+    :return: list of (byte offset, byte length) of every frame object in the file
+    """
+    with open(path, "rb") as fr:
+        text = fr.read().decode("utf-8")
+
+    def skip(pos):
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        return pos
+
+    decoder = json.JSONDecoder()
+    offsets = []
+    pos = skip(text.index("[") + 1)
+    byte_pos = len(text[:pos].encode("utf-8"))
+    while pos < len(text) and text[pos] != "]":
+        _, end = decoder.raw_decode(text, pos)
+        length = len(text[pos:end].encode("utf-8"))
+        offsets.append((byte_pos, length))
+        next_pos = skip(end)
+        byte_pos += length + len(text[end:next_pos].encode("utf-8"))
+        pos = next_pos
+    return offsets
+
+
+def path_stamp(path: str) -> List[int]:
+    """[size, mtime] of a file or directory, None when it is missing"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def tree_stamps(path) -> Dict[str, List[int]]:
+    """Stamps of every ride 3d_ann.json and lidar data directory by path relative to the root.
+    Adding or removing a ride changes the keys, rewriting annotations or adding sweeps changes stamps"""
+    stamps = {}
+    for date in list_dir(path):
+        date_path = os.path.join(path, date)
+        if not os.path.isdir(date_path):
+            continue
+        for ride in list_rides(date_path):
+            for name in [os.path.join(date, ride, "3d_ann.json"),
+                         os.path.join(date, ride, "labeled", "lidar_points", "data")]:
+                stamps[name] = path_stamp(os.path.join(path, name))
+    return stamps
+
+
+@dataclass
+class SceneEntry:
+    scene_id: SceneID
+    lidar_path: str
+    image_paths: List[str]
+    annotation_path: str
+    annotation_offset: int
+    annotation_length: int
+
+
+@dataclass
+class CadcIndex:
+    """Persistent scene index of a CADC dataset root, paths are relative to the root.
+    stamps record the tree the index was built from, see is_valid"""
+    rides: List[RideID]
+    scenes: List[SceneEntry]
+    stamps: Dict[str, List[int]] = field(default_factory=dict)
+
+    @staticmethod
+    def build(path) -> "CadcIndex":
+        # taken first, a tree changed while indexing makes the index stale rather than silently wrong
+        stamps = tree_stamps(path)
+        rides = []
+        scenes = []
+        for date in list_dir(path):
+            date_path = os.path.join(path, date)
+            if not os.path.isdir(date_path):
+                continue
+            for ride in list_rides(date_path):
+                ride_id = RideID(date, ride)
+                rides.append(ride_id)
+                annotation_path = os.path.join(date, ride, "3d_ann.json")
+                offsets = annotation_offsets(os.path.join(path, annotation_path))
+                labeled_path = os.path.join(date, ride, "labeled")
+                for scene_idx, scene_id in enumerate(list_scene_ids(os.path.join(date_path, ride))):
+                    offset, length = offsets[scene_idx]
+                    scenes.append(SceneEntry(
+                        SceneID(ride_id, scene_id),
+                        os.path.join(labeled_path, "lidar_points", "data", scene_id + ".bin"),
+                        [
+                            os.path.join(labeled_path, camera_dir(camera_idx), "data", scene_id + ".png")
+                            for camera_idx in range(CadcDataset.NUMBER_OF_CAMERAS)
+                        ],
+                        annotation_path,
+                        offset,
+                        length
+                    ))
+        return CadcIndex(rides, scenes, stamps)
+
+    def is_valid(self, path) -> bool:
+        """False when rides were added or removed, or annotations or sweeps changed since the index was built"""
+        return tree_stamps(path) == self.stamps
+
+    def save(self, path):
+        data = {
+            "version": INDEX_VERSION,
+            "rides": [[ride.date, ride.ride_id] for ride in self.rides],
+            "scenes": [
+                [entry.scene_id.ride_id.date, entry.scene_id.ride_id.ride_id, entry.scene_id.scene_id,
+                 entry.lidar_path, entry.image_paths, entry.annotation_path,
+                 entry.annotation_offset, entry.annotation_length]
+                for entry in self.scenes
+            ],
+            "stamps": self.stamps
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as fw:
+            json.dump(data, fw)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path) -> "CadcIndex":
         with open(path) as fr:
-            data = yaml.load(fr, yaml.SafeLoader)
-        camera_name = data['camera_name']
-        return Transform(
-            camera_name + "_intrinsics",
-            np.array(data['camera_matrix']['data'], dtype=np.float32).reshape(3, 3)
+            data = json.load(fr)
+        if data["version"] != INDEX_VERSION:
+            raise ValueError("Unsupported CADC index version %s in %s" % (data["version"], path))
+        return CadcIndex(
+            [RideID(date, ride) for date, ride in data["rides"]],
+            [
+                SceneEntry(SceneID(RideID(date, ride), scene), lidar, images, annotation, offset, length)
+                for date, ride, scene, lidar, images, annotation, offset, length in data["scenes"]
+            ],
+            data["stamps"]
         )
 
+    @staticmethod
+    def index_path(path) -> str:
+        return os.path.join(path, INDEX_FILE_NAME)
+
+    @staticmethod
+    def exists(path) -> bool:
+        return os.path.isfile(CadcIndex.index_path(path))
+
+    @staticmethod
+    def load_valid(path) -> Optional["CadcIndex"]:
+        """Saved index of the root if it exists and matches the tree, None otherwise"""
+        index_path = CadcIndex.index_path(path)
+        if not os.path.isfile(index_path):
+            return None
+        try:
+            index = CadcIndex.load(index_path)
+        except (ValueError, KeyError):
+            return None
+        return index if index.is_valid(path) else None
+
+    @staticmethod
+    def load_or_build(path, rebuild: bool = False) -> "CadcIndex":
+        """Saved index, rebuilt when it is missing, of another version or stale"""
+        index_path = CadcIndex.index_path(path)
+        index = None if rebuild else CadcIndex.load_valid(path)
+        if index is not None:
+            return index
+        index = CadcIndex.build(path)
+        index.save(index_path)
+        return index
+
+
+@dataclass
+class CadcExtrinsics(Transform):
+    @staticmethod
+    def from_yaml(path, camera_names: Dict[int, str]) -> Dict[int, Transform]:
+        """
+        :param path: path to calib extrinsics.yaml with camera to lidar T_LIDAR_CAMxx transforms,
+            or its content
+        :param camera_names: camera names by camera index
+        :return: lidar to camera transforms by camera index
+        """
+        data = read_yaml(path)
+        cam2extrinsics = {}
+        for camera_idx, camera_name in camera_names.items():
+            key = "T_LIDAR_CAM" + str(camera_idx).rjust(2, "0")
+            if key in data:
+                cam2extrinsics[camera_idx] = Transform(
+                    camera_name + "_extrinsics",
+                    invert_transforms(np.array(data[key], dtype=np.float64)).astype(np.float32)
+                )
+        return cam2extrinsics
+
 
 @dataclass
 class CadcDataset:
@@ -64,107 +397,242 @@ class CadcDataset:
     scenes: List[Scene]
 
     @staticmethod
-    def create_from_path(path, grep: Callable = None):
+    def create_from_path(path, grep: Callable = None, cameras: Iterable[int] = None,
+                         mmap_lidar: bool = False):
 
-        scenes = [scene for scene in CadcDataset.lazy_create_from_path(path, grep)]
+        scenes = [scene for scene in CadcDataset.lazy_create_from_path(path, grep, cameras, mmap_lidar)]
         return scenes
 
     @staticmethod
-    def lazy_create_from_path(path, grep: Callable = None):
-
-        dates = os.listdir(path)
-        for date in dates:
-            date_path = os.path.join(path, date)
-
-            calib_path = os.path.join(date_path, "calib")
-            cam2calib = {}
+    def read_calib(calib_path) -> Dict[int, Transform]:
+        cam2calib = {}
+        with profile_stage("calib_read"):
             for camera_idx in range(CadcDataset.NUMBER_OF_CAMERAS):
                 cam2calib[camera_idx] = CadcIntrinsics.from_yaml(
                     os.path.join(calib_path, str(camera_idx).rjust(2, '0') + ".yaml")
                 )
+        return cam2calib
+
+    @staticmethod
+    def read_calibrations(calib_path) -> Dict[int, CadcCalibration]:
+        """Full calibration of all cameras including distortion, see CadcCalibration"""
+        with profile_stage("calib_read"):
+            return {
+                camera_idx: CadcCalibration.from_yaml(
+                    os.path.join(calib_path, str(camera_idx).rjust(2, '0') + ".yaml")
+                )
+                for camera_idx in range(CadcDataset.NUMBER_OF_CAMERAS)
+            }
+
+    @staticmethod
+    def read_extrinsics(calib_path, cam2calib: Dict[int, Transform]) -> Dict[int, Transform]:
+        extrinsics_path = os.path.join(calib_path, "extrinsics.yaml")
+        if not os.path.isfile(extrinsics_path):
+            return {}
+        with profile_stage("calib_read"):
+            return CadcExtrinsics.from_yaml(
+                extrinsics_path,
+                {camera_idx: calib.name.rstrip("_intrinsics") for camera_idx, calib in cam2calib.items()}
+            )
+
+    @staticmethod
+    def build_scene(scene_id: SceneID, cam2calib: Dict[int, Transform],
+                    image_paths: List[Union[str, Callable[[], bytes]]],
+                    lidar_path: Union[str, LidarCloud], cuboids,
+                    cameras: Iterable[int] = None, mmap_lidar: bool = False,
+                    cam2extrinsics: Dict[int, Transform] = None) -> Scene:
+        """
+        :param image_paths: image sources by camera index, paths or callables returning encoded images
+        :param lidar_path: path to .bin sweep or an already read cloud
+        :param cameras: indexes of cameras to put in the scene, all cameras by default.
+            Images are not opened until their pixels or size are requested
+        :param mmap_lidar: memory-map lidar sweeps instead of reading them
+        :param cam2extrinsics: lidar to camera transforms, put in camera transformations
+        """
+        if cameras is None:
+            cameras = range(CadcDataset.NUMBER_OF_CAMERAS)
+        scene_cameras = []
+        for camera_idx in cameras:
+            calib = cam2calib[camera_idx]
+            cam_name = calib.name.rstrip("_intrinsics")
+            scene_cameras.append(Camera(
+                cam_name,
+                calib,
+                [cam2extrinsics[camera_idx]] if cam2extrinsics and camera_idx in cam2extrinsics else [],
+                Image(image_paths[camera_idx])
+            ))
 
-            # TODO: read extrinsics # noqa
+        return Scene(
+            scene_id,
+            scene_cameras,
+            lidar_path if isinstance(lidar_path, LidarCloud) else
+            CadcLidarCloud.from_binary(lidar_path, mmap=mmap_lidar),
+            CadcBBox.from_cuboids(cuboids)
+        )
+
+    @staticmethod
+    def lazy_create_from_path(path, grep: Callable = None, cameras: Iterable[int] = None,
+                              mmap_lidar: bool = False):
+
+        dates = list_dir(path)
+        for date in dates:
+            date_path = os.path.join(path, date)
+            if not os.path.isdir(date_path):
+                continue
+
+            cam2calib = CadcDataset.read_calib(os.path.join(date_path, "calib"))
+            cam2extrinsics = CadcDataset.read_extrinsics(os.path.join(date_path, "calib"), cam2calib)
 
-            rides = list(filter(lambda dir_name: dir_name != "calib",
-                                os.listdir(date_path)))
-            for ride in rides:
+            for ride in list_rides(date_path):
                 ride_path = os.path.join(date_path, ride)
                 ride_id = RideID(date, ride)
 
                 cuboids_path = os.path.join(ride_path, "3d_ann.json")
-                with open(cuboids_path) as fr:
+                with open(cuboids_path) as fr, profile_stage("json_parse", os.path.getsize(cuboids_path)):
                     cuboids = json.load(fr)
 
                 lidar_path = os.path.join(ride_path, "labeled", "lidar_points")
                 image_base_path = os.path.join(ride_path, "labeled", "image_{}")
 
-                scene_ids = list(map(
-                    lambda file_name: file_name.rstrip(".bin"),
-                    os.listdir(os.path.join(lidar_path, "data"))
-                ))
-
-                for scene_idx, scene_id in enumerate(scene_ids):
+                for scene_idx, scene_id in enumerate(list_scene_ids(ride_path)):
                     if grep and not grep(SceneID(ride_id, scene_id)):
                         continue
-                    cameras = []
-                    for camera_idx in range(CadcDataset.NUMBER_OF_CAMERAS):
-                        image_path = os.path.join(
+                    image_paths = [
+                        os.path.join(
                             image_base_path.format(str(camera_idx).rjust(2, "0")),
                             "data",
                             scene_id + ".png"
                         )
-                        calib = cam2calib[camera_idx]
-                        cam_name = calib.name.rstrip("_intrinsics")
-                        cameras.append(Camera(
-                            cam_name,
-                            calib,
-                            [],
-                            Image(PILImage.open(image_path))
-                        ))
-
-                    cubs = cuboids[scene_idx]['cuboids']
-                    bboxes = []
-                    for cuboid in cubs:
-                        bboxes.append(CadcBBox.from_cuboid(cuboid))
-
-                    yield Scene(
+                        for camera_idx in range(CadcDataset.NUMBER_OF_CAMERAS)
+                    ]
+                    yield CadcDataset.build_scene(
                         SceneID(ride_id, scene_id),
+                        cam2calib,
+                        image_paths,
+                        os.path.join(lidar_path, "data", scene_id + ".bin"),
+                        cuboids[scene_idx]['cuboids'],
                         cameras,
-                        CadcLidarCloud.from_binary(
-                            os.path.join(lidar_path, "data", scene_id + ".bin")
-                        ),
-                        GT3D(bboxes)
+                        mmap_lidar,
+                        cam2extrinsics
                     )
 
     @staticmethod
-    def get_rides_info_list(path) -> List[RideID]:
+    def get_rides_info_list(path, use_index: bool = False) -> List[RideID]:
+        """
+        :param use_index: take rides from the saved index when it matches the tree
+        """
+        index = CadcIndex.load_valid(path) if use_index else None
+        if index is not None:
+            return list(index.rides)
         rides_info_list = []
-        dates = os.listdir(path)
+        dates = list_dir(path)
         for date in dates:
             date_path = os.path.join(path, date)
-            rides = list(filter(lambda dir_name: dir_name != "calib",
-                                os.listdir(date_path)))
-            for ride in rides:
+            if not os.path.isdir(date_path):
+                continue
+            for ride in list_rides(date_path):
                 ride_id = RideID(date, ride)
                 rides_info_list.append(ride_id)
         return rides_info_list
 
     @staticmethod
-    def get_scenes_info_list(path) -> List[SceneID]:
+    def get_scenes_info_list(path, use_index: bool = False) -> List[SceneID]:
+        """
+        :param use_index: take scenes from the saved index when it matches the tree
+        """
+        index = CadcIndex.load_valid(path) if use_index else None
+        if index is not None:
+            return [entry.scene_id for entry in index.scenes]
         scenes_info_list = []
-        dates = os.listdir(path)
+        dates = list_dir(path)
         for date in dates:
             date_path = os.path.join(path, date)
-            rides = list(filter(lambda dir_name: dir_name != "calib",
-                                os.listdir(date_path)))
-            for ride in rides:
+            if not os.path.isdir(date_path):
+                continue
+            for ride in list_rides(date_path):
                 ride_path = os.path.join(date_path, ride)
                 ride_id = RideID(date, ride)
-                lidar_path = os.path.join(ride_path, "labeled", "lidar_points")
-                scene_ids = list(map(
-                    lambda file_name: file_name.rstrip(".bin"),
-                    os.listdir(os.path.join(lidar_path, "data"))
-                ))
-                for scene_id in scene_ids:
+                for scene_id in list_scene_ids(ride_path):
                     scenes_info_list.append(SceneID(ride_id, scene_id))
         return scenes_info_list
+
+
+@dataclass
+class IndexedCadcDataset:
+    """Random access view over a CADC root backed by a CadcIndex,
+    scenes are accessible by position, SceneID or its string form"""
+    path: str
+    index: CadcIndex = None
+    rebuild_index: bool = False
+    cameras: List[int] = None
+    mmap_lidar: bool = False
+    _positions: Dict[str, int] = field(default=None, init=False, repr=False)
+    _calibs: Dict[str, Dict[int, Transform]] = field(default_factory=dict, init=False, repr=False)
+    _extrinsics: Dict[str, Dict[int, Transform]] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self):
+        if self.index is None:
+            self.index = CadcIndex.load_or_build(self.path, self.rebuild_index)
+        self._positions = {str(entry.scene_id): idx for idx, entry in enumerate(self.index.scenes)}
+
+    def __len__(self):
+        return len(self.index.scenes)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getitem__(self, key: Union[int, SceneID, str]) -> Scene:
+        return self.load_scene(self.entry(key))
+
+    @property
+    def scene_ids(self) -> List[SceneID]:
+        return [entry.scene_id for entry in self.index.scenes]
+
+    @property
+    def ride_ids(self) -> List[RideID]:
+        return list(self.index.rides)
+
+    def position(self, key: Union[int, SceneID, str]) -> int:
+        if isinstance(key, (int, np.integer)):
+            if not -len(self) <= key < len(self):
+                raise IndexError("Scene index %d out of range" % key)
+            return int(key) % len(self)
+        if str(key) not in self._positions:
+            raise KeyError("Unknown scene %s" % key)
+        return self._positions[str(key)]
+
+    def entry(self, key: Union[int, SceneID, str]) -> SceneEntry:
+        return self.index.scenes[self.position(key)]
+
+    def calib(self, date: str) -> Dict[int, Transform]:
+        if date not in self._calibs:
+            self._calibs[date] = CadcDataset.read_calib(os.path.join(self.path, date, "calib"))
+        return self._calibs[date]
+
+    def extrinsics(self, date: str) -> Dict[int, Transform]:
+        if date not in self._extrinsics:
+            self._extrinsics[date] = CadcDataset.read_extrinsics(
+                os.path.join(self.path, date, "calib"), self.calib(date)
+            )
+        return self._extrinsics[date]
+
+    def read_cuboids(self, entry: SceneEntry):
+        with open(os.path.join(self.path, entry.annotation_path), "rb") as fr:
+            fr.seek(entry.annotation_offset)
+            data = fr.read(entry.annotation_length)
+        with profile_stage("json_parse", len(data)):
+            frame = json.loads(data)
+        return frame['cuboids']
+
+    def load_scene(self, entry: SceneEntry) -> Scene:
+        return CadcDataset.build_scene(
+            entry.scene_id,
+            self.calib(entry.scene_id.ride_id.date),
+            [os.path.join(self.path, image_path) for image_path in entry.image_paths],
+            os.path.join(self.path, entry.lidar_path),
+            self.read_cuboids(entry),
+            self.cameras,
+            self.mmap_lidar,
+            self.extrinsics(entry.scene_id.ride_id.date)
+        )
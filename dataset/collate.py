@@ -0,0 +1,259 @@
+import os
+
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+from typing import Any, Dict, Iterator, List, Tuple
+from dataclasses import dataclass, field
+
+from .structures import Scene, GT3D
+from .cadc import CADC_LABELS
+from . import prefetch as _prefetch
+from .prefetch import PrefetchLoader, load_scene
+
+
+ALIGNMENT = 64
+
+
+@dataclass
+class Batch:
+    """Scenes packed into arrays
+    points: (n, c) float32 points of all scenes, scene i owns points[point_offsets[i]:point_offsets[i + 1]]
+    batch_index: (n,) int32 scene of every point
+    boxes: (b, m, 7) float32 boxes padded to the largest box count, box_mask marks real boxes
+    box_labels: (b, m) int32 codes into label_names, -1 for padding
+    intrinsics: (b, k, 3, 3), extrinsics: (b, k, 4, 4) float32 per camera, zeros where missing
+    images: (b, k, h, w, 3) uint8 when images are collated"""
+    scene_ids: List[str]
+    label_names: List[str]
+    points: np.array
+    point_offsets: np.array
+    batch_index: np.array
+    boxes: np.array
+    box_labels: np.array
+    box_mask: np.array
+    stationary: np.array
+    intrinsics: np.array
+    extrinsics: np.array
+    images: np.array = None
+    _shm: shared_memory.SharedMemory = field(default=None, repr=False, compare=False)
+    _offsets: Dict[str, int] = field(default=None, repr=False, compare=False)
+
+    @property
+    def batch_size(self) -> int:
+        return len(self.scene_ids)
+
+    def scene_points(self, idx: int) -> np.array:
+        return self.points[self.point_offsets[idx]:self.point_offsets[idx + 1]]
+
+    def gt3d(self, idx: int) -> GT3D:
+        mask = self.box_mask[idx]
+        return GT3D(self.boxes[idx][mask].astype(np.float64), self.box_labels[idx][mask],
+                    self.label_names, self.stationary[idx][mask])
+
+    def share(self) -> "SharedBatch":
+        """Handle of a batch collated into shared memory, cheap to pickle"""
+        assert self._shm is not None, "Batch is not in shared memory"
+        layout = {
+            name: (getattr(self, name).shape, getattr(self, name).dtype.str, offset)
+            for name, offset in self._offsets.items()
+        }
+        return SharedBatch(self._shm.name, layout, self.scene_ids, self.label_names)
+
+    def close(self):
+        """Drop arrays and unmap shared memory, the batch is unusable afterwards"""
+        if self._shm is None:
+            return
+        for name in BATCH_ARRAYS:
+            setattr(self, name, None)
+        try:
+            self._shm.close()
+        except BufferError:
+            # arrays of the batch are still referenced, the mapping goes away with them
+            pass
+        self._shm = None
+
+
+BATCH_ARRAYS = (
+    "points", "point_offsets", "batch_index", "boxes", "box_labels", "box_mask",
+    "stationary", "intrinsics", "extrinsics", "images"
+)
+
+
+@dataclass
+class SharedBatch:
+    """Shared memory block name and array layout of a Batch,
+    the receiving side opens it once and takes ownership of the block"""
+    name: str
+    layout: Dict[str, Tuple[Tuple[int, ...], str, int]]
+    scene_ids: List[str]
+    label_names: List[str]
+
+    def open(self) -> Batch:
+        """Maps the block and takes it over from the producer, see _hand_over_shared_memory.
+        The block is unlinked right away, which also drops any tracker registration of this process,
+        the mapping stays valid and the memory is freed once the batch is closed"""
+        shm = shared_memory.SharedMemory(self.name)
+        shm.unlink()
+        arrays = {
+            name: np.ndarray(shape, np.dtype(dtype), buffer=shm.buf, offset=offset)
+            for name, (shape, dtype, offset) in self.layout.items()
+        }
+        offsets = {name: offset for name, (_, _, offset) in self.layout.items()}
+        return Batch(self.scene_ids, self.label_names, _shm=shm, _offsets=offsets, **arrays)
+
+    def release(self):
+        """Free the block without reading it"""
+        shm = shared_memory.SharedMemory(self.name)
+        shm.unlink()
+        shm.close()
+
+
+def _hand_over_shared_memory(shm: shared_memory.SharedMemory):
+    """Passes ownership of a created block to the process that opens its SharedBatch.
+    The creating process registers the block with its resource tracker, which unlinks registered
+    blocks when the process exits and warns about a leak. The consumer unlinks the block itself once
+    it has mapped it, so the creator has to forget it here, otherwise a short-lived producer could
+    free a batch that has not been opened yet. Windows frees blocks with their last handle
+    and has no tracker for them"""
+    if os.name == "posix":
+        # the tracker knows POSIX blocks by their name with the leading slash
+        resource_tracker.unregister("/" + shm.name, "shared_memory")
+
+
+def _batch_layout(scenes: List[Scene], images: bool) -> Dict[str, Tuple[Tuple[int, ...], np.dtype]]:
+    n_points = sum(len(scene.lidar_cloud.points) for scene in scenes)
+    channels = scenes[0].lidar_cloud.points.shape[1]
+    n_boxes = max(len(scene.gt3d) for scene in scenes)
+    n_cameras = max(len(scene.cameras) for scene in scenes)
+    b = len(scenes)
+    layout = {
+        "points": ((n_points, channels), np.dtype(np.float32)),
+        "point_offsets": ((b + 1,), np.dtype(np.int64)),
+        "batch_index": ((n_points,), np.dtype(np.int32)),
+        "boxes": ((b, n_boxes, 7), np.dtype(np.float32)),
+        "box_labels": ((b, n_boxes), np.dtype(np.int32)),
+        "box_mask": ((b, n_boxes), np.dtype(bool)),
+        "stationary": ((b, n_boxes), np.dtype(bool)),
+        "intrinsics": ((b, n_cameras, 3, 3), np.dtype(np.float32)),
+        "extrinsics": ((b, n_cameras, 4, 4), np.dtype(np.float32)),
+    }
+    if images and n_cameras:
+        height, width = scenes[0].cameras[0].image.height, scenes[0].cameras[0].image.width
+        layout["images"] = ((b, n_cameras, height, width, 3), np.dtype(np.uint8))
+    return layout
+
+
+def _allocate(layout, shared: bool):
+    if not shared:
+        return {name: np.empty(shape, dtype) for name, (shape, dtype) in layout.items()}, None, None
+    offsets, size = {}, 0
+    for name, (shape, dtype) in layout.items():
+        offsets[name] = size
+        size += -(-int(np.prod(shape)) * dtype.itemsize // ALIGNMENT) * ALIGNMENT
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    arrays = {
+        name: np.ndarray(shape, dtype, buffer=shm.buf, offset=offsets[name])
+        for name, (shape, dtype) in layout.items()
+    }
+    return arrays, shm, offsets
+
+
+def collate(scenes: List[Scene], label_names: List[str] = None, images: bool = False,
+            shared: bool = False) -> Batch:
+    """
+    :param scenes: scenes with the same number of point channels
+    :param label_names: box label vocabulary, CADC_LABELS by default, unknown labels are appended
+    :param images: stack camera images, all of them must have the same size
+    :param shared: collate into a single shared memory block, see Batch.share
+    """
+    assert scenes, "Nothing to collate"
+    layout = _batch_layout(scenes, images)
+    arrays, shm, shm_offsets = _allocate(layout, shared)
+
+    counts = np.array([len(scene.lidar_cloud.points) for scene in scenes])
+    offsets = arrays["point_offsets"]
+    offsets[0] = 0
+    np.cumsum(counts, out=offsets[1:])
+    for idx, scene in enumerate(scenes):
+        arrays["points"][offsets[idx]:offsets[idx + 1]] = scene.lidar_cloud.points
+        arrays["batch_index"][offsets[idx]:offsets[idx + 1]] = idx
+
+    label_names = list(CADC_LABELS if label_names is None else label_names)
+    for name in ["boxes", "box_mask", "stationary", "intrinsics", "extrinsics"]:
+        arrays[name][...] = 0
+    arrays["box_labels"][...] = -1
+    for idx, scene in enumerate(scenes):
+        n_boxes = len(scene.gt3d)
+        gt = GT3D.from_arrays(scene.gt3d.data, scene.gt3d.label_strings, scene.gt3d.stationary, label_names)
+        label_names = gt.label_names
+        arrays["boxes"][idx, :n_boxes] = gt.data
+        arrays["box_labels"][idx, :n_boxes] = gt.labels
+        arrays["box_mask"][idx, :n_boxes] = True
+        arrays["stationary"][idx, :n_boxes] = gt.stationary
+        for camera_idx, camera in enumerate(scene.cameras):
+            arrays["intrinsics"][idx, camera_idx] = camera.intrinsics.data
+            if camera.extrinsics is not None:
+                arrays["extrinsics"][idx, camera_idx] = camera.extrinsics.data
+            if "images" in arrays:
+                arrays["images"][idx, camera_idx] = camera.image.to_numpy()[..., :3]
+
+    return Batch([str(scene.scene_id) for scene in scenes], label_names, _shm=shm, _offsets=shm_offsets, **arrays)
+
+
+def collate_shared(scenes: List[Scene], label_names: List[str] = None, images: bool = False) -> SharedBatch:
+    """Collates in a producer process and hands the block over to the consumer"""
+    batch = collate(scenes, label_names, images, shared=True)
+    handle = batch.share()
+    _hand_over_shared_memory(batch._shm)
+    batch.close()
+    return handle
+
+
+def load_batch(dataset, keys: List, load_images: bool = False, label_names: List[str] = None,
+               shared: bool = False):
+    scenes = [load_scene(dataset, key, load_images) for key in keys]
+    if shared:
+        return collate_shared(scenes, label_names, load_images)
+    return collate(scenes, label_names, load_images)
+
+
+def _load_batch_in_worker(keys: List, load_images: bool, label_names: List[str]) -> SharedBatch:
+    return load_batch(_prefetch._worker_dataset, keys, load_images, label_names, shared=True)
+
+
+@dataclass
+class BatchLoader(PrefetchLoader):
+    """PrefetchLoader yielding collated batches of batch_size scenes.
+    With use_processes batches are collated in workers and passed back through shared memory,
+    only their layout is pickled. load_images also stacks camera images into the batch"""
+    batch_size: int = 4
+    drop_last: bool = False
+    label_names: List[str] = None
+
+    def __len__(self):
+        n_scenes = super().__len__()
+        return n_scenes // self.batch_size if self.drop_last else -(-n_scenes // self.batch_size)
+
+    def _keys(self) -> Iterator[List]:
+        keys, batch = super()._keys(), []
+        for key in keys:
+            batch.append(key)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch and not self.drop_last:
+            yield batch
+
+    def _submit(self, executor, keys: List):
+        if self.use_processes:
+            return executor.submit(_load_batch_in_worker, keys, self.load_images, self.label_names)
+        return executor.submit(load_batch, self.dataset, keys, self.load_images, self.label_names)
+
+    def __iter__(self) -> Iterator[Batch]:
+        for result in super().__iter__():
+            yield result.open() if isinstance(result, SharedBatch) else result
+
+    def _discard(self, result: Any):
+        if isinstance(result, SharedBatch):
+            result.release()
@@ -1,19 +1,24 @@
+import os
 import yaml
 from yaml.loader import SafeLoader
-import wget
+import time
+import shutil
+import hashlib
 import zipfile
 import logging
 import argparse
+import urllib.error
+import urllib.request
 from os import remove
-from typing import Dict
-from os.path import join
+from typing import Dict, List, Optional
+from os.path import join, exists, getsize
 from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 
 def unzip(file_path: str, remove_: bool = False):
-    archive = zipfile.ZipFile(file_path)
-    archive.extractall(parent(file_path))
-    archive.close()
+    extract(file_path, parent(file_path))
     if remove_:
         remove(file_path)
 
@@ -28,50 +33,222 @@ def parent(path: str) -> Path:
 
 BASE_LINK = 'BASE_LINK'
 DATA = 'DATA'
+CHECKSUMS = 'CHECKSUMS'
 
 ANN_FILE = '3d_ann.json'
 CALIB_FILE = 'calib.zip'
 LABEL_FILE = 'labeled.zip'
 
+PART_SUFFIX = '.part'
+DONE_SUFFIX = '.done'
+CHUNK_SIZE = 1 << 20
 
-def download(base_dir: str, data: Dict):
 
-    mkdir(base_dir, exist_ok=True)
-    base_link = data[BASE_LINK]
-    cadc_dict = data[DATA]
-    base_path = join(base_dir, "cadc")
-    mkdir(base_path, True)
+class DownloadError(Exception):
+    pass
+
+
+def url_join(base: str, *parts: str) -> str:
+    return "/".join([base.rstrip("/")] + [part.strip("/") for part in parts])
+
+
+def sha256sum(file_path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fr:
+        for chunk in iter(lambda: fr.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def member_path(directory: Path, name: str) -> Path:
+    """Target of an archive member inside directory, sanitized like ZipFile.extract does:
+    drive letters, absolute paths, "." and ".." components are dropped"""
+    name = name.replace("\\", "/")
+    parts = [
+        part for part in os.path.splitdrive(name)[1].split("/")
+        if part not in ("", ".", "..")
+    ]
+    target = directory.joinpath(*parts).resolve()
+    root = directory.resolve()
+    if target != root and root not in target.parents:
+        raise DownloadError("Archive member %s escapes %s" % (name, directory))
+    return target
+
+
+def extract(file_path: str, directory, chunk_size: int = CHUNK_SIZE):
+    """Streams archive members to directory one by one,
+    members already extracted with the right size are skipped so an interrupted extraction resumes"""
+    directory = Path(directory)
+    with zipfile.ZipFile(file_path) as archive:
+        for info in archive.infolist():
+            target = member_path(directory, info.filename)
+            if info.is_dir():
+                mkdir(str(target), True)
+                continue
+            if target.exists() and target.stat().st_size == info.file_size:
+                continue
+            mkdir(str(target.parent), True)
+            part = str(target) + PART_SUFFIX
+            with archive.open(info) as src, open(part, "wb") as dst:
+                shutil.copyfileobj(src, dst, chunk_size)
+            os.replace(part, target)
+
+
+@dataclass
+class DownloadTask:
+    """One file of the dataset, archives are extracted next to the file and removed"""
+    url: str
+    path: str
+    extract: bool = False
+    sha256: Optional[str] = None
+
+    @property
+    def done_marker(self) -> str:
+        return self.path + DONE_SUFFIX
 
-    logging.info("Downloading CADC dataset in directory %s" % base_path)
-    for date in cadc_dict:
+    @property
+    def completed(self) -> bool:
+        if self.extract:
+            return exists(self.done_marker)
+        return exists(self.path) and (self.sha256 is None or sha256sum(self.path) == self.sha256)
 
-        date_path = join(base_path, date)
-        mkdir(date_path, True)
-        logging.info("Date %s" % date)
 
-        calib_url = join(base_link, date, CALIB_FILE)
-        calib_filename = wget.download(calib_url, join(date_path, CALIB_FILE))
-        unzip(calib_filename, True)
+def fetch(
+        url: str,
+        file_path: str,
+        sha256: str = None,
+        retries: int = 3,
+        timeout: float = 60.0,
+        chunk_size: int = CHUNK_SIZE
+) -> str:
+    """Downloads url into file_path through a .part file,
+    a partial file left by a failed attempt is resumed with a Range request.
+    Size is checked against Content-Length/Content-Range and content against sha256 if given
+    :return: file_path
+    """
+    part = file_path + PART_SUFFIX
+    for attempt in range(retries + 1):
+        try:
+            _fetch_part(url, part, timeout, chunk_size)
+            break
+        except (urllib.error.URLError, OSError, DownloadError) as e:
+            if attempt == retries:
+                raise DownloadError("Failed to download %s: %s" % (url, e)) from e
+            logging.warning("Retrying %s after error: %s" % (url, e))
+            time.sleep(min(2 ** attempt, 30))
 
-        for drive in cadc_dict[date]:
+    if sha256 is not None and sha256sum(part) != sha256:
+        remove(part)
+        raise DownloadError("Checksum mismatch for %s" % url)
+    os.replace(part, file_path)
+    return file_path
+
+
+def _fetch_part(url: str, part: str, timeout: float, chunk_size: int):
+    offset = getsize(part) if exists(part) else 0
+    request = urllib.request.Request(url)
+    if offset:
+        request.add_header("Range", "bytes=%d-" % offset)
+
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code != 416 or not offset:
+            raise
+        # range starts at or past the end, the part file is complete only when it has the total size
+        content_range = e.headers.get("Content-Range", "")
+        total = content_range.rsplit("/", 1)[1] if "/" in content_range else ""
+        if total.isdigit() and offset == int(total):
+            return
+        # stale or over-long part file, start over
+        remove(part)
+        return _fetch_part(url, part, timeout, chunk_size)
+
+    with response:
+        if response.status == 206:
+            total = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+            mode = "ab"
+        else:
+            # server ignored the range, start over
+            length = response.headers.get("Content-Length")
+            total = int(length) if length is not None else None
+            offset, mode = 0, "wb"
+
+        with open(part, mode) as fw:
+            shutil.copyfileobj(response, fw, chunk_size)
+
+    size = getsize(part)
+    if total is not None and size != total:
+        raise DownloadError("Incomplete download of %s: %d of %d bytes" % (url, size, total))
+
+
+def run_task(task: DownloadTask, retries: int = 3, timeout: float = 60.0) -> DownloadTask:
+    if task.completed:
+        logging.info("Skipping %s" % task.path)
+        return task
+    mkdir(str(parent(task.path)), True)
+    if not exists(task.path) or task.sha256 is not None and sha256sum(task.path) != task.sha256:
+        fetch(task.url, task.path, task.sha256, retries, timeout)
+    if task.extract:
+        extract(task.path, parent(task.path))
+        Path(task.done_marker).touch()
+        remove(task.path)
+    logging.info("Done %s" % task.path)
+    return task
+
+
+def plan_downloads(base_dir: str, data: Dict, base_link: str = None,
+                   extract_labeled: bool = True) -> List[DownloadTask]:
+    """
+    :param base_dir: directory, dataset goes to base_dir/cadc
+    :param data: dataset config as in resources/dataset_configs
+    :param base_link: overrides BASE_LINK of the config
+    :param extract_labeled: extract labeled.zip archives, keep them for ArchiveCadcDataset otherwise
+    """
+    base_link = base_link or data[BASE_LINK]
+    checksums = data.get(CHECKSUMS) or {}
+    base_path = join(base_dir, "cadc")
 
-            drive_path = join(date_path, drive)
-            mkdir(drive_path, True)
-            logging.info("Drive %s" % drive)
+    def task(*parts, extract_: bool = False):
+        relative = "/".join(parts)
+        return DownloadTask(url_join(base_link, relative), join(base_path, *parts), extract_, checksums.get(relative))
 
-            ann_3d_url = join(base_link, date, drive, ANN_FILE)
-            wget.download(ann_3d_url, join(drive_path, ANN_FILE))
+    tasks = []
+    for date, drives in data[DATA].items():
+        tasks.append(task(date, CALIB_FILE, extract_=True))
+        for drive in drives:
+            tasks.append(task(date, drive, ANN_FILE))
+            tasks.append(task(date, drive, LABEL_FILE, extract_=extract_labeled))
+    return tasks
 
-            data_url = join(base_link, date, drive, LABEL_FILE)
-            data_filename = wget.download(data_url, join(drive_path, LABEL_FILE))
 
-            unzip(data_filename, True)
+def download(
+        base_dir: str,
+        data: Dict,
+        workers: int = 4,
+        base_link: str = None,
+        retries: int = 3,
+        timeout: float = 60.0,
+        extract_labeled: bool = True
+) -> List[DownloadTask]:
+    """Downloads and extracts the dataset with a pool of workers, every archive is extracted
+    by the worker that downloaded it. Finished files are skipped, so rerunning after a failure resumes"""
+    tasks = plan_downloads(base_dir, data, base_link, extract_labeled)
+    logging.info("Downloading CADC dataset in directory %s" % join(base_dir, "cadc"))
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(run_task, task, retries, timeout) for task in tasks]
+        return [future.result() for future in futures]
 
 
 def main():
     parser = argparse.ArgumentParser(description='download')
     parser.add_argument("--dataset_dict", default="dataset/configs/format.yaml", type=str)
     parser.add_argument('--base_dir', type=str)
+    parser.add_argument('--base_link', default=None, type=str)
+    parser.add_argument('--workers', default=4, type=int)
+    parser.add_argument('--retries', default=3, type=int)
+    parser.add_argument('--keep_archives', action='store_true',
+                        help="keep labeled.zip archives instead of extracting them")
     args = parser.parse_args()
 
     logging.basicConfig()
@@ -79,7 +256,8 @@ def main():
 
     with open(args.dataset_dict) as fr:
         data = yaml.load(fr.read(), Loader=SafeLoader)
-    download(args.base_dir, data)
+    download(args.base_dir, data, args.workers, args.base_link, args.retries,
+             extract_labeled=not args.keep_archives)
 
 
 if __name__ == "__main__":
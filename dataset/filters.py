@@ -0,0 +1,294 @@
+import numpy as np
+
+from typing import List, Tuple
+from dataclasses import dataclass, field
+
+from geometry.spatial_index import GridIndex
+from .structures import LidarCloud
+
+
+def _batch_index(points: np.array, batch_index: np.array) -> np.array:
+    if batch_index is None:
+        return np.zeros(len(points), dtype=np.int64)
+    return np.asarray(batch_index, dtype=np.int64)
+
+
+def range_mask(points: np.array, point_range: Tuple[float, ...]) -> np.array:
+    """
+    :param points: array of shape (n, 3+)
+    :param point_range: [x_min, y_min, z_min, x_max, y_max, z_max], or [x_min, y_min, x_max, y_max] for bev
+    :return: (n,) mask of points strictly inside the range
+    """
+    dims = len(point_range) // 2
+    low = np.asarray(point_range[:dims])
+    high = np.asarray(point_range[dims:])
+    xyz = points[:, :dims]
+    return np.all((xyz > low) & (xyz < high), axis=1)
+
+
+def radius_mask(points: np.array, min_radius: float = 0.0, max_radius: float = np.inf) -> np.array:
+    """(n,) mask of points with horizontal distance to the sensor in [min_radius, max_radius)"""
+    distances = points[:, 0] ** 2 + points[:, 1] ** 2
+    return (distances >= min_radius ** 2) & (distances < max_radius ** 2)
+
+
+def ground_plane(points: np.array, distance_threshold: float = 0.2, iterations: int = 64,
+                 max_slope: float = 0.2, sample_size: int = 4096, rng: np.random.Generator = None) -> np.array:
+    """RANSAC ground plane, all hypotheses are scored at once on a subsample of points
+    :param max_slope: maximum tilt of the plane normal from z axis in radians
+    :return: plane [a, b, c, d] with a * x + b * y + c * z + d = 0 and c > 0, None for less than 3 points
+    """
+    if len(points) < 3:
+        return None
+    rng = np.random.default_rng(0) if rng is None else rng
+    xyz = np.asarray(points[:, :3], dtype=np.float64)
+    sample = xyz[rng.choice(len(xyz), min(sample_size, len(xyz)), replace=False)]
+
+    triples = sample[rng.integers(0, len(sample), (iterations, 3))]
+    normals = np.cross(triples[:, 1] - triples[:, 0], triples[:, 2] - triples[:, 0])
+    norms = np.linalg.norm(normals, axis=1)
+    normals = normals / np.maximum(norms, 1e-12)[:, None]
+    normals *= np.where(normals[:, 2] < 0, -1, 1)[:, None]
+    offsets = -np.einsum("ij,ij->i", normals, triples[:, 0])
+    valid = (norms > 1e-9) & (normals[:, 2] >= np.cos(max_slope))
+    if not np.any(valid):
+        return None
+
+    distances = np.abs(sample @ normals[valid].T + offsets[valid])
+    best = np.argmax((distances < distance_threshold).sum(axis=0))
+    return np.append(normals[valid][best], offsets[valid][best])
+
+
+def ground_mask(points: np.array, distance_threshold: float = 0.2, batch_index: np.array = None,
+                rng: np.random.Generator = None, **kwargs) -> np.array:
+    """(n,) mask of points within distance_threshold of the ground plane of their cloud"""
+    batch_index = _batch_index(points, batch_index)
+    mask = np.zeros(len(points), dtype=bool)
+    for cloud in np.unique(batch_index):
+        cloud_idx = np.flatnonzero(batch_index == cloud)
+        plane = ground_plane(points[cloud_idx], distance_threshold, rng=rng, **kwargs)
+        if plane is not None:
+            distances = np.abs(points[cloud_idx, :3] @ plane[:3] + plane[3])
+            mask[cloud_idx] = distances < distance_threshold
+    return mask
+
+
+def snow_mask(points: np.array, intensity: np.array = None, intensity_threshold: float = None,
+              radius_multiplier: float = 3.0, angular_resolution: float = np.radians(0.2),
+              min_radius: float = 0.04, min_neighbors: int = 3, max_range: float = np.inf,
+              batch_index: np.array = None) -> np.array:
+    """Dynamic radius outlier removal (DROR) with an optional low intensity gate.
+    Search radius of a point grows with its range as radius_multiplier * range * angular_resolution,
+    so sparse far returns are not removed together with isolated snow flakes near the sensor
+    :param intensity: (n,) intensities, only points below intensity_threshold can be removed when both are set
+    :param min_neighbors: points with fewer other points within their search radius are removed
+    :param max_range: points farther than max_range are always kept
+    :return: (n,) mask of removed points
+    """
+    batch_index = _batch_index(points, batch_index)
+    distances = np.sqrt(points[:, 0] ** 2 + points[:, 1] ** 2)
+    radius = np.maximum(radius_multiplier * distances * angular_resolution, min_radius)
+    candidates = distances < max_range
+    if intensity is not None and intensity_threshold is not None:
+        candidates &= np.asarray(intensity) < intensity_threshold
+
+    removed = np.zeros(len(points), dtype=bool)
+    for cloud in np.unique(batch_index[candidates]):
+        cloud_idx = np.flatnonzero(batch_index == cloud)
+        query_idx = cloud_idx[candidates[cloud_idx]]
+        # queries are grouped by radius doubling bands, every band searches a grid with cells
+        # of its largest radius over the range shell its neighbors can be in
+        bands = np.floor(np.log2(radius[query_idx] / min_radius)).astype(np.int64)
+        for band in np.unique(bands):
+            band_idx = query_idx[bands == band]
+            band_radius = radius[band_idx]
+            reach = float(band_radius.max())
+            shell = (distances[cloud_idx] >= distances[band_idx].min() - reach) & \
+                    (distances[cloud_idx] <= distances[band_idx].max() + reach)
+            index = GridIndex.build(points[cloud_idx[shell]], cell_size=reach)
+            # every point counts itself, counting stops at min_neighbors others
+            neighbors = index.count_neighbors(points[band_idx], band_radius, min_neighbors + 1) - 1
+            removed[band_idx] = neighbors < min_neighbors
+    return removed
+
+
+def voxel_keys(points: np.array, voxel_size, batch_index: np.array = None) -> np.array:
+    """(n,) voxel id of every point unique across clouds of the batch"""
+    cells = np.floor(points[:, :3] / np.asarray(voxel_size)).astype(np.int64)
+    cells -= cells.min(axis=0) if len(cells) else 0
+    dims = cells.max(axis=0) + 1 if len(cells) else np.ones(3, dtype=np.int64)
+    keys = (cells[:, 2] * dims[1] + cells[:, 1]) * dims[0] + cells[:, 0]
+    return _batch_index(points, batch_index) * int(np.prod(dims)) + keys
+
+
+def voxel_downsample(points: np.array, voxel_size, batch_index: np.array = None) -> Tuple[np.array, np.array]:
+    """
+    :return: indices of the first point of every occupied voxel in input order,
+        and (n,) position of the voxel of every input point in these indices
+    """
+    _, first, inverse = np.unique(voxel_keys(points, voxel_size, batch_index), return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.reshape(-1)]
+
+
+def voxel_means(values: np.array, inverse: np.array, n_voxels: int) -> np.array:
+    """Per voxel mean of any per point attribute given the inverse map of voxel_downsample"""
+    values = np.asarray(values, dtype=np.float64)
+    sums = np.zeros((n_voxels,) + values.shape[1:])
+    np.add.at(sums, inverse, values)
+    counts = np.bincount(inverse, minlength=n_voxels).reshape((-1,) + (1,) * (values.ndim - 1))
+    return sums / np.maximum(counts, 1)
+
+
+def _cloud_ranges(batch_index: np.array) -> Tuple[np.array, np.array, np.array]:
+    """Clouds, starts and counts of a batch with points grouped by cloud"""
+    clouds, starts, counts = np.unique(batch_index, return_index=True, return_counts=True)
+    assert np.all(np.diff(batch_index) >= 0), "Points of a batch must be grouped by cloud"
+    return clouds, starts, counts
+
+
+def random_sample(points: np.array, count: int, batch_index: np.array = None,
+                  rng: np.random.Generator = None) -> np.array:
+    """Indices of count points of every cloud, clouds with less points repeat random points
+    :return: (clouds * count,) indices grouped by cloud
+    """
+    rng = np.random.default_rng(0) if rng is None else rng
+    _, starts, counts = _cloud_ranges(_batch_index(points, batch_index))
+    keys = rng.random((len(counts), max(counts.max(initial=0), count)))
+    keys[np.arange(keys.shape[1])[None, :] >= counts[:, None]] = np.inf
+    picks = np.argsort(keys, axis=1)[:, :count]
+    # repeats for clouds smaller than count
+    repeats = rng.integers(0, np.maximum(counts, 1)[:, None], (len(counts), count))
+    picks = np.where(np.arange(count)[None, :] < counts[:, None], picks, repeats)
+    return (starts[:, None] + picks).reshape(-1)
+
+
+def farthest_point_sample(points: np.array, count: int, batch_index: np.array = None) -> np.array:
+    """Farthest point sampling run for all clouds of the batch at once, starting from the first point
+    of every cloud. Clouds with less points than count repeat their first point
+    :return: (clouds * count,) indices grouped by cloud
+    """
+    _, starts, counts = _cloud_ranges(_batch_index(points, batch_index))
+    n_clouds, width = len(counts), counts.max(initial=0)
+    if width == 0:
+        return np.zeros(0, dtype=np.int64)
+    valid = np.arange(width)[None, :] < counts[:, None]
+    rows = np.where(valid, starts[:, None] + np.arange(width)[None, :], starts[:, None])
+    xyz = np.asarray(points[:, :3], dtype=np.float64)[rows]
+
+    picks = np.zeros((n_clouds, count), dtype=np.int64)
+    distances = np.where(valid, np.inf, -1.0)
+    last = xyz[:, 0]
+    for step in range(1, count):
+        distances = np.minimum(distances, np.where(valid, ((xyz - last[:, None]) ** 2).sum(axis=2), -1.0))
+        picks[:, step] = np.argmax(distances, axis=1)
+        last = xyz[np.arange(n_clouds), picks[:, step]]
+    picks = np.where(np.arange(count)[None, :] < counts[:, None], picks, 0)
+    return (starts[:, None] + picks).reshape(-1)
+
+
+@dataclass
+class RangeCrop:
+    point_range: Tuple[float, ...] = (-51.2, -51.2, -5.0, 51.2, 51.2, 3.0)
+    min_radius: float = 0.0
+
+    def __call__(self, points, batch_index, rng):
+        mask = range_mask(points, self.point_range)
+        if self.min_radius > 0:
+            mask &= radius_mask(points, self.min_radius)
+        return np.flatnonzero(mask)
+
+
+@dataclass
+class GroundRemoval:
+    distance_threshold: float = 0.2
+    iterations: int = 64
+
+    def __call__(self, points, batch_index, rng):
+        return np.flatnonzero(~ground_mask(points, self.distance_threshold, batch_index, rng,
+                                           iterations=self.iterations))
+
+
+@dataclass
+class SnowRemoval:
+    """DROR filter, intensity is taken from the 4th column of points when intensity_threshold is set"""
+    intensity_threshold: float = None
+    radius_multiplier: float = 3.0
+    min_neighbors: int = 3
+    max_range: float = np.inf
+
+    def __call__(self, points, batch_index, rng):
+        intensity = points[:, 3] if self.intensity_threshold is not None else None
+        return np.flatnonzero(~snow_mask(
+            points, intensity, self.intensity_threshold, self.radius_multiplier,
+            min_neighbors=self.min_neighbors, max_range=self.max_range, batch_index=batch_index
+        ))
+
+
+@dataclass
+class VoxelDownsample:
+    voxel_size: Tuple[float, float, float] = (0.1, 0.1, 0.1)
+
+    def __call__(self, points, batch_index, rng):
+        return voxel_downsample(points, self.voxel_size, batch_index)[0]
+
+
+@dataclass
+class RandomSample:
+    count: int = 16384
+
+    def __call__(self, points, batch_index, rng):
+        return random_sample(points, self.count, batch_index, rng)
+
+
+@dataclass
+class FarthestPointSample:
+    count: int = 4096
+
+    def __call__(self, points, batch_index, rng):
+        return farthest_point_sample(points, self.count, batch_index)
+
+
+@dataclass
+class FilterPipeline:
+    """Chain of point filters, every stage returns indices of kept points of its input.
+    Result of the chain is an index map into the original points, so any per point attribute
+    is filtered with attribute[indices]"""
+    stages: List
+    seed: int = 0
+    rng: np.random.Generator = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.rng is None:
+            self.rng = np.random.default_rng(self.seed)
+
+    def __call__(self, points: np.array, batch_index: np.array = None) -> np.array:
+        """
+        :param points: (n, c) points, several clouds are passed concatenated with batch_index
+        :param batch_index: (n,) non decreasing cloud index of every point
+        :return: indices of kept points, grouped by cloud
+        """
+        indices = np.arange(len(points))
+        for stage in self.stages:
+            selected = stage(points[indices], None if batch_index is None else batch_index[indices], self.rng)
+            indices = indices[selected]
+        return indices
+
+    def filter_cloud(self, cloud: LidarCloud) -> Tuple[LidarCloud, np.array]:
+        indices = self(cloud.points)
+        return type(cloud)(cloud.points[indices]), indices
+
+    def filter_clouds(self, clouds: List[LidarCloud]) -> List[Tuple[LidarCloud, np.array]]:
+        """Filters clouds in one pass, indices are local to every cloud"""
+        counts = np.array([len(cloud.points) for cloud in clouds])
+        points = np.concatenate([cloud.points for cloud in clouds])
+        batch_index = np.repeat(np.arange(len(clouds)), counts)
+        indices = self(points, batch_index)
+        starts = np.cumsum(counts) - counts
+        result = []
+        for cloud_idx, cloud in enumerate(clouds):
+            local = indices[batch_index[indices] == cloud_idx] - starts[cloud_idx]
+            result.append((type(cloud)(cloud.points[local]), local))
+        return result
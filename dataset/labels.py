@@ -0,0 +1,238 @@
+import os
+import json
+
+import numpy as np
+from typing import Dict, Iterator, List, Sequence, Tuple, Union
+from dataclasses import dataclass
+
+from .cadc import CADC_LABELS, CadcDataset
+from .profiling import profile_stage
+from .structures import GT3D, RideID, decode_labels
+
+
+LABEL_KEY_COLUMNS = ("date", "ride", "frame", "label", "stationary")
+
+
+@dataclass
+class GroupStats:
+    """Statistics of a column per group
+    keys: group key columns, one row per group
+    count: (g,) number of values of every group
+    mean, std, min, max: (g, ...) per group statistics, nan for groups without values"""
+    keys: Dict[str, np.array]
+    count: np.array
+    mean: np.array
+    std: np.array
+    min: np.array
+    max: np.array
+
+    def __len__(self):
+        return len(self.count)
+
+    def rows(self) -> List[Dict]:
+        """Groups as plain dicts, e.g. to print or dump to json"""
+        return [
+            dict(
+                {name: values[idx].item() for name, values in self.keys.items()},
+                count=int(self.count[idx]),
+                mean=self.mean[idx].tolist(), std=self.std[idx].tolist(),
+                min=self.min[idx].tolist(), max=self.max[idx].tolist()
+            )
+            for idx in range(len(self))
+        ]
+
+
+@dataclass
+class LabelTable:
+    """Cuboids of many frames as columns, one row per cuboid
+    date, ride: (n,) str ride of every cuboid
+    frame: (n,) int32 frame index in the ride, same as the scene index of the ride
+    labels: (n,) int32 codes into label_names
+    position, dimensions: (n, 3) float64 box center and full sizes
+    yaw: (n,) float64
+    stationary: (n,) bool
+    points_count: (n,) int64 lidar points in the box, -1 where annotations do not have it"""
+    date: np.array
+    ride: np.array
+    frame: np.array
+    labels: np.array
+    label_names: List[str]
+    position: np.array
+    dimensions: np.array
+    yaw: np.array
+    stationary: np.array
+    points_count: np.array
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def label(self) -> np.array:
+        return decode_labels(self.labels, self.label_names)
+
+    @property
+    def boxes(self) -> np.array:
+        """(n, 7) boxes in GT3D format"""
+        return np.column_stack([self.position, self.dimensions, self.yaw])
+
+    @property
+    def volume(self) -> np.array:
+        return np.prod(self.dimensions, axis=1)
+
+    @property
+    def distance(self) -> np.array:
+        """Horizontal distance of box centers from the lidar"""
+        return np.hypot(self.position[:, 0], self.position[:, 1])
+
+    def column(self, name: str) -> np.array:
+        return getattr(self, name)
+
+    def select(self, mask: np.array) -> "LabelTable":
+        return LabelTable(
+            self.date[mask], self.ride[mask], self.frame[mask], self.labels[mask], self.label_names,
+            self.position[mask], self.dimensions[mask], self.yaw[mask], self.stationary[mask],
+            self.points_count[mask]
+        )
+
+    @staticmethod
+    def empty(label_names: List[str] = None) -> "LabelTable":
+        return LabelTable(
+            np.empty(0, dtype=str), np.empty(0, dtype=str), np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.int32), list(CADC_LABELS if label_names is None else label_names),
+            np.empty((0, 3)), np.empty((0, 3)), np.empty(0), np.empty(0, dtype=bool), np.empty(0, dtype=np.int64)
+        )
+
+    @staticmethod
+    def from_frames(frames: List[Dict], ride_id: RideID, label_names: List[str] = None) -> "LabelTable":
+        """
+        :param frames: parsed 3d_ann.json, a list of {"cuboids": [...]} per frame
+        :param label_names: label vocabulary, CADC_LABELS by default, unknown labels are appended
+        """
+        cuboids = [cuboid for frame in frames for cuboid in frame['cuboids']]
+        n = len(cuboids)
+        counts = np.array([len(frame['cuboids']) for frame in frames], dtype=np.int64)
+        numbers = np.array([
+            (cuboid['position']['x'], cuboid['position']['y'], cuboid['position']['z'],
+             cuboid['dimensions']['x'], cuboid['dimensions']['y'], cuboid['dimensions']['z'],
+             cuboid['yaw'], cuboid['stationary'], cuboid.get('points_count', -1))
+            for cuboid in cuboids
+        ], dtype=np.float64).reshape(n, 9)
+        gt = GT3D.from_arrays(
+            numbers[:, :7], [cuboid['label'] for cuboid in cuboids], numbers[:, 7].astype(bool),
+            CADC_LABELS if label_names is None else label_names
+        )
+
+        return LabelTable(
+            np.full(n, ride_id.date),
+            np.full(n, ride_id.ride_id),
+            np.repeat(np.arange(len(frames), dtype=np.int32), counts),
+            gt.labels,
+            gt.label_names,
+            numbers[:, 0:3],
+            numbers[:, 3:6],
+            numbers[:, 6],
+            gt.stationary,
+            numbers[:, 8].astype(np.int64)
+        )
+
+    @staticmethod
+    def from_json(source: Union[str, bytes], ride_id: RideID, label_names: List[str] = None) -> "LabelTable":
+        """
+        :param source: path to 3d_ann.json or its content
+        """
+        if isinstance(source, bytes):
+            with profile_stage("json_parse", len(source)):
+                frames = json.loads(source)
+        else:
+            with open(source) as fr, profile_stage("json_parse", os.path.getsize(source)):
+                frames = json.load(fr)
+        return LabelTable.from_frames(frames, ride_id, label_names)
+
+    @staticmethod
+    def concatenate(tables: Sequence["LabelTable"], label_names: List[str] = None) -> "LabelTable":
+        """Tables with codes remapped into a common vocabulary"""
+        label_names = list(CADC_LABELS if label_names is None else label_names)
+        if not tables:
+            return LabelTable.empty(label_names)
+        labels = []
+        for table in tables:
+            for name in table.label_names:
+                if name not in label_names:
+                    label_names.append(name)
+            mapping = np.array([label_names.index(name) for name in table.label_names] + [-1], dtype=np.int32)
+            labels.append(mapping[table.labels])
+        return LabelTable(
+            np.concatenate([table.date for table in tables]),
+            np.concatenate([table.ride for table in tables]),
+            np.concatenate([table.frame for table in tables]),
+            np.concatenate(labels),
+            label_names,
+            np.concatenate([table.position for table in tables]),
+            np.concatenate([table.dimensions for table in tables]),
+            np.concatenate([table.yaw for table in tables]),
+            np.concatenate([table.stationary for table in tables]),
+            np.concatenate([table.points_count for table in tables])
+        )
+
+    @staticmethod
+    def lazy_from_path(path, use_index: bool = True, label_names: List[str] = None) -> Iterator["LabelTable"]:
+        """Labels of every ride, only 3d_ann.json files are read, images and sweeps are not touched"""
+        for ride_id in CadcDataset.get_rides_info_list(path, use_index):
+            annotation_path = os.path.join(path, ride_id.date, ride_id.ride_id, "3d_ann.json")
+            yield LabelTable.from_json(annotation_path, ride_id, label_names)
+
+    @staticmethod
+    def from_path(path, use_index: bool = True, label_names: List[str] = None) -> "LabelTable":
+        return LabelTable.concatenate(list(LabelTable.lazy_from_path(path, use_index, label_names)), label_names)
+
+    def group_by(self, by: Sequence[str]) -> Tuple[Dict[str, np.array], np.array]:
+        """
+        :param by: key columns among LABEL_KEY_COLUMNS
+        :return: key columns with one row per group sorted by keys, group of every row
+        """
+        if not by:
+            return {}, np.zeros(len(self), dtype=np.int64)
+        codes = []
+        for name in by:
+            assert name in LABEL_KEY_COLUMNS, "Can not group by %s" % name
+            codes.append(np.unique(self.column(name), return_inverse=True)[1].reshape(-1))
+        shape = [int(code.max()) + 1 if len(code) else 1 for code in codes]
+        keys, first, inverse = np.unique(
+            np.ravel_multi_index(codes, shape), return_index=True, return_inverse=True
+        )
+        return {name: self.column(name)[first] for name in by}, inverse.reshape(-1)
+
+    def count(self, by: Sequence[str] = ("label",)) -> Tuple[Dict[str, np.array], np.array]:
+        """Number of cuboids per group, e.g. count(("date", "ride", "label"))"""
+        groups, inverse = self.group_by(by)
+        return groups, np.bincount(inverse)
+
+    def describe(self, column: str, by: Sequence[str] = ("label",)) -> GroupStats:
+        """
+        :param column: numeric column or property, e.g. dimensions, volume, distance, points_count.
+            Negative points_count of cuboids without it are skipped
+        :param by: key columns among LABEL_KEY_COLUMNS
+        """
+        groups, inverse = self.group_by(by)
+        n_groups = int(inverse.max()) + 1 if len(inverse) else 0
+        values = np.asarray(self.column(column), dtype=np.float64)
+        if column == "points_count":
+            keep = values >= 0
+            values, inverse = values[keep], inverse[keep]
+
+        count = np.bincount(inverse, minlength=n_groups)
+        shape = (n_groups,) + values.shape[1:]
+        stats = {name: np.full(shape, np.nan) for name in ("mean", "std", "min", "max")}
+        if len(values):
+            order = np.argsort(inverse, kind="stable")
+            present = np.flatnonzero(count)
+            starts = (np.cumsum(count) - count)[present]
+            ordered = values[order]
+            stats["mean"][present] = np.add.reduceat(ordered, starts) / count[present].reshape(
+                (-1,) + (1,) * (values.ndim - 1))
+            deviation = ordered - stats["mean"][inverse[order]]
+            stats["std"][present] = np.sqrt(np.add.reduceat(deviation ** 2, starts) / count[present].reshape(
+                (-1,) + (1,) * (values.ndim - 1)))
+            stats["min"][present] = np.minimum.reduceat(ordered, starts)
+            stats["max"][present] = np.maximum.reduceat(ordered, starts)
+        return GroupStats(groups, count, **stats)
@@ -0,0 +1,232 @@
+import os
+import json
+
+import numpy as np
+from PIL import Image as PILImage
+
+from typing import List, Dict, Tuple, Union
+from dataclasses import dataclass, field
+
+from .structures import (
+    Scene, SceneID, RideID, Camera, Image,
+    Transform, GT3D
+)
+from .cadc import CADC_LABELS, CadcLidarCloud, IndexedCadcDataset
+
+
+PACKED_VERSION = 1
+META_FILE = "meta.json"
+POINTS_FILE = "points.npy"
+POINT_OFFSETS_FILE = "point_offsets.npy"
+BOXES_FILE = "boxes.npy"
+BOX_OFFSETS_FILE = "box_offsets.npy"
+IMAGES_FILE = "images_{}.npy"
+
+BOX_DTYPE = np.dtype([
+    ("label", "U32"),
+    ("position", np.float64, (3,)),
+    ("dimensions", np.float64, (3,)),
+    ("yaw", np.float64),
+    ("stationary", np.bool_),
+])
+
+
+def gt3d_to_records(gt3d: GT3D) -> np.array:
+    records = np.zeros(len(gt3d), dtype=BOX_DTYPE)
+    records["label"] = gt3d.label_strings
+    records["position"] = gt3d.data[:, 0:3]
+    records["dimensions"] = gt3d.data[:, 3:6]
+    records["yaw"] = gt3d.data[:, 6]
+    records["stationary"] = gt3d.stationary
+    return records
+
+
+def records_to_gt3d(records: np.array) -> GT3D:
+    return GT3D.from_arrays(
+        np.concatenate([records["position"], records["dimensions"], records["yaw"][:, None]], axis=1),
+        records["label"],
+        records["stationary"],
+        CADC_LABELS
+    )
+
+
+def pack_cadc(dataset_path: str, output_path: str, images: bool = False,
+              image_size: Tuple[int, int] = None, flush_every: int = 256):
+    """One-shot conversion of CADC directory layout to packed arrays.
+    Points of all scenes are a single concatenated (n, 4) array sliced by point offsets,
+    boxes and images are single arrays as well
+        :param dataset_path: CADC root, it is indexed with CadcIndex if needed
+        :param output_path: directory for packed arrays
+        :param images: store images of all cameras as (scenes, h, w, 3) uint8 arrays
+        :param image_size: (width, height) to resize stored images to, original size by default
+        :param flush_every: number of scenes converted between flushes of the memory-mapped output arrays
+    """
+    dataset = IndexedCadcDataset(dataset_path, cameras=[] if not images else None)
+    os.makedirs(output_path, exist_ok=True)
+
+    point_counts = np.array([
+        os.path.getsize(os.path.join(dataset_path, entry.lidar_path)) // (4 * CadcLidarCloud.NUMBER_OF_CHANNELS)
+        for entry in dataset.index.scenes
+    ], dtype=np.int64)
+    point_offsets = np.concatenate([[0], np.cumsum(point_counts)])
+    points = np.lib.format.open_memmap(
+        os.path.join(output_path, POINTS_FILE), mode="w+", dtype=np.float32,
+        shape=(int(point_offsets[-1]), CadcLidarCloud.NUMBER_OF_CHANNELS)
+    )
+
+    image_arrays = {}
+    if images and len(dataset):
+        first_scene = dataset[0]
+        for camera_idx, camera in enumerate(first_scene.cameras):
+            width, height = image_size if image_size is not None else camera.image.size
+            image_arrays[camera_idx] = np.lib.format.open_memmap(
+                os.path.join(output_path, IMAGES_FILE.format(str(camera_idx).rjust(2, "0"))),
+                mode="w+", dtype=np.uint8, shape=(len(dataset), height, width, 3)
+            )
+
+    boxes = []
+    for scene_idx in range(len(dataset)):
+        scene = dataset[scene_idx]
+        points[point_offsets[scene_idx]:point_offsets[scene_idx + 1]] = scene.lidar_cloud.points
+        boxes.append(gt3d_to_records(scene.gt3d))
+        for camera_idx, array in image_arrays.items():
+            image = scene.cameras[camera_idx].image.data.convert("RGB")
+            if image.size != (array.shape[2], array.shape[1]):
+                image = image.resize((array.shape[2], array.shape[1]), PILImage.BILINEAR)
+            array[scene_idx] = np.asarray(image)
+            scene.cameras[camera_idx].image.release()
+        if (scene_idx + 1) % flush_every == 0:
+            points.flush()
+            for array in image_arrays.values():
+                array.flush()
+
+    points.flush()
+    for array in image_arrays.values():
+        array.flush()
+    del points, image_arrays
+
+    np.save(os.path.join(output_path, POINT_OFFSETS_FILE), point_offsets)
+    np.save(os.path.join(output_path, BOXES_FILE),
+            np.concatenate(boxes) if boxes else np.zeros(0, dtype=BOX_DTYPE))
+    np.save(os.path.join(output_path, BOX_OFFSETS_FILE),
+            np.concatenate([[0], np.cumsum([len(records) for records in boxes])]).astype(np.int64))
+
+    dates = sorted({ride.date for ride in dataset.ride_ids})
+    meta = {
+        "version": PACKED_VERSION,
+        "source_path": os.path.abspath(dataset_path),
+        "images": images,
+        "scenes": [
+            [entry.scene_id.ride_id.date, entry.scene_id.ride_id.ride_id, entry.scene_id.scene_id, entry.image_paths]
+            for entry in dataset.index.scenes
+        ],
+        "calib": {
+            date: [[calib.name, calib.data.reshape(-1).tolist()] for _, calib in sorted(dataset.calib(date).items())]
+            for date in dates
+        },
+        "extrinsics": {
+            date: {str(camera_idx): extrinsics.data.reshape(-1).tolist()
+                   for camera_idx, extrinsics in dataset.extrinsics(date).items()}
+            for date in dates
+        }
+    }
+    with open(os.path.join(output_path, META_FILE), "w") as fw:
+        json.dump(meta, fw)
+
+
+@dataclass
+class PackedCadcDataset:
+    """Reader of pack_cadc output, yields the same Scene objects as CadcDataset.
+    Points and images are memory-mapped, a scene is a set of slices into them"""
+    path: str
+    mmap: bool = True
+    _meta: Dict = field(default=None, init=False, repr=False)
+    _positions: Dict[str, int] = field(default=None, init=False, repr=False)
+    _calibs: Dict[str, List[Transform]] = field(default=None, init=False, repr=False)
+    _extrinsics: Dict[str, Dict[int, Transform]] = field(default=None, init=False, repr=False)
+    _arrays: Dict[str, np.array] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        with open(os.path.join(self.path, META_FILE)) as fr:
+            self._meta = json.load(fr)
+        if self._meta["version"] != PACKED_VERSION:
+            raise ValueError("Unsupported packed CADC version %s in %s" % (self._meta["version"], self.path))
+        self._positions = {
+            str(SceneID(RideID(date, ride), scene)): idx
+            for idx, (date, ride, scene, _) in enumerate(self._meta["scenes"])
+        }
+        self._calibs = {
+            date: [Transform(name, np.array(data, dtype=np.float32).reshape(3, 3)) for name, data in calibs]
+            for date, calibs in self._meta["calib"].items()
+        }
+        self._extrinsics = {
+            date: {
+                int(camera_idx): Transform(
+                    self._calibs[date][int(camera_idx)].name.rstrip("_intrinsics") + "_extrinsics",
+                    np.array(data, dtype=np.float32).reshape(4, 4)
+                )
+                for camera_idx, data in extrinsics.items()
+            }
+            for date, extrinsics in self._meta.get("extrinsics", {}).items()
+        }
+        mmap_mode = "r" if self.mmap else None
+        self._arrays = {
+            name: np.load(os.path.join(self.path, name), mmap_mode=mmap_mode)
+            for name in [POINTS_FILE, POINT_OFFSETS_FILE, BOXES_FILE, BOX_OFFSETS_FILE]
+        }
+        if self._meta["images"]:
+            for camera_idx in range(len(next(iter(self._calibs.values())))):
+                name = IMAGES_FILE.format(str(camera_idx).rjust(2, "0"))
+                if os.path.isfile(os.path.join(self.path, name)):
+                    self._arrays[name] = np.load(os.path.join(self.path, name), mmap_mode=mmap_mode)
+
+    def __len__(self):
+        return len(self._meta["scenes"])
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getitem__(self, key: Union[int, SceneID, str]) -> Scene:
+        if isinstance(key, (int, np.integer)):
+            if not -len(self) <= key < len(self):
+                raise IndexError("Scene index %d out of range" % key)
+            return self.load_scene(int(key) % len(self))
+        if str(key) not in self._positions:
+            raise KeyError("Unknown scene %s" % key)
+        return self.load_scene(self._positions[str(key)])
+
+    @property
+    def scene_ids(self) -> List[SceneID]:
+        return [SceneID(RideID(date, ride), scene) for date, ride, scene, _ in self._meta["scenes"]]
+
+    def load_scene(self, idx: int) -> Scene:
+        date, ride, scene, image_paths = self._meta["scenes"][idx]
+
+        point_offsets = self._arrays[POINT_OFFSETS_FILE]
+        points = self._arrays[POINTS_FILE][point_offsets[idx]:point_offsets[idx + 1]]
+        box_offsets = self._arrays[BOX_OFFSETS_FILE]
+        records = self._arrays[BOXES_FILE][box_offsets[idx]:box_offsets[idx + 1]]
+
+        cameras = []
+        for camera_idx, calib in enumerate(self._calibs[date]):
+            name = IMAGES_FILE.format(str(camera_idx).rjust(2, "0"))
+            if name in self._arrays:
+                image = Image(self._arrays[name][idx])
+            else:
+                image = Image(os.path.join(self._meta["source_path"], image_paths[camera_idx]))
+            extrinsics = self._extrinsics.get(date, {})
+            transformations = [extrinsics[camera_idx]] if camera_idx in extrinsics else []
+            cameras.append(Camera(calib.name.rstrip("_intrinsics"), calib, transformations, image))
+
+        return Scene(
+            SceneID(RideID(date, ride), scene),
+            cameras,
+            CadcLidarCloud(points),
+            records_to_gt3d(records)
+        )
+
+    @staticmethod
+    def convert(dataset_path: str, output_path: str, **kwargs) -> "PackedCadcDataset":
+        pack_cadc(dataset_path, output_path, **kwargs)
+        return PackedCadcDataset(output_path)
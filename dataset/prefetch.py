@@ -0,0 +1,117 @@
+from collections import deque
+from concurrent.futures import (
+    Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor,
+    wait, FIRST_COMPLETED
+)
+
+from typing import Any, Callable, Iterable, Iterator
+from dataclasses import dataclass
+
+from .structures import Scene
+from .cadc import IndexedCadcDataset
+
+
+_worker_dataset = None
+_END = object()
+
+
+def _init_worker(dataset):
+    global _worker_dataset
+    _worker_dataset = dataset
+
+
+def _load_in_worker(key, load_images: bool) -> Scene:
+    return load_scene(_worker_dataset, key, load_images)
+
+
+def load_scene(dataset, key, load_images: bool = False) -> Scene:
+    scene = dataset[key]
+    if load_images:
+        for camera in scene.cameras:
+            camera.image.data
+    return scene
+
+
+@dataclass
+class PrefetchLoader:
+    """Loads scenes of a random access dataset (IndexedCadcDataset, PackedCadcDataset)
+    on a thread or process pool, keeping up to in_flight scenes submitted ahead of the consumer.
+    Stopping iteration early cancels the pending loads and shuts the pool down"""
+    dataset: Any
+    keys: Iterable = None
+    workers: int = 4
+    in_flight: int = 8
+    ordered: bool = True
+    use_processes: bool = False
+    load_images: bool = False
+
+    def __len__(self):
+        return len(self.dataset) if self.keys is None else len(self.keys)
+
+    def _keys(self) -> Iterator:
+        return iter(range(len(self.dataset)) if self.keys is None else self.keys)
+
+    def _executor(self) -> Executor:
+        if self.use_processes:
+            return ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.dataset,))
+        return ThreadPoolExecutor(self.workers)
+
+    def _submit(self, executor: Executor, key) -> Future:
+        if self.use_processes:
+            return executor.submit(_load_in_worker, key, self.load_images)
+        return executor.submit(load_scene, self.dataset, key, self.load_images)
+
+    def __iter__(self) -> Iterator[Scene]:
+        assert self.in_flight > 0
+        keys = self._keys()
+        executor = self._executor()
+        pending = deque()
+        try:
+            for key in keys:
+                pending.append(self._submit(executor, key))
+                if len(pending) >= self.in_flight:
+                    break
+
+            while pending:
+                if self.ordered:
+                    done = [pending.popleft()]
+                else:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    done = [future for future in pending if future in finished]
+                    for future in done:
+                        pending.remove(future)
+
+                for future in done:
+                    scene = future.result()
+                    next_key = next(keys, _END)
+                    if next_key is not _END:
+                        pending.append(self._submit(executor, next_key))
+                    yield scene
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    self._discard(future.result())
+
+    def _discard(self, result):
+        """Release a loaded result that is dropped because iteration stopped early"""
+        pass
+
+
+def prefetch_from_path(path, grep: Callable = None, **kwargs) -> PrefetchLoader:
+    """Prefetching counterpart of CadcDataset.lazy_create_from_path
+        :param path: CADC root, indexed with CadcIndex if needed
+        :param grep: same scene filter as in lazy_create_from_path
+        :param kwargs: PrefetchLoader options, cameras and mmap_lidar go to the dataset
+    """
+    dataset = IndexedCadcDataset(
+        path,
+        cameras=kwargs.pop("cameras", None),
+        mmap_lidar=kwargs.pop("mmap_lidar", False)
+    )
+    keys = None
+    if grep:
+        keys = [idx for idx, scene_id in enumerate(dataset.scene_ids) if grep(scene_id)]
+    return PrefetchLoader(dataset, keys, **kwargs)
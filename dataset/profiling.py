@@ -0,0 +1,84 @@
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+from typing import Dict
+from dataclasses import dataclass
+
+
+LOADER_STAGES = ("listdir", "calib_read", "json_parse", "lidar_read", "image_open", "image_decode", "rectify")
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+
+
+class LoaderProfiler:
+    """Per stage call counters, wall time and bytes of the loader hot path,
+    collected in the current process from all threads"""
+
+    def __init__(self):
+        self.stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, nbytes: int = 0):
+        with self._lock:
+            stats = self.stages.setdefault(stage, StageStats())
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.bytes += nbytes
+
+    def summary(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {stage: dict(vars(stats)) for stage, stats in self.stages.items()}
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+
+
+class _StageTimer:
+    __slots__ = ("profiler", "stage", "nbytes", "start")
+
+    def __init__(self, profiler: LoaderProfiler, stage: str, nbytes: int):
+        self.profiler = profiler
+        self.stage = stage
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.stage, time.perf_counter() - self.start, self.nbytes)
+
+
+_active_profiler: LoaderProfiler = None
+_DISABLED = nullcontext()
+
+
+def profile_stage(stage: str, nbytes: int = 0):
+    """Context manager timing a loader stage, a shared no-op when profiling is off"""
+    profiler = _active_profiler
+    if profiler is None:
+        return _DISABLED
+    return _StageTimer(profiler, stage, nbytes)
+
+
+@contextmanager
+def profile_loading(profiler: LoaderProfiler = None):
+    """Enables stage timing inside the block
+        with profile_loading() as profiler:
+            scenes = CadcDataset.create_from_path(path)
+        profiler.summary()
+    """
+    global _active_profiler
+    previous = _active_profiler
+    _active_profiler = LoaderProfiler() if profiler is None else profiler
+    try:
+        yield _active_profiler
+    finally:
+        _active_profiler = previous
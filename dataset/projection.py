@@ -0,0 +1,90 @@
+import numpy as np
+
+from typing import List
+from dataclasses import dataclass
+
+from geometry.transformations import transform_points
+from .structures import Scene
+
+
+PROJECTION_CACHE_KEY = "projections"
+
+
+@dataclass
+class CameraProjection:
+    """Lidar points visible in a camera
+    indices: (k,) indexes of points in the lidar cloud
+    pixels: (k, 2) pixel coordinates (u, v) of these points
+    depth: (k,) depth of points in camera frame"""
+    camera_name: str
+    indices: np.array
+    pixels: np.array
+    depth: np.array
+
+
+def project_points(
+        points: np.array,
+        intrinsics: np.array,
+        extrinsics: np.array,
+        image_sizes: np.array,
+        min_depth: float = 0.1
+) -> List[CameraProjection]:
+    """Project points into several cameras at once
+    :param points: array of shape (n, 3+) with xyz in lidar frame in first columns
+    :param intrinsics: camera matrices of shape (c, 3, 3)
+    :param extrinsics: lidar to camera transforms of shape (c, 4, 4)
+    :param image_sizes: array of shape (c, 2) with (width, height) of images
+    :param min_depth: points closer to the camera plane are dropped
+    :return: list of c CameraProjection without camera names
+    """
+    xyz = np.ascontiguousarray(points[:, :3])
+    cam_points = transform_points(xyz[None], extrinsics)
+    depth = cam_points[:, :, 2]
+    uvw = np.matmul(cam_points, np.swapaxes(intrinsics, -1, -2).astype(cam_points.dtype, copy=False))
+
+    valid = depth > min_depth
+    safe_depth = np.where(valid, depth, 1)
+    u = uvw[:, :, 0] / safe_depth
+    v = uvw[:, :, 1] / safe_depth
+    image_sizes = np.asarray(image_sizes)
+    valid &= (u >= 0) & (u < image_sizes[:, 0:1]) & (v >= 0) & (v < image_sizes[:, 1:2])
+
+    projections = []
+    for camera_idx in range(len(intrinsics)):
+        indices = np.flatnonzero(valid[camera_idx])
+        projections.append(CameraProjection(
+            "",
+            indices,
+            np.stack([u[camera_idx, indices], v[camera_idx, indices]], axis=-1),
+            depth[camera_idx, indices]
+        ))
+    return projections
+
+
+def project_scene(scene: Scene, min_depth: float = 0.1) -> List[CameraProjection]:
+    """Project scene lidar cloud into all its cameras, result is cached in scene.cache
+    :param scene: scene with camera extrinsics loaded
+    :param min_depth: points closer to the camera plane are dropped
+    :return: CameraProjection for every camera of scene
+    """
+    cache_key = (PROJECTION_CACHE_KEY, min_depth)
+    if cache_key in scene.cache:
+        return scene.cache[cache_key]
+
+    for camera in scene.cameras:
+        if camera.extrinsics is None:
+            raise ValueError("Camera %s of scene %s has no extrinsics" % (camera.camera_name, scene.scene_id))
+    projections = []
+    if scene.cameras:
+        projections = project_points(
+            scene.lidar_cloud.points,
+            np.stack([camera.intrinsics.data for camera in scene.cameras]),
+            np.stack([camera.extrinsics.data for camera in scene.cameras]),
+            np.array([camera.image.size for camera in scene.cameras]),
+            min_depth
+        )
+    for camera, projection in zip(scene.cameras, projections):
+        projection.camera_name = camera.camera_name
+
+    scene.cache[cache_key] = projections
+    return projections
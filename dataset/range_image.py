@@ -0,0 +1,167 @@
+import numpy as np
+
+from typing import List, Union
+from dataclasses import dataclass
+
+from .structures import LidarCloud
+
+
+RANGE_IMAGE_CHANNELS = ("range", "intensity", "x", "y", "z", "mask")
+
+# Velodyne VLP-32C of CADC, beam elevations in degrees from the top beam down
+VLP32C_ELEVATIONS = (
+    15.0, 10.333, 7.0, 4.667, 3.333, 2.333, 1.667, 1.333, 1.0, 0.667, 0.333, 0.0, -0.333, -0.667, -1.0, -1.333,
+    -1.667, -2.0, -2.333, -2.667, -3.0, -3.333, -3.667, -4.0, -4.667, -5.333, -6.148, -7.254, -8.843, -11.31,
+    -15.639, -25.0
+)
+
+
+@dataclass
+class RangeImageConfig:
+    """Beam layout of a spinning lidar
+    elevations: beam elevations in degrees, one image row each, from the top beam down
+    width: azimuth bins, column width // 2 looks along x, columns grow clockwise seen from above
+    min_range, max_range: points outside are dropped"""
+    elevations: np.array
+    width: int = 1800
+    min_range: float = 0.5
+    max_range: float = 200.0
+
+    def __post_init__(self):
+        self.elevations = np.asarray(self.elevations, dtype=np.float64)
+        assert np.all(np.diff(self.elevations) < 0), "Elevations must go from the top beam down"
+
+    @property
+    def height(self) -> int:
+        return len(self.elevations)
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    @staticmethod
+    def vlp32c(width: int = 1800) -> "RangeImageConfig":
+        """CADC sensor, 1800 bins match its 0.2 degree azimuth resolution at 10 Hz"""
+        return RangeImageConfig(np.array(VLP32C_ELEVATIONS), width)
+
+    @staticmethod
+    def uniform(beams: int, fov_up: float, fov_down: float, width: int = 1800) -> "RangeImageConfig":
+        """Evenly spaced beams between fov_up and fov_down degrees"""
+        return RangeImageConfig(np.linspace(fov_up, fov_down, beams), width)
+
+    def row_bounds(self) -> np.array:
+        """(height + 1,) ascending elevation bounds in radians, a beam owns the angles
+        closer to it than to its neighbours, outer beams extend by half of their gap"""
+        elevations = np.radians(self.elevations[::-1])
+        middle = (elevations[1:] + elevations[:-1]) / 2
+        return np.concatenate([
+            [elevations[0] - (middle[0] - elevations[0])], middle, [elevations[-1] + (elevations[-1] - middle[-1])]
+        ]) if len(elevations) > 1 else elevations + [-np.pi / 2, np.pi / 2]
+
+
+CADC_RANGE_IMAGE = RangeImageConfig.vlp32c()
+
+
+def pixel_coordinates(xyz: np.array, config: RangeImageConfig):
+    """
+    :param xyz: (n, 3) points in the sensor frame
+    :return: rows, columns and ranges of points, rows are -1 for points outside the field of view or range
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    ranges = np.linalg.norm(xyz, axis=1)
+    elevation = np.arcsin(np.divide(xyz[:, 2], ranges, out=np.zeros_like(ranges), where=ranges > 0))
+    azimuth = np.arctan2(xyz[:, 1], xyz[:, 0])
+
+    bounds = config.row_bounds()
+    rows = config.height - np.searchsorted(bounds, elevation, side="right")
+    valid = (rows >= 0) & (rows < config.height) & (ranges >= config.min_range) & (ranges <= config.max_range)
+    columns = np.floor(0.5 * (1 - azimuth / np.pi) * config.width).astype(np.int64) % config.width
+    return np.where(valid, rows, -1), columns, ranges
+
+
+@dataclass
+class RangeImage:
+    """Range images of a batch of clouds, every pixel keeps the nearest point falling into it
+    data: (b, 6, h, w) float32 channels of RANGE_IMAGE_CHANNELS, zero at empty pixels
+    point_index: (b, h, w) int64 index of the pixel point into the concatenated points, -1 for empty pixels
+    pixel_index: (n,) int64 flat pixel of every point into (b, h, w), -1 for points outside the image.
+        Several points can share a pixel, point_index only keeps the nearest one
+    point_offsets: (b + 1,) cloud i owns points[point_offsets[i]:point_offsets[i + 1]]"""
+    config: RangeImageConfig
+    data: np.array
+    point_index: np.array
+    pixel_index: np.array
+    point_offsets: np.array
+
+    def channel(self, name: str) -> np.array:
+        return self.data[:, RANGE_IMAGE_CHANNELS.index(name)]
+
+    @property
+    def mask(self) -> np.array:
+        return self.channel("mask") > 0
+
+    def to_points(self, values: np.array, fill=0) -> np.array:
+        """Scatters per pixel values back to points
+        :param values: (b, h, w, ...) per pixel values, e.g. predictions of a range view model
+        :param fill: value of points outside the image
+        :return: (n, ...) value of the pixel of every point, points sharing a pixel share its value
+        """
+        values = np.asarray(values)
+        flat = values.reshape((-1,) + values.shape[3:])
+        result = flat[np.maximum(self.pixel_index, 0)]
+        result[self.pixel_index < 0] = fill
+        return result
+
+    def cloud_pixel_index(self, idx: int) -> np.array:
+        """Pixels of points of cloud idx as flat indexes into its (h, w) image"""
+        pixels = self.pixel_index[self.point_offsets[idx]:self.point_offsets[idx + 1]]
+        return np.where(pixels >= 0, pixels - idx * self.config.height * self.config.width, -1)
+
+
+def range_images(clouds: List[Union[LidarCloud, np.array]], config: RangeImageConfig = CADC_RANGE_IMAGE,
+                 intensity_column: int = 3) -> RangeImage:
+    """Projects clouds to range images in one pass
+    :param clouds: clouds or (n, 3+) point arrays in the sensor frame
+    :param intensity_column: column of intensity, clouds without it get zero intensity
+    """
+    points = [cloud.points if isinstance(cloud, LidarCloud) else np.asarray(cloud) for cloud in clouds]
+    counts = np.array([len(cloud_points) for cloud_points in points], dtype=np.int64)
+    point_offsets = np.concatenate([[0], np.cumsum(counts)])
+    xyz = np.concatenate([cloud_points[:, :3] for cloud_points in points]) if points else np.empty((0, 3))
+    intensity = np.concatenate([
+        cloud_points[:, intensity_column] if cloud_points.shape[1] > intensity_column else
+        np.zeros(len(cloud_points), dtype=np.float32)
+        for cloud_points in points
+    ]) if points else np.empty(0)
+    batch_index = np.repeat(np.arange(len(points)), counts)
+
+    rows, columns, ranges = pixel_coordinates(xyz, config)
+    height, width = config.shape
+    pixel_index = np.where(rows >= 0, (batch_index * height + rows) * width + columns, -1)
+
+    # nearest point of every pixel, first of each pixel run sorted by range
+    inside = np.flatnonzero(pixel_index >= 0)
+    order = inside[np.lexsort((ranges[inside], pixel_index[inside]))]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = pixel_index[order[1:]] != pixel_index[order[:-1]]
+    winners = order[first]
+    pixels = pixel_index[winners]
+
+    data = np.zeros((len(points), len(RANGE_IMAGE_CHANNELS), height * width), dtype=np.float32)
+    batch, pixel = np.divmod(pixels, height * width)
+    data[batch, :, pixel] = np.column_stack([
+        ranges[winners], intensity[winners], xyz[winners], np.ones(len(winners))
+    ])
+    point_index = np.full(len(points) * height * width, -1, dtype=np.int64)
+    point_index[pixels] = winners
+    return RangeImage(
+        config,
+        data.reshape(len(points), len(RANGE_IMAGE_CHANNELS), height, width),
+        point_index.reshape(len(points), height, width),
+        pixel_index,
+        point_offsets
+    )
+
+
+def range_image(cloud: Union[LidarCloud, np.array], config: RangeImageConfig = CADC_RANGE_IMAGE) -> RangeImage:
+    return range_images([cloud], config)
@@ -1,8 +1,11 @@
+import io
 import numpy as np
 from PIL import Image as PILImage
 
-from typing import List
-from dataclasses import dataclass
+from typing import Callable, List, Dict, Tuple, Union
+from dataclasses import dataclass, field
+
+from .profiling import profile_stage
 
 
 @dataclass
@@ -47,22 +50,166 @@ class BBox:
         ])
 
 
-@dataclass
+def decode_labels(labels: np.array, label_names: List[str]) -> np.array:
+    """Label strings of integer codes into label_names, empty strings for codes of -1"""
+    labels = np.asarray(labels)
+    if not label_names:
+        return np.full(labels.shape, "", dtype=str)
+    names = np.asarray(label_names, dtype=str)
+    return np.where(labels >= 0, names[np.maximum(labels, 0)], "")
+
+
+@dataclass(eq=False)
 class GT3D:
-    boxes: List[BBox]
+    """Boxes of a frame stored as arrays
+    data: (n, 7) array in format [cx, cy, cz, dx, dy, dz, yaw], dx, dy, dz are full box sizes
+    labels: (n,) array of codes into label_names
+    stationary: (n,) bool mask
+    A list of BBox is accepted in place of data and converted"""
+    data: np.array
+    labels: np.array = None
+    label_names: List[str] = None
+    stationary: np.array = None
+
+    def __post_init__(self):
+        if not isinstance(self.data, np.ndarray):
+            boxes = list(self.data)
+            gt = GT3D.from_arrays(
+                np.array([np.concatenate([box.position, box.dimensions, [box.yaw]]) for box in boxes],
+                         dtype=np.float64).reshape(-1, 7),
+                [box.label for box in boxes],
+                np.array([box.stationary for box in boxes], dtype=bool),
+                self.label_names
+            )
+            self.data, self.labels, self.label_names, self.stationary = \
+                gt.data, gt.labels, gt.label_names, gt.stationary
+        if self.label_names is None:
+            self.label_names = []
+        if self.labels is None:
+            self.labels = np.zeros(len(self.data), dtype=np.int32)
+        if self.stationary is None:
+            self.stationary = np.zeros(len(self.data), dtype=bool)
+
+    @staticmethod
+    def from_arrays(data: np.array, labels: List[str], stationary: np.array,
+                    label_names: List[str] = None) -> "GT3D":
+        """
+        :param data: (n, 7) boxes array
+        :param labels: n label strings, encoded into codes of label_names
+        :param stationary: (n,) bool mask
+        :param label_names: vocabulary of labels, unknown labels are appended to a copy of it
+        """
+        label_names = [] if label_names is None else label_names
+        names, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+        codes = np.empty(len(names), dtype=np.int32)
+        for idx, name in enumerate(names):
+            if name not in label_names:
+                label_names = list(label_names) + [str(name)]
+            codes[idx] = label_names.index(name)
+        return GT3D(
+            np.asarray(data, dtype=np.float64).reshape(-1, 7),
+            codes[inverse.reshape(-1)],
+            label_names,
+            np.asarray(stationary, dtype=bool).reshape(-1)
+        )
+
+    def __len__(self):
+        return len(self.data)
+
+    def __eq__(self, other):
+        if not isinstance(other, GT3D):
+            return NotImplemented
+        return np.array_equal(self.data, other.data) and \
+            np.array_equal(self.label_strings, other.label_strings) and \
+            np.array_equal(self.stationary, other.stationary)
+
+    @property
+    def label_strings(self) -> np.array:
+        return decode_labels(self.labels, self.label_names)
+
+    def box(self, idx: int) -> BBox:
+        """BBox with position and dimensions being views into data"""
+        return BBox(
+            self.label_names[self.labels[idx]],
+            self.data[idx, 0:3],
+            self.data[idx, 3:6],
+            float(self.data[idx, 6]),
+            bool(self.stationary[idx])
+        )
+
+    @property
+    def boxes(self) -> List[BBox]:
+        return [self.box(idx) for idx in range(len(self))]
+
+    def select(self, mask: np.array) -> "GT3D":
+        return GT3D(self.data[mask], self.labels[mask], self.label_names, self.stationary[mask])
 
 
 @dataclass
 class Image:
-    data: PILImage
+    """Lazy image handle, source is a path, encoded image bytes or a callable returning them,
+    an HxWxC pixel array or an already decoded PIL image.
+    Pixels are decoded on first access to data, size is read from the file header"""
+    source: Union[str, bytes, Callable[[], bytes], np.array, PILImage.Image]
+    _data: PILImage.Image = field(default=None, init=False, repr=False, compare=False)
+    _size: Tuple[int, int] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if isinstance(self.source, PILImage.Image):
+            self._data = self.source
+        elif isinstance(self.source, np.ndarray):
+            self._size = (self.source.shape[1], self.source.shape[0])
+
+    def _open(self) -> PILImage.Image:
+        with profile_stage("image_open"):
+            if isinstance(self.source, bytes):
+                return PILImage.open(io.BytesIO(self.source))
+            if callable(self.source):
+                return PILImage.open(io.BytesIO(self.source()))
+            return PILImage.open(self.source)
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    @property
+    def data(self) -> PILImage.Image:
+        if self._data is None:
+            if isinstance(self.source, np.ndarray):
+                self._data = PILImage.fromarray(np.asarray(self.source))
+            else:
+                image = self._open()
+                with profile_stage("image_decode"):
+                    image.load()
+                self._data = image
+        return self._data
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        if self._data is not None:
+            return self._data.size
+        if self._size is None:
+            with self._open() as image:
+                self._size = image.size
+        return self._size
 
     @property
     def width(self):
-        return self.data.size[0]
+        return self.size[0]
 
     @property
     def height(self):
-        return self.data.size[1]
+        return self.size[1]
+
+    def to_numpy(self) -> np.array:
+        if isinstance(self.source, np.ndarray):
+            return self.source
+        return np.asarray(self.data)
+
+    def release(self):
+        """Drop decoded pixels, next access decodes the source again"""
+        if not isinstance(self.source, PILImage.Image):
+            self._data = None
 
 
 @dataclass
@@ -78,6 +225,14 @@ class Camera:
     transformations: List[Transform]
     image: Image
 
+    @property
+    def extrinsics(self) -> Transform:
+        """Lidar to camera transform among transformations, None if it is not loaded"""
+        for transform in self.transformations:
+            if transform.name == self.camera_name + "_extrinsics":
+                return transform
+        return None
+
 
 @dataclass
 class LidarCloud:
@@ -112,3 +267,4 @@ class Scene:
     cameras: List[Camera]
     lidar_cloud: LidarCloud
     gt3d: GT3D
+    cache: Dict = field(default_factory=dict, repr=False, compare=False)
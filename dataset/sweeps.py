@@ -0,0 +1,219 @@
+import os
+import json
+import yaml
+
+import numpy as np
+from collections import OrderedDict
+from typing import List, Callable, Iterable
+from dataclasses import dataclass
+
+from geometry.transformations import (
+    euler_rotation_matrices, make_transforms, compose_transforms,
+    invert_transforms, transform_points
+)
+from .structures import SceneID, RideID
+from .cadc import CadcDataset, CadcLidarCloud, camera_dir, list_rides, list_scene_ids
+
+
+LIDAR_PERIOD = 0.1
+EARTH_RADIUS = 6378137.0
+
+# columns of labeled/novatel/data/*.txt
+NOVATEL_FIELDS = [
+    "latitude", "longitude", "altitude", "undulation",
+    "latitude_std", "longitude_std", "altitude_std",
+    "roll", "pitch", "azimuth", "roll_std", "pitch_std", "azimuth_std",
+    "ins_status", "position_type", "extended_status", "seconds_since_update"
+]
+
+
+def read_timestamps(path) -> np.array:
+    """
+    :param path: timestamps.txt with one 'YYYY-MM-DD hh:mm:ss.nnnnnnnnn' line per frame
+    :return: (n,) float64 seconds since the first frame
+    """
+    with open(path) as fr:
+        lines = [line.strip() for line in fr if line.strip()]
+    stamps = np.array(lines, dtype="datetime64[ns]")
+    return (stamps - stamps[:1]).astype(np.int64) / 1e9
+
+
+def read_novatel(ride_path) -> np.array:
+    """
+    :param ride_path: ride directory
+    :return: (n, len(NOVATEL_FIELDS)) array of per frame novatel records, None if the ride has none
+    """
+    data_path = os.path.join(ride_path, "labeled", "novatel", "data")
+    if not os.path.isdir(data_path):
+        return None
+    records = []
+    for file_name in sorted(os.listdir(data_path)):
+        with open(os.path.join(data_path, file_name)) as fr:
+            records.append(np.array(fr.read().split()[:len(NOVATEL_FIELDS)], dtype=np.float64))
+    return np.stack(records) if records else None
+
+
+def novatel_poses(novatel: np.array, lidar2gpsimu: np.array = None) -> np.array:
+    """Lidar poses in a local east-north-up frame placed at the first record
+    :param novatel: (n, len(NOVATEL_FIELDS)) records, angles in degrees, azimuth clockwise from north
+    :param lidar2gpsimu: (4, 4) lidar to gps/imu transform, identity by default
+    :return: (n, 4, 4) lidar to local frame transforms
+    """
+    lat = np.radians(novatel[:, NOVATEL_FIELDS.index("latitude")])
+    lon = np.radians(novatel[:, NOVATEL_FIELDS.index("longitude")])
+    alt = novatel[:, NOVATEL_FIELDS.index("altitude")] + novatel[:, NOVATEL_FIELDS.index("undulation")]
+    # tangent plane approximation, rides span a few kilometers at most
+    translations = np.stack([
+        EARTH_RADIUS * np.cos(lat[0]) * (lon - lon[0]),
+        EARTH_RADIUS * (lat - lat[0]),
+        alt - alt[0]
+    ], axis=1)
+    # imu frame is x right, y forward, z up
+    angles = np.radians(np.stack([
+        -novatel[:, NOVATEL_FIELDS.index("azimuth")],
+        novatel[:, NOVATEL_FIELDS.index("pitch")],
+        novatel[:, NOVATEL_FIELDS.index("roll")]
+    ], axis=1))
+    poses = make_transforms(euler_rotation_matrices(angles, 'zxy'), translations)
+    if lidar2gpsimu is not None:
+        poses = compose_transforms(poses, lidar2gpsimu)
+    return poses
+
+
+def read_lidar2gpsimu(calib_path) -> np.array:
+    """(4, 4) lidar to gps/imu transform from extrinsics.yaml, None if it is not there"""
+    extrinsics_path = os.path.join(calib_path, "extrinsics.yaml")
+    if not os.path.isfile(extrinsics_path):
+        return None
+    with open(extrinsics_path) as fr:
+        data = yaml.load(fr, yaml.SafeLoader)
+    if "T_LIDAR_GPSIMU" not in data:
+        return None
+    return invert_transforms(np.array(data["T_LIDAR_GPSIMU"], dtype=np.float64))
+
+
+def read_ride_motion(ride_path, calib_path, use_poses: bool = True):
+    """
+    :return: (n,) lidar timestamps in seconds, nominal 10 Hz if the ride has no timestamps,
+        and (n, 4, 4) lidar poses or None
+    """
+    n_frames = len(list_scene_ids(ride_path))
+    timestamps_path = os.path.join(ride_path, "labeled", "lidar_points", "timestamps.txt")
+    if os.path.isfile(timestamps_path):
+        times = read_timestamps(timestamps_path)[:n_frames]
+    else:
+        times = np.arange(n_frames) * LIDAR_PERIOD
+    poses = None
+    if use_poses:
+        novatel = read_novatel(ride_path)
+        if novatel is not None and len(novatel) >= n_frames:
+            poses = novatel_poses(novatel[:n_frames], read_lidar2gpsimu(calib_path))
+    return times, poses
+
+
+@dataclass
+class MultiSweepLidarCloud(CadcLidarCloud):
+    """Current sweep followed by past sweeps in its frame,
+    columns are x, y, z, intensity and time lag to the current sweep in seconds"""
+
+    @property
+    def time_lag(self):
+        return self.points[:, 4]
+
+
+def merge_sweeps(clouds: List[np.array], times: np.array, poses: np.array = None) -> MultiSweepLidarCloud:
+    """
+    :param clouds: sweeps of shape (n_i, 4), current sweep last
+    :param times: (k,) timestamps of sweeps in seconds
+    :param poses: (k, 4, 4) lidar poses, past sweeps are moved to the current frame when given
+    """
+    merged = np.empty((sum(len(cloud) for cloud in clouds), 5), dtype=np.float32)
+    start = 0
+    for idx in reversed(range(len(clouds))):
+        cloud = clouds[idx]
+        chunk = merged[start:start + len(cloud)]
+        chunk[:, :4] = cloud[:, :4]
+        if poses is not None and idx != len(clouds) - 1:
+            transform = compose_transforms(invert_transforms(poses[-1]), poses[idx])
+            transform_points(chunk[:, :3], transform, out=chunk[:, :3])
+        chunk[:, 4] = times[-1] - times[idx]
+        start += len(cloud)
+    return MultiSweepLidarCloud(merged)
+
+
+class SweepBuffer:
+    """Rolling buffer of the last sweeps of a ride, every sweep is read once
+    while frames are visited in order"""
+
+    def __init__(self, capacity: int, load: Callable[[int], np.array]):
+        self.capacity = capacity
+        self.load = load
+        self.sweeps = OrderedDict()
+        self.reads = 0
+
+    def get(self, frame: int) -> np.array:
+        if frame not in self.sweeps:
+            self.sweeps[frame] = self.load(frame)
+            self.reads += 1
+            while len(self.sweeps) > self.capacity:
+                self.sweeps.popitem(last=False)
+        return self.sweeps[frame]
+
+    def window(self, frame: int, num_sweeps: int) -> List[np.array]:
+        frames = range(max(frame - num_sweeps + 1, 0), frame + 1)
+        for stale in [key for key in self.sweeps if key < frames.start or key > frame]:
+            del self.sweeps[stale]
+        return [self.get(idx) for idx in frames]
+
+
+def lazy_create_multisweep_from_path(path, num_sweeps: int = 3, grep: Callable = None,
+                                     cameras: Iterable[int] = None, use_poses: bool = True):
+    """Scenes as in CadcDataset.lazy_create_from_path with lidar cloud being a MultiSweepLidarCloud
+    of the frame and up to num_sweeps - 1 previous sweeps of the same ride
+    :param use_poses: motion compensate past sweeps with novatel poses when the ride has them
+    """
+    for date in sorted(os.listdir(path)):
+        date_path = os.path.join(path, date)
+        if not os.path.isdir(date_path):
+            continue
+
+        calib_path = os.path.join(date_path, "calib")
+        cam2calib = CadcDataset.read_calib(calib_path)
+        cam2extrinsics = CadcDataset.read_extrinsics(calib_path, cam2calib)
+
+        for ride in list_rides(date_path):
+            ride_path = os.path.join(date_path, ride)
+            ride_id = RideID(date, ride)
+            scene_ids = list_scene_ids(ride_path)
+            selected = [idx for idx, scene_id in enumerate(scene_ids)
+                        if not grep or grep(SceneID(ride_id, scene_id))]
+            if not selected:
+                continue
+
+            with open(os.path.join(ride_path, "3d_ann.json")) as fr:
+                cuboids = json.load(fr)
+            times, poses = read_ride_motion(ride_path, calib_path, use_poses)
+            lidar_path = os.path.join(ride_path, "labeled", "lidar_points", "data")
+            buffer = SweepBuffer(num_sweeps, lambda frame: CadcLidarCloud.from_binary(
+                os.path.join(lidar_path, scene_ids[frame] + ".bin")).points)
+
+            for scene_idx in selected:
+                scene_id = scene_ids[scene_idx]
+                first = max(scene_idx - num_sweeps + 1, 0)
+                cloud = merge_sweeps(
+                    buffer.window(scene_idx, num_sweeps),
+                    times[first:scene_idx + 1],
+                    None if poses is None else poses[first:scene_idx + 1]
+                )
+                yield CadcDataset.build_scene(
+                    SceneID(ride_id, scene_id),
+                    cam2calib,
+                    [
+                        os.path.join(ride_path, "labeled", camera_dir(camera_idx), "data", scene_id + ".png")
+                        for camera_idx in range(CadcDataset.NUMBER_OF_CAMERAS)
+                    ],
+                    cloud,
+                    cuboids[scene_idx]['cuboids'],
+                    cameras,
+                    cam2extrinsics=cam2extrinsics
+                )
@@ -0,0 +1,106 @@
+import os
+import json
+import shutil
+import yaml
+
+import numpy as np
+from PIL import Image as PILImage
+from typing import Dict, List, Tuple
+
+from .cadc import CadcDataset, camera_dir
+
+
+SYNTHETIC_RIDES = {"2018_03_06": ["0001", "0002"], "2018_03_07": ["0001"]}
+CAMERA_NAMES = ["camera_F", "camera_FR", "camera_RF", "camera_RB", "camera_B", "camera_LB", "camera_LF", "camera_FL"]
+
+# lidar x forward, y left, z up to camera x right, y down, z forward
+_CAMERA_AXES = np.array([[0, 0, 1], [-1, 0, 0], [0, -1, 0]], dtype=np.float64)
+
+
+def synthetic_cuboid(frame: int, box: int) -> Dict:
+    return {
+        "uuid": "%d-%d" % (frame, box),
+        "label": "Car" if box % 2 == 0 else "Pedestrian",
+        "position": {"x": float(frame + box), "y": -float(box), "z": 0.5},
+        "dimensions": {"x": 4.0, "y": 2.0, "z": 1.5},
+        "yaw": 0.1 * box,
+        "stationary": box % 2 == 0,
+        "camera_used": 0,
+        "attributes": {},
+        "points_count": 10 * box
+    }
+
+
+def write_synthetic_calib(calib_path: str, image_size: Tuple[int, int]):
+    """Pinhole cameras looking around the car every 45 degrees, in the CADC calib layout"""
+    os.makedirs(calib_path, exist_ok=True)
+    width, height = image_size
+    extrinsics = {}
+    for camera_idx, camera_name in enumerate(CAMERA_NAMES):
+        focal = float(width)
+        with open(os.path.join(calib_path, str(camera_idx).rjust(2, "0") + ".yaml"), "w") as fw:
+            yaml.safe_dump({
+                "camera_name": camera_name,
+                "image_width": width,
+                "image_height": height,
+                "camera_matrix": {"rows": 3, "cols": 3,
+                                  "data": [focal, 0.0, width / 2, 0.0, focal, height / 2, 0.0, 0.0, 1.0]},
+            }, fw)
+        yaw = -np.pi / 4 * camera_idx
+        rot_z = np.array([[np.cos(yaw), -np.sin(yaw), 0], [np.sin(yaw), np.cos(yaw), 0], [0, 0, 1]])
+        cam2lidar = np.eye(4)
+        cam2lidar[:3, :3] = rot_z @ _CAMERA_AXES.T
+        extrinsics["T_LIDAR_CAM" + str(camera_idx).rjust(2, "0")] = cam2lidar.tolist()
+    with open(os.path.join(calib_path, "extrinsics.yaml"), "w") as fw:
+        yaml.safe_dump(extrinsics, fw)
+
+
+def generate_synthetic_cadc(
+        root: str,
+        rides: Dict[str, List[str]] = None,
+        frames: int = 3,
+        points: int = 64,
+        image_size: Tuple[int, int] = (16, 8),
+        calib_source: str = None,
+        seed: int = 0
+) -> str:
+    """Writes a CADC shaped dataset with random sweeps, flat color images and 3d_ann.json
+    where frame f has f + 1 cuboids. Images of camera c in frame f are filled with c * 10 + f
+    :param rides: ride ids by date, SYNTHETIC_RIDES by default
+    :param points: points per sweep
+    :param image_size: (width, height) of images
+    :param calib_source: calib directory copied to every date, synthetic calibration is written otherwise
+    :return: root
+    """
+    rides = SYNTHETIC_RIDES if rides is None else rides
+    rng = np.random.default_rng(seed)
+    for date, date_rides in rides.items():
+        calib_path = os.path.join(root, date, "calib")
+        if calib_source is None:
+            write_synthetic_calib(calib_path, image_size)
+        else:
+            shutil.copytree(calib_source, calib_path)
+        for ride in date_rides:
+            ride_path = os.path.join(root, date, ride)
+            labeled_path = os.path.join(ride_path, "labeled")
+            lidar_data = os.path.join(labeled_path, "lidar_points", "data")
+            os.makedirs(lidar_data, exist_ok=True)
+            image_dirs = [
+                os.path.join(labeled_path, camera_dir(camera_idx), "data")
+                for camera_idx in range(CadcDataset.NUMBER_OF_CAMERAS)
+            ]
+            for image_dir in image_dirs:
+                os.makedirs(image_dir, exist_ok=True)
+
+            annotations = []
+            for frame in range(frames):
+                frame_name = str(frame).rjust(10, "0")
+                sweep = rng.uniform(-20, 20, (points, 4)).astype(np.float32)
+                sweep.tofile(os.path.join(lidar_data, frame_name + ".bin"))
+                for camera_idx, image_dir in enumerate(image_dirs):
+                    pixels = np.full(image_size[::-1] + (3,), camera_idx * 10 + frame, dtype=np.uint8)
+                    PILImage.fromarray(pixels).save(os.path.join(image_dir, frame_name + ".png"))
+                annotations.append({"cuboids": [synthetic_cuboid(frame, box) for box in range(frame + 1)]})
+            with open(os.path.join(ride_path, "3d_ann.json"), "w") as fw:
+                json.dump(annotations, fw)
+    return root
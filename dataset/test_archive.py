@@ -0,0 +1,103 @@
+import os
+import shutil
+import zipfile
+import numpy as np
+
+from . import archive
+from .cadc import CadcDataset
+from .archive import ZipIndex, ArchiveCadcDataset, lazy_create_from_archives, ZIP_INDEX_SUFFIX
+
+
+def zip_tree(source, archive_path, compression):
+    with zipfile.ZipFile(archive_path, "w", compression) as archive:
+        for dir_path, _, file_names in os.walk(source):
+            for file_name in sorted(file_names):
+                path = os.path.join(dir_path, file_name)
+                archive.write(path, os.path.relpath(path, os.path.dirname(source)))
+
+
+def make_archives(dataset_path, archives_path, compression=zipfile.ZIP_STORED):
+    for date in os.listdir(dataset_path):
+        date_path = os.path.join(dataset_path, date)
+        os.makedirs(os.path.join(archives_path, date))
+        zip_tree(os.path.join(date_path, "calib"), os.path.join(archives_path, date, "calib.zip"), compression)
+        for ride in os.listdir(date_path):
+            if ride == "calib":
+                continue
+            os.makedirs(os.path.join(archives_path, date, ride))
+            shutil.copy(os.path.join(date_path, ride, "3d_ann.json"), os.path.join(archives_path, date, ride))
+            zip_tree(os.path.join(date_path, ride, "labeled"),
+                     os.path.join(archives_path, date, ride, "labeled.zip"), compression)
+
+
+def test_zip_index(tmp_path):
+    archive_path = str(tmp_path / "data.zip")
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("a/stored.bin", b"x" * 100)
+        archive.writestr("a/deflated.txt", b"hello " * 100, zipfile.ZIP_DEFLATED)
+
+    index = ZipIndex.load_or_build(archive_path)
+    assert os.path.isfile(archive_path + ZIP_INDEX_SUFFIX)
+    assert index.read("a/stored.bin") == b"x" * 100
+    assert index.read("a/deflated.txt") == b"hello " * 100
+    assert index.names("a/d") == ["a/deflated.txt"]
+    assert ZipIndex.load_or_build(archive_path).members == index.members
+
+    with zipfile.ZipFile(archive_path, "a") as archive:
+        archive.writestr("b.txt", b"new")
+    os.utime(archive_path, ns=(0, 0))
+    assert ZipIndex.load_or_build(archive_path).read("b.txt") == b"new"
+
+    # truncated, unparsable or other version caches are rebuilt
+    index_path = archive_path + ZIP_INDEX_SUFFIX
+    with open(index_path) as fr:
+        content = fr.read()
+    for broken in [content[:len(content) // 2], "", content.replace('"version": 1', '"version": 0')]:
+        with open(index_path, "w") as fw:
+            fw.write(broken)
+        assert ZipIndex.load_or_build(archive_path).read("b.txt") == b"new"
+        with open(index_path) as fr:
+            assert fr.read() == content
+
+
+def test_archive_dataset_matches_directory(synthetic_dataset_path, tmp_path):
+    archives_path = str(tmp_path / "archives")
+    make_archives(synthetic_dataset_path, archives_path, zipfile.ZIP_DEFLATED)
+
+    expected = CadcDataset.create_from_path(synthetic_dataset_path)
+    scenes = list(lazy_create_from_archives(archives_path))
+    assert [str(scene.scene_id) for scene in scenes] == [str(scene.scene_id) for scene in expected]
+    for scene, other in zip(scenes, expected):
+        assert np.array_equal(scene.lidar_cloud.points, other.lidar_cloud.points)
+        assert scene.gt3d == other.gt3d
+        assert np.array_equal(scene.cameras[3].image.to_numpy(), other.cameras[3].image.to_numpy())
+        assert np.array_equal(scene.cameras[3].extrinsics.data, other.cameras[3].extrinsics.data)
+        assert np.array_equal(scene.cameras[3].intrinsics.data, other.cameras[3].intrinsics.data)
+
+
+def test_archive_dataset_random_access(synthetic_dataset_path, tmp_path):
+    archives_path = str(tmp_path / "archives")
+    make_archives(synthetic_dataset_path, archives_path)
+
+    dataset = ArchiveCadcDataset(archives_path, cameras=[0], mmap_lidar=True)
+    assert len(dataset) == 9
+    assert [str(ride) for ride in dataset.ride_ids] == ["2018_03_06_0001", "2018_03_06_0002", "2018_03_07_0001"]
+    scene = dataset["2018_03_06_0002_0000000002"]
+    assert isinstance(scene.lidar_cloud.points, np.memmap)
+    assert len(scene.gt3d) == 3
+    assert scene.cameras[0].image.size == (16, 8)
+    assert scene.cameras[0].image.to_numpy()[0, 0, 0] == 2
+
+
+def test_archive_dataset_cuboids_bounded(synthetic_dataset_path, tmp_path, monkeypatch):
+    archives_path = str(tmp_path / "archives")
+    make_archives(synthetic_dataset_path, archives_path)
+    monkeypatch.setattr(archive, "CUBOID_CACHE_RIDES", 2)
+
+    dataset = ArchiveCadcDataset(archives_path, cameras=[])
+    first, second, third = dataset.ride_ids
+    for ride_id in [first, second, first, third]:
+        dataset.ride_cuboids(ride_id)
+    assert list(dataset._cuboids) == [str(first), str(third)]
+    assert [str(scene.scene_id) for scene in dataset] == [str(scene_id) for scene_id in dataset.scene_ids]
+    assert len(dataset._cuboids) == 2
@@ -1,5 +1,12 @@
+import os
+import json
+import shutil
 import numpy as np
-from .cadc import CadcDataset, CadcBBox, CadcLidarCloud, CadcIntrinsics
+from .cadc import (
+    CadcDataset, CadcBBox, CadcLidarCloud, CadcIntrinsics,
+    CadcIndex, IndexedCadcDataset, CADC_LABELS, annotation_offsets
+)
+from .structures import GT3D
 
 
 def test_bbox_load(cuboid):
@@ -17,6 +24,17 @@ def test_bbox_load(cuboid):
     assert bbox.stationary is False
 
 
+def test_bboxes_bulk_load(cuboid):
+    other = dict(cuboid, label="Pedestrian", stationary=True, yaw=-1.0)
+    gt = CadcBBox.from_cuboids([cuboid, other])
+    assert gt.data.shape == (2, 7)
+    assert list(gt.label_strings) == ["Truck", "Pedestrian"]
+    assert list(gt.stationary) == [False, True]
+    assert np.all(gt.box(0).position == CadcBBox.from_cuboid(cuboid).position)
+    assert gt == GT3D([CadcBBox.from_cuboid(cuboid), CadcBBox.from_cuboid(other)], label_names=CADC_LABELS)
+    assert len(CadcBBox.from_cuboids([])) == 0
+
+
 def test_pcl_load(pcl_path):
     pcl = CadcLidarCloud.from_binary(pcl_path)
     assert pcl.points.shape == (2, 4)
@@ -78,3 +96,86 @@ def test_cadc_scenes(dataset_path):
 
     gt = scene.gt3d
     assert len(gt.boxes) != 0
+
+
+def test_annotation_offsets(synthetic_dataset_path):
+    ann_path = os.path.join(synthetic_dataset_path, "2018_03_06", "0001", "3d_ann.json")
+    with open(ann_path) as fr:
+        frames = json.load(fr)
+    offsets = annotation_offsets(ann_path)
+    assert len(offsets) == len(frames)
+    with open(ann_path, "rb") as fr:
+        for (offset, length), frame in zip(offsets, frames):
+            fr.seek(offset)
+            assert json.loads(fr.read(length)) == frame
+
+
+def test_cadc_index_persisted(synthetic_dataset_path):
+    index = CadcIndex.load_or_build(synthetic_dataset_path)
+    assert CadcIndex.exists(synthetic_dataset_path)
+    assert len(index.rides) == 3
+    assert len(index.scenes) == 9
+    assert CadcIndex.load(CadcIndex.index_path(synthetic_dataset_path)) == index
+
+    scenes = CadcDataset.get_scenes_info_list(synthetic_dataset_path, use_index=True)
+    assert [str(scene) for scene in scenes] == \
+        [str(scene) for scene in CadcDataset.get_scenes_info_list(synthetic_dataset_path)]
+    assert len(CadcDataset.get_rides_info_list(synthetic_dataset_path, use_index=True)) == 3
+
+
+def test_cadc_index_stale(synthetic_dataset_path):
+    index = CadcIndex.load_or_build(synthetic_dataset_path)
+    assert index.is_valid(synthetic_dataset_path)
+
+    # rewritten annotations move frame offsets
+    ann_path = os.path.join(synthetic_dataset_path, "2018_03_06", "0001", "3d_ann.json")
+    with open(ann_path) as fr:
+        frames = json.load(fr)
+    frames[0]["cuboids"][0]["label"] = "Truck"
+    with open(ann_path, "w") as fw:
+        json.dump(frames, fw, indent=1)
+    assert not index.is_valid(synthetic_dataset_path)
+    assert CadcIndex.load_valid(synthetic_dataset_path) is None
+    dataset = IndexedCadcDataset(synthetic_dataset_path)
+    assert dataset.index.is_valid(synthetic_dataset_path)
+    assert dataset[0].gt3d.label_strings.tolist() == ["Truck"]
+
+    # a removed ride is not listed from the old index
+    shutil.rmtree(os.path.join(synthetic_dataset_path, "2018_03_07", "0001"))
+    assert len(CadcDataset.get_rides_info_list(synthetic_dataset_path, use_index=True)) == 2
+    assert len(CadcDataset.get_scenes_info_list(synthetic_dataset_path, use_index=True)) == 6
+
+
+def test_indexed_cadc_dataset(synthetic_dataset_path):
+    dataset = IndexedCadcDataset(synthetic_dataset_path)
+    assert len(dataset) == 9
+
+    scene = dataset[4]
+    assert str(scene.scene_id) == "2018_03_06_0002_0000000001"
+    assert len(scene.gt3d.boxes) == 2
+    assert len(scene.cameras) == 8
+
+    same_scene = dataset[scene.scene_id]
+    assert np.all(same_scene.lidar_cloud.points == scene.lidar_cloud.points)
+    assert str(dataset["2018_03_07_0001_0000000002"].scene_id) == "2018_03_07_0001_0000000002"
+
+    lazy_scenes = list(CadcDataset.lazy_create_from_path(synthetic_dataset_path))
+    assert [str(s.scene_id) for s in lazy_scenes] == [str(s) for s in dataset.scene_ids]
+    for lazy_scene, indexed_scene in zip(lazy_scenes, dataset):
+        assert lazy_scene.gt3d == indexed_scene.gt3d
+        assert np.all(lazy_scene.lidar_cloud.points == indexed_scene.lidar_cloud.points)
+
+
+def test_pcl_load_mmap(pcl_path):
+    pcl = CadcLidarCloud.from_binary(pcl_path, mmap=True)
+    assert isinstance(pcl.points, np.memmap)
+    assert np.all(pcl.points == CadcLidarCloud.from_binary(pcl_path).points)
+
+
+def test_pcl_load_subset(pcl_path):
+    for mmap in [False, True]:
+        pcl = CadcLidarCloud.from_binary(pcl_path, mmap=mmap, rows=(1, 2), columns=slice(0, 3))
+        assert pcl.points.shape == (1, 3)
+        assert np.all(pcl.points == np.array([[0.0, -1.5, 2.3]], dtype=np.float32))
+    assert CadcLidarCloud.from_binary(pcl_path, mmap=True, rows=(2, 5)).points.shape == (0, 4)
+    assert CadcLidarCloud.from_binary(pcl_path, columns=[3]).points.shape == (2, 1)
@@ -0,0 +1,57 @@
+import pickle
+import numpy as np
+
+from .cadc import IndexedCadcDataset
+from .collate import BatchLoader, SharedBatch, collate, collate_shared
+
+
+def test_collate(synthetic_dataset_path):
+    dataset = IndexedCadcDataset(synthetic_dataset_path, cameras=[0, 2])
+    scenes = [dataset[idx] for idx in range(3)]
+    batch = collate(scenes, images=True)
+
+    assert batch.batch_size == 3
+    assert batch.points.shape == (sum(len(scene.lidar_cloud.points) for scene in scenes), 4)
+    assert np.array_equal(batch.scene_points(1), scenes[1].lidar_cloud.points)
+    assert np.array_equal(np.bincount(batch.batch_index), [64, 64, 64])
+    assert batch.boxes.shape == (3, 3, 7)
+    assert batch.box_mask.sum(axis=1).tolist() == [1, 2, 3]
+    assert batch.box_labels[0].tolist() == [0, -1, -1]
+    assert np.allclose(batch.gt3d(2).data, scenes[2].gt3d.data)
+    assert list(batch.gt3d(2).label_strings) == list(scenes[2].gt3d.label_strings)
+    assert batch.intrinsics.shape == (3, 2, 3, 3)
+    assert np.allclose(batch.extrinsics[1, 1], scenes[1].cameras[1].extrinsics.data)
+    assert batch.images.shape == (3, 2, 8, 16, 3)
+    assert batch.images[2, 1, 0, 0, 0] == 22
+
+
+def test_shared_batch(synthetic_dataset_path):
+    dataset = IndexedCadcDataset(synthetic_dataset_path, cameras=[0])
+    scenes = [dataset[idx] for idx in range(4)]
+    handle = pickle.loads(pickle.dumps(collate_shared(scenes)))
+    assert isinstance(handle, SharedBatch)
+    batch = handle.open()
+    expected = collate(scenes)
+    assert np.array_equal(batch.points, expected.points)
+    assert np.array_equal(batch.boxes, expected.boxes)
+    assert np.allclose(batch.gt3d(3).data, scenes[3].gt3d.data)
+    batch.close()
+    assert batch.points is None
+
+
+def test_batch_loader(synthetic_dataset_path):
+    dataset = IndexedCadcDataset(synthetic_dataset_path, cameras=[0])
+    loader = BatchLoader(dataset, workers=2, batch_size=4, use_processes=True)
+    assert len(loader) == 3
+    batches = list(loader)
+    assert [batch.batch_size for batch in batches] == [4, 4, 1]
+    assert batches[1].scene_ids == [str(scene_id) for scene_id in dataset.scene_ids[4:8]]
+    assert np.array_equal(batches[2].scene_points(0), dataset[8].lidar_cloud.points)
+
+    threaded = list(BatchLoader(dataset, workers=2, batch_size=4, drop_last=True))
+    assert len(threaded) == 2
+    assert np.array_equal(threaded[1].points, batches[1].points)
+
+    stopped = iter(BatchLoader(dataset, workers=2, batch_size=2, in_flight=3, use_processes=True))
+    next(stopped)
+    stopped.close()
@@ -0,0 +1,161 @@
+import os
+import zipfile
+import threading
+import pytest
+
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from .download import (
+    DATA, BASE_LINK, CHECKSUMS, PART_SUFFIX,
+    DownloadError, download, extract, fetch, plan_downloads, sha256sum
+)
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as fr:
+            content = fr.read()
+        range_header = self.headers.get("Range")
+        RangeHandler.requests.append((self.path, range_header))
+        if range_header:
+            start = int(range_header.split("=")[1].split("-")[0])
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */%d" % len(content))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, len(content) - 1, len(content)))
+            content = content[start:]
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+@pytest.fixture
+def server_root(tmp_path):
+    root = tmp_path / "remote"
+    date = root / "2018_03_06"
+    (date / "0001").mkdir(parents=True)
+    with zipfile.ZipFile(date / "calib.zip", "w") as archive:
+        archive.writestr("calib/00.yaml", "camera_matrix: []\n")
+    with zipfile.ZipFile(date / "0001" / "labeled.zip", "w") as archive:
+        archive.writestr("labeled/lidar_points/data/0000000000.bin", os.urandom(4096))
+        archive.writestr("labeled/lidar_points/timestamps.txt", "0\n")
+    (date / "0001" / "3d_ann.json").write_bytes(b"[]" + b" " * 1000)
+
+    RangeHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RangeHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield root, "http://127.0.0.1:%d/" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_and_skip(server_root, tmp_path):
+    root, url = server_root
+    data = {BASE_LINK: "https://unused/", DATA: {"2018_03_06": ["0001"]}}
+    base_dir = str(tmp_path / "local")
+
+    tasks = download(base_dir, data, workers=3, base_link=url)
+    assert len(tasks) == 3
+    cadc = os.path.join(base_dir, "cadc", "2018_03_06")
+    assert os.path.exists(os.path.join(cadc, "calib", "00.yaml"))
+    assert os.path.getsize(os.path.join(cadc, "0001", "labeled", "lidar_points", "data", "0000000000.bin")) == 4096
+    assert os.path.exists(os.path.join(cadc, "0001", "3d_ann.json"))
+    assert not os.path.exists(os.path.join(cadc, "0001", "labeled.zip"))
+    assert len(RangeHandler.requests) == 3
+
+    download(base_dir, data, base_link=url)
+    assert len(RangeHandler.requests) == 3
+
+
+def test_fetch_resume(server_root, tmp_path):
+    root, url = server_root
+    source = root / "2018_03_06" / "0001" / "3d_ann.json"
+    target = str(tmp_path / "3d_ann.json")
+    with open(target + PART_SUFFIX, "wb") as fw:
+        fw.write(source.read_bytes()[:100])
+
+    fetch(url + "2018_03_06/0001/3d_ann.json", target, sha256=sha256sum(str(source)))
+    assert RangeHandler.requests[-1][1] == "bytes=100-"
+    assert open(target, "rb").read() == source.read_bytes()
+    assert not os.path.exists(target + PART_SUFFIX)
+
+
+def test_fetch_complete_or_overlong_part(server_root, tmp_path):
+    root, url = server_root
+    source = root / "2018_03_06" / "0001" / "3d_ann.json"
+    target = str(tmp_path / "3d_ann.json")
+
+    with open(target + PART_SUFFIX, "wb") as fw:
+        fw.write(source.read_bytes())
+    fetch(url + "2018_03_06/0001/3d_ann.json", target)
+    assert RangeHandler.requests == [("/2018_03_06/0001/3d_ann.json", "bytes=%d-" % source.stat().st_size)]
+    assert open(target, "rb").read() == source.read_bytes()
+
+    with open(target + PART_SUFFIX, "wb") as fw:
+        fw.write(source.read_bytes() + b"stale tail")
+    fetch(url + "2018_03_06/0001/3d_ann.json", target)
+    assert RangeHandler.requests[-1] == ("/2018_03_06/0001/3d_ann.json", None)
+    assert open(target, "rb").read() == source.read_bytes()
+    assert not os.path.exists(target + PART_SUFFIX)
+
+
+def test_checksum_mismatch(server_root, tmp_path):
+    root, url = server_root
+    with pytest.raises(DownloadError):
+        fetch(url + "2018_03_06/0001/3d_ann.json", str(tmp_path / "ann.json"), sha256="0" * 64)
+    with pytest.raises(DownloadError):
+        fetch(url + "missing.json", str(tmp_path / "missing.json"), retries=0)
+
+
+def test_plan_downloads():
+    data = {
+        BASE_LINK: "http://host/cadc/",
+        DATA: {"2018_03_06": ["0001", "0002"]},
+        CHECKSUMS: {"2018_03_06/0002/labeled.zip": "abc"}
+    }
+    tasks = plan_downloads("/data", data)
+    assert [task.url for task in tasks][:2] == [
+        "http://host/cadc/2018_03_06/calib.zip", "http://host/cadc/2018_03_06/0001/3d_ann.json"
+    ]
+    assert [task.extract for task in tasks] == [True, False, True, False, True]
+    assert tasks[-1].sha256 == "abc" and tasks[-1].path == "/data/cadc/2018_03_06/0002/labeled.zip"
+
+
+def test_extract_rejects_traversal(tmp_path):
+    archive_path = str(tmp_path / "evil.zip")
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("../evil.txt", b"evil")
+        archive.writestr("/abs/evil.txt", b"evil")
+        archive.writestr("ok/../../nested.txt", b"evil")
+    target = tmp_path / "target"
+    extract(archive_path, target)
+    assert not (tmp_path / "evil.txt").exists() and not (tmp_path / "nested.txt").exists()
+    assert sorted(str(path.relative_to(target)) for path in target.rglob("*.txt")) == [
+        "abs/evil.txt", "evil.txt", "ok/nested.txt"
+    ]
+
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    os.symlink(outside, target / "link")
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr("link/evil.txt", b"evil")
+    with pytest.raises(DownloadError):
+        extract(archive_path, target)
+    assert not (outside / "evil.txt").exists()
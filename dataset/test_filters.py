@@ -0,0 +1,117 @@
+import numpy as np
+
+from .structures import LidarCloud
+from .cadc import CadcLidarCloud
+from .filters import (
+    FilterPipeline, FarthestPointSample, GroundRemoval, RandomSample, RangeCrop, SnowRemoval, VoxelDownsample,
+    farthest_point_sample, ground_mask, random_sample, range_mask, snow_mask, voxel_downsample, voxel_means
+)
+
+
+def make_cloud(seed=0, n_ground=500, n_objects=100):
+    rng = np.random.default_rng(seed)
+    ground = np.column_stack([rng.uniform(-20, 20, (n_ground, 2)), rng.normal(-1.7, 0.02, n_ground)])
+    objects = np.column_stack([rng.uniform(-20, 20, (n_objects, 2)), rng.uniform(-1.0, 1.0, n_objects)])
+    xyz = np.concatenate([ground, objects])
+    return np.column_stack([xyz, np.arange(len(xyz))]).astype(np.float32)
+
+
+def test_range_and_ground():
+    points = make_cloud()
+    mask = range_mask(points, (-10, -10, -5, 10, 10, 5))
+    assert np.all(np.abs(points[mask, :2]) < 10)
+    assert np.array_equal(range_mask(points, (-10, -10, 10, 10)), mask)
+
+    ground = ground_mask(points, 0.2)
+    assert ground[:500].mean() > 0.99
+    assert ground[500:].sum() == 0
+
+
+def test_voxel_downsample():
+    points = np.array([[0.1, 0.1, 0.1], [0.2, 0.2, 0.2], [1.5, 0.1, 0.1], [0.3, 0.1, 0.1]])
+    indices, inverse = voxel_downsample(points, 1.0)
+    assert indices.tolist() == [0, 2]
+    assert inverse.tolist() == [0, 0, 1, 0]
+    assert np.allclose(voxel_means(points, inverse, 2)[0], [0.2, 4 / 30, 4 / 30])
+
+    indices, _ = voxel_downsample(np.concatenate([points, points]), 1.0, np.repeat([0, 1], 4))
+    assert indices.tolist() == [0, 2, 4, 6]
+
+
+def test_sampling():
+    points = make_cloud()[:, :3]
+    batch_index = np.repeat([0, 1], [300, 5])
+    indices = random_sample(points[:305], 10, batch_index)
+    assert len(indices) == 20
+    assert len(set(indices[:10].tolist())) == 10 and np.all(indices[:10] < 300)
+    assert np.all((indices[10:] >= 300) & (indices[10:] < 305))
+
+    indices = farthest_point_sample(points[:305], 8, batch_index)
+    assert len(indices) == 16 and indices[0] == 0 and indices[8] == 300
+    assert len(set(indices[:8].tolist())) == 8
+    assert set(indices[8:].tolist()) == set(range(300, 305))
+    # farthest points of the first cloud spread over its extent
+    spread = np.ptp(points[indices[:8], :2], axis=0)
+    assert np.all(spread > 25)
+
+
+def test_pipeline_index_map():
+    clouds = [LidarCloud(make_cloud(seed)) for seed in range(3)]
+    pipeline = FilterPipeline([
+        RangeCrop((-15, -15, -5, 15, 15, 5)), GroundRemoval(), VoxelDownsample((0.5, 0.5, 0.5)), RandomSample(20)
+    ])
+    results = pipeline.filter_clouds(clouds)
+    for cloud, (filtered, indices) in zip(clouds, results):
+        assert len(filtered.points) == 20
+        assert np.array_equal(filtered.points[:, 3], cloud.points[indices, 3])
+        assert np.all(filtered.points[:, 2] > -1.5)
+
+    single, indices = FilterPipeline([FarthestPointSample(16)]).filter_cloud(clouds[0])
+    assert single.points.shape == (16, 4) and np.array_equal(single.points, clouds[0].points[indices])
+
+
+def scan_wall(distance, n_azimuth=100, n_elevation=5):
+    """Returns of a vertical wall sampled at VLP-32C like angular steps"""
+    azimuth, elevation = np.meshgrid(
+        np.radians(0.2) * (np.arange(n_azimuth) - n_azimuth / 2),
+        np.radians(0.33) * np.arange(n_elevation)
+    )
+    return np.column_stack([
+        np.full(azimuth.size, distance), distance * np.tan(azimuth.ravel()), distance * np.tan(elevation.ravel())
+    ])
+
+
+def test_snow_removal():
+    rng = np.random.default_rng(0)
+    walls = np.concatenate([scan_wall(10.0), scan_wall(40.0)])
+    flakes = np.column_stack([rng.uniform(2, 8, (30, 2)), rng.uniform(-1, 1, 30)])
+    xyz = np.concatenate([walls, flakes])
+    intensity = np.concatenate([np.full(len(walls), 0.5), np.full(30, 0.01)])
+    points = np.column_stack([xyz, intensity]).astype(np.float32)
+    n_walls = len(walls)
+
+    removed = snow_mask(points)
+    assert removed[n_walls:].all()
+    assert not removed[:n_walls].any()
+
+    cloud, removed = CadcLidarCloud(points).remove_snow(intensity_threshold=0.1)
+    assert removed[n_walls:].all() and len(cloud.points) == n_walls
+
+    points[:n_walls:7, 3] = 0.01
+    removed = snow_mask(points, points[:, 3], 0.1)
+    assert removed[n_walls:].all() and not removed[:n_walls].any()
+
+    pipeline = FilterPipeline([SnowRemoval(0.1)])
+    results = pipeline.filter_clouds([LidarCloud(points), LidarCloud(points[::-1].copy())])
+    assert [len(indices) for _, indices in results] == [n_walls, n_walls]
+
+
+def test_snow_mask_matches_brute_force():
+    rng = np.random.default_rng(4)
+    points = np.column_stack([rng.uniform(-15, 15, (600, 2)), rng.uniform(-2, 2, 600)]).astype(np.float32)
+    ranges = np.hypot(points[:, 0], points[:, 1])
+    radius = np.maximum(3.0 * ranges * np.radians(0.2) * 20, 0.04)
+    neighbors = (np.linalg.norm(points[:, None] - points[None], axis=-1) <= radius[:, None]).sum(axis=1) - 1
+    removed = snow_mask(points, angular_resolution=np.radians(0.2) * 20, min_neighbors=2)
+    assert 0 < removed.sum() < len(points)
+    assert np.array_equal(removed, neighbors < 2)
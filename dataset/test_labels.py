@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+
+from .cadc import CadcDataset
+from .labels import LabelTable
+from .structures import RideID
+
+
+def test_label_table_matches_scenes(synthetic_dataset_path):
+    table = LabelTable.from_path(synthetic_dataset_path)
+    scenes = CadcDataset.create_from_path(synthetic_dataset_path)
+    assert len(table) == sum(len(scene.gt3d) for scene in scenes) == 18
+    assert np.array_equal(table.boxes, np.concatenate([scene.gt3d.data for scene in scenes]))
+    assert np.array_equal(table.label, np.concatenate([scene.gt3d.label_strings for scene in scenes]))
+    assert np.array_equal(table.frame[:6], [0, 1, 1, 2, 2, 2])
+    assert set(zip(table.date, table.ride)) == {("2018_03_06", "0001"), ("2018_03_06", "0002"), ("2018_03_07", "0001")}
+
+
+def test_label_statistics(synthetic_dataset_path):
+    table = LabelTable.from_path(synthetic_dataset_path)
+    keys, counts = table.count(("date", "label"))
+    assert keys["date"].tolist() == ["2018_03_06", "2018_03_06", "2018_03_07", "2018_03_07"]
+    assert keys["label"].tolist() == ["Car", "Pedestrian", "Car", "Pedestrian"]
+    assert counts.tolist() == [8, 4, 4, 2]
+
+    stats = table.describe("points_count")
+    assert stats.keys["label"].tolist() == ["Car", "Pedestrian"]
+    assert stats.count.tolist() == [12, 6]
+    assert np.allclose(stats.mean, [5, 10])
+    assert np.allclose(stats.min, [0, 10]) and np.allclose(stats.max, [20, 10])
+    assert np.allclose(stats.std[1], 0)
+
+    dimensions = table.describe("dimensions", ("stationary",))
+    assert dimensions.mean.shape == (2, 3)
+    assert np.allclose(dimensions.mean, [4.0, 2.0, 1.5])
+    assert dimensions.rows()[0]["stationary"] is False
+
+
+def test_label_table_vocabulary():
+    frames = [{"cuboids": [{
+        "label": "Sled", "position": {"x": 1, "y": 2, "z": 3}, "dimensions": {"x": 1, "y": 1, "z": 1},
+        "yaw": 0.5, "stationary": True
+    }]}, {"cuboids": []}]
+    table = LabelTable.from_json(json.dumps(frames).encode(), RideID("2019_02_27", "0001"), ["Car"])
+    assert table.label.tolist() == ["Sled"]
+    assert table.points_count.tolist() == [-1]
+    assert np.isnan(table.describe("points_count").mean).all()
+
+    merged = LabelTable.concatenate([table, LabelTable.empty(["Car"])], ["Car"])
+    assert merged.label_names == ["Car", "Sled"]
+    assert merged.label.tolist() == ["Sled"]
@@ -0,0 +1,33 @@
+import numpy as np
+
+from .cadc import IndexedCadcDataset
+from .packed import PackedCadcDataset
+
+
+def test_packed_roundtrip(synthetic_dataset_path, tmp_path):
+    packed = PackedCadcDataset.convert(synthetic_dataset_path, str(tmp_path / "packed"))
+    dataset = IndexedCadcDataset(synthetic_dataset_path)
+    assert len(packed) == len(dataset)
+
+    for original, scene in zip(dataset, packed):
+        assert str(original.scene_id) == str(scene.scene_id)
+        assert np.all(original.lidar_cloud.points == scene.lidar_cloud.points)
+        assert [box.label for box in original.gt3d.boxes] == [box.label for box in scene.gt3d.boxes]
+        assert np.allclose([box.position for box in original.gt3d.boxes],
+                           [box.position for box in scene.gt3d.boxes])
+        assert [camera.camera_name for camera in original.cameras] == \
+            [camera.camera_name for camera in scene.cameras]
+        assert np.all(original.cameras[2].image.to_numpy() == scene.cameras[2].image.to_numpy())
+
+    scene = packed["2018_03_07_0001_0000000002"]
+    assert isinstance(scene.lidar_cloud.points, np.memmap)
+    assert len(scene.gt3d.boxes) == 3
+
+
+def test_packed_resized_images(synthetic_dataset_path, tmp_path):
+    packed = PackedCadcDataset.convert(synthetic_dataset_path, str(tmp_path / "packed"),
+                                       images=True, image_size=(8, 4))
+    scene = packed[1]
+    image = scene.cameras[5].image
+    assert image.size == (8, 4)
+    assert np.all(image.to_numpy() == 51)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from .cadc import IndexedCadcDataset
+from .prefetch import PrefetchLoader, prefetch_from_path
+
+
+def scene_names(scenes):
+    return [str(scene.scene_id) for scene in scenes]
+
+
+def test_prefetch_ordered(synthetic_dataset_path):
+    dataset = IndexedCadcDataset(synthetic_dataset_path)
+    expected = [str(scene_id) for scene_id in dataset.scene_ids]
+    assert scene_names(PrefetchLoader(dataset, workers=3, in_flight=2)) == expected
+
+    scenes = list(PrefetchLoader(dataset, workers=2, use_processes=True, load_images=True))
+    assert scene_names(scenes) == expected
+    assert scenes[0].cameras[0].image.loaded
+    assert np.all(scenes[3].lidar_cloud.points == dataset[3].lidar_cloud.points)
+
+
+def test_prefetch_unordered(synthetic_dataset_path):
+    dataset = IndexedCadcDataset(synthetic_dataset_path)
+    scenes = PrefetchLoader(dataset, keys=[5, 1, 7], workers=3, ordered=False)
+    assert sorted(scene_names(scenes)) == sorted(str(dataset.scene_ids[idx]) for idx in [5, 1, 7])
+
+
+def test_prefetch_early_stop(synthetic_dataset_path):
+    def grep(scene_id):
+        return scene_id.ride_id.date == "2018_03_07"
+
+    loader = iter(prefetch_from_path(synthetic_dataset_path, grep, workers=2, in_flight=1, cameras=[]))
+    scene = next(loader)
+    assert str(scene.scene_id) == "2018_03_07_0001_0000000000"
+    assert scene.cameras == []
+    loader.close()
@@ -0,0 +1,22 @@
+from .profiling import profile_loading, profile_stage, LoaderProfiler
+from .cadc import CadcDataset
+
+
+def test_profile_stage_disabled():
+    with profile_stage("lidar_read", 10) as timer:
+        assert timer is None
+
+
+def test_profile_loading(synthetic_dataset_path):
+    profiler = LoaderProfiler()
+    with profile_loading(profiler):
+        scenes = CadcDataset.create_from_path(synthetic_dataset_path)
+    stages = profiler.summary()
+    assert stages["lidar_read"]["calls"] == len(scenes)
+    assert stages["lidar_read"]["bytes"] == len(scenes) * 64 * 16
+    assert stages["json_parse"]["calls"] == 3
+    assert all(stats["seconds"] >= 0 for stats in stages.values())
+
+    with profile_stage("lidar_read"):
+        pass
+    assert profiler.summary()["lidar_read"]["calls"] == len(scenes)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from .cadc import CadcDataset, IndexedCadcDataset
+from .projection import project_points, project_scene
+
+
+def test_extrinsics_load(synthetic_dataset_path):
+    scene = next(CadcDataset.lazy_create_from_path(synthetic_dataset_path))
+    camera = scene.cameras[0]
+    assert camera.extrinsics.name == "camera_F_extrinsics"
+    assert camera.extrinsics.data.shape == (4, 4)
+    # front camera looks along lidar x axis
+    assert np.allclose(camera.extrinsics.data[:3, :3] @ [1, 0, 0], [0, 0, 1], atol=0.05)
+
+
+def test_project_points():
+    intrinsics = np.array([[[10, 0, 5], [0, 10, 5], [0, 0, 1]]], dtype=np.float32)
+    extrinsics = np.eye(4, dtype=np.float32)[None]
+    points = np.array([[0, 0, 1], [0.2, -0.3, 2], [0, 0, -1], [10, 0, 1]], dtype=np.float32)
+    projection = project_points(points, intrinsics, extrinsics, np.array([[10, 10]]))[0]
+    assert list(projection.indices) == [0, 1]
+    assert np.allclose(projection.pixels, [[5, 5], [6, 3.5]])
+    assert np.allclose(projection.depth, [1, 2])
+
+
+def test_project_scene(synthetic_dataset_path):
+    scene = IndexedCadcDataset(synthetic_dataset_path)[0]
+    projections = project_scene(scene, min_depth=0.5)
+    assert project_scene(scene, min_depth=0.5) is projections
+    assert [projection.camera_name for projection in projections] == \
+        [camera.camera_name for camera in scene.cameras]
+    for projection, camera in zip(projections, scene.cameras):
+        assert np.all(projection.pixels >= 0)
+        assert np.all(projection.pixels < np.array(camera.image.size))
+        assert np.all(projection.depth > 0.5)
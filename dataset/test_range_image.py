@@ -0,0 +1,63 @@
+import numpy as np
+
+from .cadc import CadcLidarCloud
+from .range_image import CADC_RANGE_IMAGE, RangeImageConfig, pixel_coordinates, range_images
+
+
+def beam_points(config, rows, columns, ranges):
+    """Points at the centers of the given pixels"""
+    elevation = np.radians(config.elevations[rows])
+    azimuth = np.pi * (1 - 2 * (np.asarray(columns) + 0.5) / config.width)
+    return np.column_stack([
+        ranges * np.cos(elevation) * np.cos(azimuth),
+        ranges * np.cos(elevation) * np.sin(azimuth),
+        ranges * np.sin(elevation)
+    ])
+
+
+def test_pixel_coordinates():
+    config = CADC_RANGE_IMAGE
+    assert config.shape == (32, 1800)
+    rows = np.array([0, 5, 31, 11])
+    columns = np.array([0, 900, 1799, 450])
+    xyz = beam_points(config, rows, columns, np.array([10.0, 20.0, 5.0, 30.0]))
+    result_rows, result_columns, ranges = pixel_coordinates(xyz, config)
+    assert np.array_equal(result_rows, rows)
+    assert np.array_equal(result_columns, columns)
+    assert np.allclose(ranges, [10, 20, 5, 30])
+    # straight up, too close and too far
+    outside = np.array([[0.0, 0.0, 10.0], [0.1, 0.0, 0.0], [500.0, 0.0, 0.0]])
+    assert np.all(pixel_coordinates(outside, config)[0] == -1)
+
+
+def test_range_images_batch():
+    config = RangeImageConfig.uniform(4, 3.0, -3.0, width=8)
+    first = np.column_stack([beam_points(config, [0, 0, 3], [1, 1, 6], np.array([5.0, 3.0, 7.0])), [1, 2, 3]])
+    second = np.column_stack([beam_points(config, [2, 1], [0, 7], np.array([4.0, 6.0])), [4, 5]])
+    second = np.vstack([second, [[0.0, 0.0, 50.0, 6.0]]])
+    images = range_images([CadcLidarCloud(first), second], config)
+
+    assert images.data.shape == (2, 6, 4, 8)
+    assert images.mask.sum() == 4
+    # the nearer of two points in the same pixel wins
+    assert images.point_index[0, 0, 1] == 1
+    assert np.isclose(images.channel("range")[0, 0, 1], 3.0)
+    assert images.channel("intensity")[0, 0, 1] == 2
+    assert np.allclose(images.data[0, 2:5, 3, 6], first[2, :3])
+    assert images.point_index[1, 2, 0] == 3
+    assert images.pixel_index[0] == images.pixel_index[1]
+    assert images.pixel_index[-1] == -1
+    assert np.array_equal(images.cloud_pixel_index(1), [2 * 8 + 0, 1 * 8 + 7, -1])
+
+    predictions = np.arange(2 * 4 * 8).reshape(2, 4, 8)
+    per_point = images.to_points(predictions, fill=-1)
+    assert np.array_equal(per_point, [1, 1, 30, 32 + 16, 32 + 15, -1])
+
+
+def test_cloud_to_range_image():
+    rng = np.random.default_rng(0)
+    cloud = CadcLidarCloud(rng.uniform(-30, 30, (1000, 4)).astype(np.float32))
+    image = cloud.to_range_image()
+    kept = image.point_index[image.point_index >= 0]
+    assert len(np.unique(kept)) == len(kept)
+    assert np.allclose(image.channel("range")[image.mask], np.linalg.norm(cloud.xyz[kept], axis=1), atol=1e-4)
@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+
+from . import rectification
+from .cadc import CadcCalibration, CadcDataset
+from .structures import Camera, Image, Scene
+from .synthetic import generate_synthetic_cadc
+from .rectification import RemapTable, Rectifier, build_remap_table, distort_points, remap_images
+
+
+def make_calibration(width=40, height=30, distortion=(0, 0, 0, 0, 0)):
+    camera_matrix = np.array([[30.0, 0, width / 2], [0, 30.0, height / 2], [0, 0, 1]])
+    return CadcCalibration(
+        "camera_F", (width, height), camera_matrix, "plumb_bob", np.array(distortion, dtype=np.float64),
+        np.eye(3), np.hstack([camera_matrix, np.zeros((3, 1))])
+    )
+
+
+def test_full_calibration(dataset_path):
+    calibration = CadcCalibration.from_yaml(os.path.join(dataset_path, "2018_03_06/calib/00.yaml"))
+    assert calibration.camera_name == "camera_F"
+    assert calibration.image_size == (1280, 1024)
+    assert calibration.distortion_model == "plumb_bob"
+    assert np.isclose(calibration.distortion[0], -0.211078226790761)
+    assert np.array_equal(calibration.rectification, np.eye(3))
+    assert np.array_equal(calibration.projection[:, :3], calibration.camera_matrix)
+    assert calibration.intrinsics.name == "camera_F_intrinsics"
+
+
+def test_distort_points():
+    points = np.array([[0.5, -0.25], [0.0, 0.0]])
+    distorted = distort_points(points, "plumb_bob", np.array([0.1, 0, 0, 0, 0]))
+    r2 = 0.5 ** 2 + 0.25 ** 2
+    assert np.allclose(distorted[0], points[0] * (1 + 0.1 * r2))
+    assert np.allclose(distorted[1], 0)
+
+
+def test_remap_identity_and_downscale():
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 255, (2, 30, 40, 3), dtype=np.uint8)
+    table = build_remap_table(make_calibration())
+    assert table.valid.all()
+    assert np.array_equal(remap_images(images, [table, table]), images)
+
+    half = build_remap_table(make_calibration(), scale=0.5)
+    assert half.output_size == (20, 15)
+    assert np.allclose(half.camera_matrix[:2, :2], [[15, 0], [0, 15]])
+    flat = np.full((30, 40, 3), 77, dtype=np.uint8)
+    assert np.all(half(flat) == 77)
+
+
+def test_remap_undistorts():
+    calibration = make_calibration(distortion=(-0.2, 0.05, 0, 0, 0))
+    table = build_remap_table(calibration)
+    # a raw image whose pixels hold their own x coordinate
+    raw = np.tile(np.arange(40, dtype=np.float32)[None, :, None], (30, 1, 1))
+    rectified = table(raw)
+    v, u = 25, 35
+    x, y = (u - 20) / 30.0, (v - 15) / 30.0
+    expected_x = distort_points(np.array([x, y]), "plumb_bob", calibration.distortion)[0] * 30 + 20
+    assert table.valid[v, u]
+    assert np.isclose(rectified[v, u, 0], expected_x, atol=1e-3)
+    assert not np.isclose(rectified[v, u, 0], u, atol=0.5)
+
+
+def test_rectifier_cache(tmp_path, monkeypatch):
+    path = generate_synthetic_cadc(str(tmp_path / "cadc"), {"2018_03_06": ["0001"]}, frames=1)
+    scene = next(CadcDataset.lazy_create_from_path(path))
+    rectifier = Rectifier(path, scale=0.5)
+    rectified = rectifier(scene)
+    assert len(os.listdir(os.path.join(path, ".rectification"))) == CadcDataset.NUMBER_OF_CAMERAS
+    for camera, raw_camera in zip(rectified.cameras, scene.cameras):
+        assert camera.image.size == (8, 4)
+        assert np.all(camera.image.to_numpy() == raw_camera.image.to_numpy()[0, 0])
+        assert np.allclose(camera.intrinsics.data[0, 0], raw_camera.intrinsics.data[0, 0] / 2)
+        assert np.allclose(camera.extrinsics.data, raw_camera.extrinsics.data)
+    assert rectified.lidar_cloud is scene.lidar_cloud
+    assert rectifier.tables("2018_03_06") is rectifier.tables("2018_03_06")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("tables must be loaded from the disk cache")
+
+    monkeypatch.setattr(rectification, "build_remap_table", fail)
+    cached = Rectifier(path, scale=0.5)(scene)
+    for camera, expected in zip(cached.cameras, rectified.cameras):
+        assert np.array_equal(camera.image.to_numpy(), expected.image.to_numpy())
+
+
+def test_rectifier_read_only_root(tmp_path, monkeypatch):
+    path = generate_synthetic_cadc(str(tmp_path / "cadc"), {"2018_03_06": ["0001"]}, frames=1)
+    scene = next(CadcDataset.lazy_create_from_path(path))
+
+    def read_only(*args, **kwargs):
+        raise PermissionError("read-only file system")
+
+    monkeypatch.setattr(rectification.os, "makedirs", read_only)
+    rectified = Rectifier(path, scale=0.5)(scene)
+    assert all(camera.image.size == (8, 4) for camera in rectified.cameras)
+    assert not os.path.exists(os.path.join(path, ".rectification"))
+
+
+def test_remap_table_save_leaves_no_temporary_files(tmp_path):
+    table = RemapTable.from_maps(np.zeros((2, 3)), np.zeros((2, 3)), (3, 2), np.eye(3))
+    table.save(str(tmp_path / "table.npz"))
+    table.save(str(tmp_path / "table.npz"))
+    assert os.listdir(str(tmp_path)) == ["table.npz"]
+    assert RemapTable.load(str(tmp_path / "table.npz")).output_size == (3, 2)
+
+
+def test_rectifier_mixed_source_sizes(tmp_path):
+    path = generate_synthetic_cadc(str(tmp_path / "cadc"), {"2018_03_06": ["0001"]}, frames=1)
+    scene = next(CadcDataset.lazy_create_from_path(path))
+    small, large = make_calibration(40, 30), make_calibration(80, 60)
+    rectifier = Rectifier(path, cache_dir=None)
+    # both cameras give 20x15 images from raw images of different sizes
+    rectifier._tables["2018_03_06"] = {
+        "camera_A": build_remap_table(small, 0.5), "camera_B": build_remap_table(large, 0.25)
+    }
+    cameras = [
+        Camera("camera_A", small.intrinsics, [], Image(np.full((30, 40, 3), 10, dtype=np.uint8))),
+        Camera("camera_B", large.intrinsics, [], Image(np.full((60, 80, 3), 20, dtype=np.uint8))),
+    ]
+    rectified = rectifier(Scene(scene.scene_id, cameras, scene.lidar_cloud, scene.gt3d))
+    assert [camera.image.size for camera in rectified.cameras] == [(20, 15), (20, 15)]
+    assert rectified.cameras[0].image.to_numpy()[7, 10, 0] == 10
+    assert rectified.cameras[1].image.to_numpy()[7, 10, 0] == 20
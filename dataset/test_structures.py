@@ -0,0 +1,66 @@
+import os
+import numpy as np
+from PIL import Image as PILImage
+
+from .structures import Image, GT3D, decode_labels
+from .cadc import CadcDataset, IndexedCadcDataset
+
+
+def test_image_is_lazy(tmp_path):
+    image_path = str(tmp_path / "image.png")
+    PILImage.fromarray(np.full((8, 16, 3), 7, dtype=np.uint8)).save(image_path)
+
+    image = Image(image_path)
+    assert not image.loaded
+    assert image.width == 16 and image.height == 8
+    assert not image.loaded
+
+    pixels = image.to_numpy()
+    assert image.loaded
+    assert pixels.shape == (8, 16, 3) and np.all(pixels == 7)
+    assert image.data.fp is None
+
+    image.release()
+    assert not image.loaded
+
+
+def test_image_from_pil():
+    image = Image(PILImage.new("RGB", (4, 2)))
+    assert image.loaded
+    assert image.size == (4, 2)
+
+
+def test_scene_cameras_selection(synthetic_dataset_path):
+    scene = next(CadcDataset.lazy_create_from_path(synthetic_dataset_path, cameras=[0, 3]))
+    assert [camera.camera_name for camera in scene.cameras] == ["camera_F", "camera_RB"]
+    assert not any(camera.image.loaded for camera in scene.cameras)
+    assert np.all(scene.cameras[1].image.to_numpy() == 30)
+
+    lidar_only = IndexedCadcDataset(synthetic_dataset_path, cameras=[])[0]
+    assert lidar_only.cameras == []
+    assert os.path.isfile(os.path.join(synthetic_dataset_path, ".cadc_index.json"))
+
+
+def test_gt3d_box_views():
+    gt = GT3D(
+        np.array([[1, 2, 3, 4, 2, 1, 0.5], [0, 0, 0, 1, 1, 1, 0]], dtype=np.float64),
+        np.array([1, 0]),
+        ["Car", "Truck"],
+        np.array([True, False])
+    )
+    box = gt.boxes[0]
+    assert box.label == "Truck" and box.yaw == 0.5 and box.stationary
+    assert box.dx == 2 and box.dy == 1
+
+    box.position[0] = 10
+    assert gt.data[0, 0] == 10
+
+    assert len(gt.select(gt.stationary)) == 1
+    assert GT3D([]).data.shape == (0, 7)
+
+
+def test_decode_labels():
+    assert list(decode_labels(np.array([1, -1, 0]), ["Car", "Truck"])) == ["Truck", "", "Car"]
+    assert list(decode_labels(np.array([-1, -1]), [])) == ["", ""]
+    gt3d = GT3D.from_arrays(np.zeros((2, 7)), ["Car", "Bus"], [False, True], ["Car"])
+    assert list(gt3d.label_strings) == ["Car", "Bus"]
@@ -0,0 +1,70 @@
+import numpy as np
+
+from geometry.transformations import make_transforms, rotation_matrices
+from .cadc import CadcDataset
+from .sweeps import (
+    NOVATEL_FIELDS, SweepBuffer, lazy_create_multisweep_from_path,
+    merge_sweeps, novatel_poses, read_timestamps
+)
+
+
+def test_read_timestamps(tmp_path):
+    path = tmp_path / "timestamps.txt"
+    path.write_text("2018-03-06 15:02:33.000416000\n2018-03-06 15:02:33.300342000\n")
+    assert np.allclose(read_timestamps(str(path)), [0.0, 0.299926])
+
+
+def test_novatel_poses():
+    novatel = np.zeros((2, len(NOVATEL_FIELDS)))
+    novatel[:, 0] = 43.0
+    novatel[:, 1] = [-80.0, -80.0001]
+    novatel[:, NOVATEL_FIELDS.index("azimuth")] = 270.0
+    poses = novatel_poses(novatel)
+    assert np.allclose(poses[0, :3, 3], 0)
+    assert poses[1, 0, 3] < -8 and abs(poses[1, 1, 3]) < 1e-6
+    # heading west, forward y axis of imu points to -x
+    assert np.allclose(poses[1, :3, 1], [-1, 0, 0])
+
+
+def test_merge_sweeps_motion_compensation():
+    world_point = np.array([[10.0, 5.0, 1.0, 0.5]], dtype=np.float32)
+    poses = make_transforms(rotation_matrices(np.array([0.0, 0.3]), 'z'), np.array([[0.0, 0, 0], [2.0, 1, 0]]))
+    clouds = []
+    for pose in poses:
+        local = world_point.copy()
+        local[:, :3] = (np.linalg.inv(pose) @ np.append(world_point[0, :3], 1))[:3]
+        clouds.append(local)
+
+    merged = merge_sweeps(clouds, np.array([0.0, 0.1]), poses)
+    assert merged.points.shape == (2, 5)
+    assert np.allclose(merged.xyz[0], merged.xyz[1], atol=1e-5)
+    assert np.allclose(merged.time_lag, [0.0, 0.1])
+    assert np.allclose(merged.intensity, 0.5)
+
+
+def test_sweep_buffer():
+    buffer = SweepBuffer(3, lambda frame: np.full((1, 4), frame))
+    for frame in range(5):
+        window = buffer.window(frame, 3)
+    assert [int(sweep[0, 0]) for sweep in window] == [2, 3, 4]
+    assert buffer.reads == 5
+
+
+def test_multisweep_scenes(synthetic_dataset_path):
+    single = CadcDataset.create_from_path(synthetic_dataset_path)
+    scenes = list(lazy_create_multisweep_from_path(synthetic_dataset_path, num_sweeps=2, cameras=[0]))
+    assert [str(scene.scene_id) for scene in scenes] == [str(scene.scene_id) for scene in single]
+
+    first, second = scenes[0].lidar_cloud, scenes[1].lidar_cloud
+    assert len(first.points) == len(single[0].lidar_cloud.points)
+    assert len(second.points) == len(single[1].lidar_cloud.points) + len(single[0].lidar_cloud.points)
+    assert np.allclose(second.points[:len(single[1].lidar_cloud.points), :4], single[1].lidar_cloud.points)
+    assert np.allclose(np.unique(second.time_lag), [0.0, 0.1])
+    assert scenes[1].gt3d == single[1].gt3d
+
+    def grep(scene_id):
+        return scene_id.scene_id == "0000000002"
+
+    scenes = list(lazy_create_multisweep_from_path(synthetic_dataset_path, 3, grep, use_poses=False))
+    assert len(scenes) == 3
+    assert all(len(scene.lidar_cloud.points) == 3 * len(single[0].lidar_cloud.points) for scene in scenes)
@@ -0,0 +1,270 @@
+import dataclasses
+import numpy as np
+
+from typing import Dict, Iterable, List, Tuple
+from dataclasses import dataclass, field
+
+from dataset import Scene, GT3D
+from geometry.iou import boxes_iou
+from geometry.spatial_index import GridIndex
+from geometry.transformations import (
+    compose_transforms, make_transforms, rotation_matrices, rotation_matrix, transform_points
+)
+
+
+def _wrap_angles(angles: np.array) -> np.array:
+    return (angles + np.pi) % (2 * np.pi) - np.pi
+
+
+def points_box_index(points: np.array, boxes: np.array) -> np.array:
+    """(n,) index of the box every point is in, -1 for points outside of all boxes"""
+    owner = np.full(len(points), -1, dtype=np.int64)
+    if len(boxes) == 0 or len(points) == 0:
+        return owner
+    box_idx, point_idx = GridIndex.build(points, 2.0).points_in_boxes(boxes)
+    # first box wins for points in overlapping boxes
+    owner[point_idx[::-1]] = box_idx[::-1]
+    return owner
+
+
+@dataclass
+class GlobalRotation:
+    angle_range: Tuple[float, float] = (-np.pi / 4, np.pi / 4)
+
+    def __call__(self, points: np.array, gt3d: GT3D, rng: np.random.Generator):
+        angle = rng.uniform(*self.angle_range)
+        transform = make_transforms(rotation_matrix(angle, 'z'))
+        transform_points(points[:, :3], transform, out=points[:, :3])
+        transform_points(gt3d.data[:, :3], transform, out=gt3d.data[:, :3])
+        gt3d.data[:, 6] = _wrap_angles(gt3d.data[:, 6] + angle)
+        return points, gt3d
+
+
+@dataclass
+class GlobalScaling:
+    scale_range: Tuple[float, float] = (0.95, 1.05)
+
+    def __call__(self, points: np.array, gt3d: GT3D, rng: np.random.Generator):
+        scale = rng.uniform(*self.scale_range)
+        points[:, :3] *= scale
+        gt3d.data[:, :6] *= scale
+        return points, gt3d
+
+
+@dataclass
+class RandomFlip:
+    """Mirrors the scene with probability 0.5 per axis, 'x' flips across the x axis (y -> -y)"""
+    axes: Tuple[str, ...] = ("x",)
+
+    def __call__(self, points: np.array, gt3d: GT3D, rng: np.random.Generator):
+        for axis in self.axes:
+            if rng.random() >= 0.5:
+                continue
+            column = 1 if axis == "x" else 0
+            points[:, column] *= -1
+            gt3d.data[:, column] *= -1
+            yaw = -gt3d.data[:, 6] if axis == "x" else np.pi - gt3d.data[:, 6]
+            gt3d.data[:, 6] = _wrap_angles(yaw)
+        return points, gt3d
+
+
+@dataclass
+class BoxJitter:
+    """Moves every box with its points by a random translation and rotation around its center,
+    moves that make a box collide with another one are dropped"""
+    translation_std: Tuple[float, float, float] = (0.25, 0.25, 0.25)
+    rotation_range: Tuple[float, float] = (-np.pi / 20, np.pi / 20)
+
+    def __call__(self, points: np.array, gt3d: GT3D, rng: np.random.Generator):
+        n_boxes = len(gt3d)
+        if n_boxes == 0:
+            return points, gt3d
+        translations = rng.normal(0, self.translation_std, (n_boxes, 3))
+        rotations = rng.uniform(*self.rotation_range, n_boxes)
+
+        moved = gt3d.data.copy()
+        moved[:, :3] += translations
+        moved[:, 6] = _wrap_angles(moved[:, 6] + rotations)
+        iou = boxes_iou(moved, np.concatenate([gt3d.data, moved]), "bev")
+        iou[np.arange(n_boxes), np.arange(n_boxes)] = 0
+        iou[np.arange(n_boxes), n_boxes + np.arange(n_boxes)] = 0
+        accepted = ~np.any(iou > 0, axis=1)
+        translations[~accepted] = 0
+        rotations[~accepted] = 0
+
+        # every box rotates around its center and then moves by its translation
+        centers = gt3d.data[:, :3]
+        identity = np.broadcast_to(np.eye(3), (n_boxes, 3, 3))
+        box_transforms = compose_transforms(
+            make_transforms(identity, centers + translations),
+            make_transforms(rotation_matrices(rotations, 'z')),
+            make_transforms(identity, -centers)
+        )
+        owner = points_box_index(points, gt3d.data)
+        inside = owner >= 0
+        points[inside, :3] = transform_points(points[inside, None, :3], box_transforms[owner[inside]])[:, 0]
+
+        gt3d.data[:, :3] += translations
+        gt3d.data[:, 6] = _wrap_angles(gt3d.data[:, 6] + rotations)
+        return points, gt3d
+
+
+@dataclass
+class PointDropout:
+    rate: float = 0.1
+
+    def __call__(self, points: np.array, gt3d: GT3D, rng: np.random.Generator):
+        return points[rng.random(len(points)) >= self.rate], gt3d
+
+
+@dataclass
+class GTDatabase:
+    """Object points cut out of scenes for pasting, points are stored relative to box centers
+    points: (p, c) points of all objects, object i owns points[offsets[i]:offsets[i + 1]]
+    boxes: (m, 7) boxes of objects
+    labels: (m,) label strings"""
+    points: np.array
+    offsets: np.array
+    boxes: np.array
+    labels: np.array
+
+    @staticmethod
+    def build(scenes: Iterable[Scene], min_points: int = 5) -> "GTDatabase":
+        points, counts, boxes, labels = [], [], [], []
+        for scene in scenes:
+            if len(scene.gt3d) == 0:
+                continue
+            cloud = np.asarray(scene.lidar_cloud.points, dtype=np.float32)
+            owner = points_box_index(cloud, scene.gt3d.data)
+            order = np.argsort(owner, kind="stable")
+            box_counts = np.bincount(owner[owner >= 0], minlength=len(scene.gt3d))
+            keep = box_counts >= min_points
+            selected = order[keep[owner[order]] & (owner[order] >= 0)]
+            object_points = cloud[selected].copy()
+            object_points[:, :3] -= scene.gt3d.data[owner[selected], :3]
+            points.append(object_points)
+            counts.append(box_counts[keep])
+            boxes.append(scene.gt3d.data[keep])
+            labels.append(scene.gt3d.label_strings[keep])
+        counts = np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64)
+        return GTDatabase(
+            np.concatenate(points) if points else np.zeros((0, 4), dtype=np.float32),
+            np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            np.concatenate(boxes) if boxes else np.zeros((0, 7)),
+            np.concatenate(labels) if labels else np.zeros(0, dtype=str)
+        )
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def save(self, path):
+        np.savez(path, points=self.points, offsets=self.offsets, boxes=self.boxes, labels=self.labels)
+
+    @staticmethod
+    def load(path) -> "GTDatabase":
+        data = np.load(path)
+        return GTDatabase(data["points"], data["offsets"], data["boxes"], data["labels"])
+
+    def object_points(self, indices: np.array) -> np.array:
+        """Points of objects moved back to their box positions"""
+        counts = self.offsets[indices + 1] - self.offsets[indices]
+        owners = np.repeat(np.arange(len(indices)), counts)
+        rows = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts) + \
+            np.repeat(self.offsets[indices], counts)
+        points = self.points[rows].copy()
+        points[:, :3] += self.boxes[indices[owners], :3]
+        return points
+
+
+@dataclass
+class GTPaste:
+    """Pastes objects of a GTDatabase at their original positions,
+    candidates colliding with scene boxes or with each other are dropped
+    and scene points inside pasted boxes are removed"""
+    database: GTDatabase
+    sample_counts: Dict[str, int] = field(default_factory=lambda: {"Car": 10, "Pedestrian": 10})
+
+    def __call__(self, points: np.array, gt3d: GT3D, rng: np.random.Generator):
+        candidates = np.concatenate([
+            rng.choice(np.flatnonzero(self.database.labels == label),
+                       min(count, int(np.sum(self.database.labels == label))), replace=False)
+            for label, count in self.sample_counts.items()
+        ] + [np.zeros(0, dtype=np.int64)]).astype(np.int64)
+        if len(candidates) == 0:
+            return points, gt3d
+
+        boxes = self.database.boxes[candidates]
+        collide_scene = np.any(boxes_iou(boxes, gt3d.data, "bev") > 0, axis=1)
+        mutual = np.triu(boxes_iou(boxes, boxes, "bev") > 0, k=1)
+        accepted = []
+        for idx in np.flatnonzero(~collide_scene):
+            if not any(mutual[kept, idx] for kept in accepted):
+                accepted.append(idx)
+        if not accepted:
+            return points, gt3d
+        accepted = np.array(accepted)
+        candidates, boxes = candidates[accepted], boxes[accepted]
+
+        outside = points_box_index(points, boxes) < 0
+        object_points = self.database.object_points(candidates)
+        pasted = np.zeros((len(object_points), points.shape[1]), dtype=points.dtype)
+        columns = min(points.shape[1], object_points.shape[1])
+        pasted[:, :columns] = object_points[:, :columns]
+        points = np.concatenate([points[outside], pasted])
+
+        pasted_gt = GT3D.from_arrays(
+            boxes, self.database.labels[candidates], np.zeros(len(boxes), dtype=bool), gt3d.label_names
+        )
+        gt3d = GT3D(
+            np.concatenate([gt3d.data, pasted_gt.data]),
+            np.concatenate([gt3d.labels, pasted_gt.labels]),
+            pasted_gt.label_names,
+            np.concatenate([gt3d.stationary, pasted_gt.stationary])
+        )
+        return points, gt3d
+
+
+def worker_rng(seed: int, worker_id: int = 0) -> np.random.Generator:
+    """Independent reproducible stream for every loader worker"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(worker_id,)))
+
+
+@dataclass
+class Augmentation:
+    """Chain of augmentations over (points, GT3D) arrays.
+    Inputs are copied once on entry and every step works on the copies in place where it can"""
+    transforms: List
+    seed: int = 0
+    worker_id: int = 0
+    rng: np.random.Generator = field(default=None, repr=False)
+
+    def __post_init__(self):
+        if self.rng is None:
+            self.rng = worker_rng(self.seed, self.worker_id)
+
+    def reseed(self, worker_id: int):
+        """Call from a loader worker init to give the worker its own stream"""
+        self.worker_id = worker_id
+        self.rng = worker_rng(self.seed, worker_id)
+
+    def __call__(self, points: np.array, gt3d: GT3D) -> Tuple[np.array, GT3D]:
+        points = np.array(points, dtype=np.float32)
+        gt3d = GT3D(gt3d.data.copy(), gt3d.labels.copy(), gt3d.label_names, gt3d.stationary.copy())
+        for transform in self.transforms:
+            points, gt3d = transform(points, gt3d, self.rng)
+        return points, gt3d
+
+    def augment_scene(self, scene: Scene) -> Scene:
+        points, gt3d = self(scene.lidar_cloud.points, scene.gt3d)
+        return dataclasses.replace(
+            scene,
+            lidar_cloud=dataclasses.replace(scene.lidar_cloud, points=points),
+            gt3d=gt3d,
+            cache={}
+        )
+
+
+def default_augmentation(database: GTDatabase = None, seed: int = 0) -> Augmentation:
+    transforms = [] if database is None else [GTPaste(database)]
+    transforms += [BoxJitter(), RandomFlip(), GlobalRotation(), GlobalScaling()]
+    return Augmentation(transforms, seed)
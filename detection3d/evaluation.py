@@ -0,0 +1,166 @@
+import numpy as np
+
+from typing import Callable, Dict, Iterable, List, Tuple
+from dataclasses import dataclass, field
+
+from dataset import Scene, GT3D, CADC_LABELS
+from geometry.iou import boxes_iou
+
+
+@dataclass
+class Predictions:
+    """Detections of a frame, boxes in GT3D form with scores in [0, 1]"""
+    boxes: GT3D
+    scores: np.array
+
+
+@dataclass
+class EvaluationConfig:
+    classes: List[str] = field(default_factory=lambda: list(CADC_LABELS))
+    modes: Tuple[str, ...] = ("bev", "3d")
+    iou_thresholds: Tuple[float, ...] = (0.5, 0.7)
+    distance_bins: Tuple[float, ...] = (0.0, 30.0, 50.0, np.inf)
+    score_bins: int = 1000
+    recall_points: int = 40
+
+
+@dataclass
+class DetectionEvaluator:
+    """Streaming AP evaluation, every frame is matched on arrival and only
+    per class score histograms of true and false positives are kept.
+    Histograms have shape (modes, classes, iou thresholds, distance bins, score bins),
+    evaluators of disjoint frames are merged by adding them up"""
+    config: EvaluationConfig = field(default_factory=EvaluationConfig)
+    tp: np.array = None
+    fp: np.array = None
+    num_gt: np.array = None
+    frames: int = 0
+
+    def __post_init__(self):
+        shape = (len(self.config.modes), len(self.config.classes), len(self.config.iou_thresholds),
+                 len(self.config.distance_bins) - 1)
+        if self.tp is None:
+            self.tp = np.zeros(shape + (self.config.score_bins,), dtype=np.int64)
+        if self.fp is None:
+            self.fp = np.zeros(shape + (self.config.score_bins,), dtype=np.int64)
+        if self.num_gt is None:
+            self.num_gt = np.zeros(shape[1:2] + shape[3:], dtype=np.int64)
+
+    def _distance_bins(self, boxes: np.array) -> np.array:
+        distances = np.linalg.norm(boxes[:, :2], axis=1)
+        bins = np.asarray(self.config.distance_bins)
+        return (distances[None, :] >= bins[:-1, None]) & (distances[None, :] < bins[1:, None])
+
+    def add(self, predictions: Predictions, gt3d: GT3D):
+        config = self.config
+        thresholds = np.asarray(config.iou_thresholds)
+        pred_labels = predictions.boxes.label_strings
+        gt_labels = gt3d.label_strings
+        scores = np.asarray(predictions.scores, dtype=np.float64)
+        score_bins = np.clip((scores * config.score_bins).astype(np.int64), 0, config.score_bins - 1)
+
+        for class_idx, class_name in enumerate(config.classes):
+            gt_boxes = gt3d.data[gt_labels == class_name]
+            pred_mask = pred_labels == class_name
+            pred_boxes = predictions.boxes.data[pred_mask]
+            order = np.argsort(-scores[pred_mask], kind="stable")
+            pred_boxes, pred_scores = pred_boxes[order], score_bins[pred_mask][order]
+
+            gt_in_bin = self._distance_bins(gt_boxes)
+            pred_in_bin = self._distance_bins(pred_boxes)
+            self.num_gt[class_idx] += gt_in_bin.sum(axis=1)
+            if len(pred_boxes) == 0:
+                continue
+
+            for mode_idx, mode in enumerate(config.modes):
+                iou = boxes_iou(pred_boxes, gt_boxes, mode)
+                # greedy matching in score order for all thresholds and distance bins at once
+                matched = np.zeros((len(thresholds), gt_in_bin.shape[0], len(gt_boxes)), dtype=bool)
+                is_tp = np.zeros((len(thresholds), gt_in_bin.shape[0], len(pred_boxes)), dtype=bool)
+                for pred_idx in range(len(pred_boxes) if len(gt_boxes) else 0):
+                    eligible = (iou[pred_idx][None, None, :] >= thresholds[:, None, None]) & \
+                        ~matched & gt_in_bin[None] & pred_in_bin[None, :, pred_idx, None]
+                    best = np.argmax(np.where(eligible, iou[pred_idx][None, None, :], -1), axis=-1)
+                    hit = np.take_along_axis(eligible, best[..., None], axis=-1)[..., 0]
+                    t_idx, b_idx = np.nonzero(hit)
+                    matched[t_idx, b_idx, best[t_idx, b_idx]] = True
+                    is_tp[:, :, pred_idx] = hit
+
+                is_fp = ~is_tp & pred_in_bin[None]
+                for t_idx in range(len(thresholds)):
+                    for b_idx in range(gt_in_bin.shape[0]):
+                        self.tp[mode_idx, class_idx, t_idx, b_idx] += np.bincount(
+                            pred_scores[is_tp[t_idx, b_idx]], minlength=config.score_bins)
+                        self.fp[mode_idx, class_idx, t_idx, b_idx] += np.bincount(
+                            pred_scores[is_fp[t_idx, b_idx]], minlength=config.score_bins)
+        self.frames += 1
+
+    def update(self, pairs: Iterable[Tuple[Predictions, GT3D]]) -> "DetectionEvaluator":
+        for predictions, gt3d in pairs:
+            self.add(predictions, gt3d)
+        return self
+
+    def merge(self, other: "DetectionEvaluator") -> "DetectionEvaluator":
+        assert self.tp.shape == other.tp.shape
+        self.tp += other.tp
+        self.fp += other.fp
+        self.num_gt += other.num_gt
+        self.frames += other.frames
+        return self
+
+    def average_precision(self) -> np.array:
+        """
+        :return: interpolated AP over recall_points recall levels with shape
+            (modes, classes, iou thresholds, distance bins), nan where there is no ground truth
+        """
+        tp = np.cumsum(self.tp[..., ::-1], axis=-1)
+        fp = np.cumsum(self.fp[..., ::-1], axis=-1)
+        num_gt = self.num_gt[None, :, None, :, None]
+        recall = tp / np.maximum(num_gt, 1)
+        precision = tp / np.maximum(tp + fp, 1)
+        precision = np.maximum.accumulate(precision[..., ::-1], axis=-1)[..., ::-1]
+
+        levels = np.linspace(1.0 / self.config.recall_points, 1.0, self.config.recall_points)
+        reached = recall[..., None, :] >= levels[:, None] - 1e-12
+        first = np.argmax(reached, axis=-1)
+        interpolated = np.take_along_axis(precision[..., None, :], first[..., None], axis=-1)[..., 0]
+        interpolated = np.where(reached.any(axis=-1), interpolated, 0.0)
+        ap = interpolated.mean(axis=-1)
+        return np.where(num_gt[..., 0] > 0, ap, np.nan)
+
+    def summary(self) -> Dict:
+        """Nested dict mode -> class -> iou threshold -> distance bin name -> AP"""
+        ap = self.average_precision()
+        bins = self.config.distance_bins
+        bin_names = ["%g-%g" % (bins[idx], bins[idx + 1]) for idx in range(len(bins) - 1)]
+        return {
+            mode: {
+                class_name: {
+                    threshold: dict(zip(bin_names, ap[mode_idx, class_idx, t_idx].tolist()))
+                    for t_idx, threshold in enumerate(self.config.iou_thresholds)
+                }
+                for class_idx, class_name in enumerate(self.config.classes)
+            }
+            for mode_idx, mode in enumerate(self.config.modes)
+        }
+
+
+def merge_evaluators(evaluators: Iterable[DetectionEvaluator]) -> DetectionEvaluator:
+    evaluators = iter(evaluators)
+    result = next(evaluators)
+    for evaluator in evaluators:
+        result.merge(evaluator)
+    return result
+
+
+def evaluate_scenes(
+        scenes: Iterable[Scene],
+        predict: Callable[[Scene], Predictions],
+        config: EvaluationConfig = None
+) -> DetectionEvaluator:
+    """Evaluate predictions frame by frame over a scene stream,
+    e.g. CadcDataset.lazy_create_from_path or a PrefetchLoader, scenes are not kept"""
+    evaluator = DetectionEvaluator(config or EvaluationConfig())
+    for scene in scenes:
+        evaluator.add(predict(scene), scene.gt3d)
+    return evaluator
@@ -0,0 +1,74 @@
+import numpy as np
+
+from dataset import GT3D, Scene, SceneID, RideID, LidarCloud, CadcDataset, CADC_LABELS
+from geometry.spatial_index import GridIndex
+from .augmentation import (
+    Augmentation, BoxJitter, GlobalRotation, GlobalScaling, GTDatabase, GTPaste,
+    PointDropout, RandomFlip, default_augmentation, points_box_index
+)
+
+
+def make_sample():
+    gt3d = GT3D.from_arrays(
+        np.array([[5.0, 0, 0, 4, 2, 2, 0.3], [-5.0, 3, 0, 1, 1, 2, -1.0]]),
+        ["Car", "Pedestrian"], np.array([False, True]), CADC_LABELS
+    )
+    rng = np.random.default_rng(1)
+    points = np.concatenate([
+        rng.uniform(-0.4, 0.4, (50, 4)) + [5, 0, 0, 0],
+        rng.uniform(-0.3, 0.3, (20, 4)) + [-5, 3, 0, 0],
+        rng.uniform(-30, 30, (100, 4))
+    ]).astype(np.float32)
+    return points, gt3d
+
+
+def inside_counts(points, gt3d):
+    return GridIndex.build(points).count_points_in_boxes(gt3d.data)
+
+
+def test_global_transforms_keep_points_in_boxes():
+    points, gt3d = make_sample()
+    before = inside_counts(points, gt3d)
+    augmentation = Augmentation([GlobalRotation(), GlobalScaling((0.8, 1.2)), RandomFlip(("x", "y")), BoxJitter()],
+                                seed=3)
+    for _ in range(5):
+        new_points, new_gt = augmentation(points, gt3d)
+        assert new_points.dtype == np.float32
+        assert np.all(inside_counts(new_points, new_gt)[:2] >= before[:2])
+        assert list(new_gt.label_strings) == ["Car", "Pedestrian"]
+    assert np.array_equal(make_sample()[0], points)
+
+
+def test_seeded_per_worker():
+    points, gt3d = make_sample()
+    first = Augmentation([GlobalRotation(), PointDropout(0.5)], seed=7, worker_id=1)(points, gt3d)
+    second = Augmentation([GlobalRotation(), PointDropout(0.5)], seed=7, worker_id=1)(points, gt3d)
+    other = Augmentation([GlobalRotation(), PointDropout(0.5)], seed=7, worker_id=2)(points, gt3d)
+    assert np.array_equal(first[0], second[0])
+    assert not np.array_equal(first[1].data, other[1].data)
+    assert 40 < len(first[0]) < 130
+
+
+def test_gt_paste(synthetic_dataset_path):
+    points, gt3d = make_sample()
+    scene = Scene(SceneID(RideID("2018_03_06", "0001"), "0000000000"), [], LidarCloud(points), gt3d)
+    database = GTDatabase.build([scene], min_points=5)
+    assert len(database) == 2
+    assert np.allclose(database.object_points(np.array([1])).mean(axis=0)[:2], [-5, 3], atol=0.2)
+
+    empty = GT3D.from_arrays(np.zeros((0, 7)), [], np.zeros(0, dtype=bool), CADC_LABELS)
+    background = np.array([[5.0, 0, 0, 1], [20, 20, 0, 1]], dtype=np.float32)
+    new_points, new_gt = GTPaste(database, {"Car": 1, "Pedestrian": 1})(background, empty, np.random.default_rng(0))
+    assert sorted(new_gt.label_strings) == ["Car", "Pedestrian"]
+    assert len(new_points) == 1 + 70
+    assert points_box_index(new_points, new_gt.data).tolist().count(-1) == 1
+
+    # objects overlapping scene boxes are not pasted
+    new_points, new_gt = GTPaste(database, {"Car": 1})(points, gt3d, np.random.default_rng(0))
+    assert len(new_gt) == 2 and len(new_points) == len(points)
+
+    scenes = CadcDataset.create_from_path(synthetic_dataset_path, cameras=[])
+    augmentation = default_augmentation(GTDatabase.build(scenes, min_points=1))
+    scene = augmentation.augment_scene(scenes[0])
+    assert scene.scene_id == scenes[0].scene_id
+    assert len(scene.gt3d) >= len(scenes[0].gt3d)
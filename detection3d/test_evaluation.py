@@ -0,0 +1,60 @@
+import numpy as np
+
+from dataset import GT3D, CadcDataset
+from .evaluation import Predictions, EvaluationConfig, DetectionEvaluator, merge_evaluators, evaluate_scenes
+
+
+def make_gt(boxes, labels):
+    return GT3D.from_arrays(np.array(boxes, dtype=np.float64).reshape(-1, 7), labels, np.zeros(len(labels)))
+
+
+CONFIG = EvaluationConfig(classes=["Car", "Pedestrian"], iou_thresholds=(0.5,), distance_bins=(0, 20, np.inf))
+
+FRAMES = [
+    (
+        Predictions(make_gt([[5, 0, 0, 4, 2, 1.5, 0], [30, 0, 0, 4, 2, 1.5, 0], [5, 5, 0, 1, 1, 2, 0]],
+                            ["Car", "Car", "Pedestrian"]), np.array([0.9, 0.8, 0.7])),
+        make_gt([[5, 0, 0, 4, 2, 1.5, 0.05], [30, 0, 0, 4, 2, 1.5, 0]], ["Car", "Car"])
+    ),
+    (
+        Predictions(make_gt([[0, 8, 0, 4, 2, 1.5, 0], [0, 8.2, 0, 4, 2, 1.5, 0]], ["Car", "Car"]),
+                    np.array([0.6, 0.95])),
+        make_gt([[0, 8, 0, 4, 2, 1.5, 0], [10, 10, 0, 1, 1, 2, 0]], ["Car", "Pedestrian"])
+    ),
+]
+
+
+def test_perfect_predictions():
+    evaluator = DetectionEvaluator(CONFIG)
+    for _, gt in FRAMES:
+        evaluator.add(Predictions(gt, np.ones(len(gt))), gt)
+    ap = evaluator.average_precision()
+    assert ap.shape == (2, 2, 1, 2)
+    assert np.allclose(ap[:, 0], 1)
+    assert np.allclose(ap[:, 1, :, 0], 1) and np.all(np.isnan(ap[:, 1, :, 1]))
+
+
+def test_streaming_and_merge():
+    evaluator = DetectionEvaluator(CONFIG).update(FRAMES)
+    assert evaluator.frames == 2
+    assert evaluator.num_gt.tolist() == [[2, 1], [1, 0]]
+    # near cars: 0.95 matched, 0.9 matched, 0.6 duplicate
+    assert evaluator.tp[0, 0, 0, 0].sum() == 2 and evaluator.fp[0, 0, 0, 0].sum() == 1
+    assert evaluator.fp[0, 1, 0, 0].sum() == 1
+    ap = evaluator.average_precision()
+    assert np.isclose(ap[0, 0, 0, 0], 1) and np.isclose(ap[0, 0, 0, 1], 1)
+    assert ap[0, 1, 0, 0] == 0
+
+    merged = merge_evaluators(DetectionEvaluator(CONFIG).update([frame]) for frame in FRAMES)
+    assert np.all(merged.tp == evaluator.tp) and np.all(merged.fp == evaluator.fp)
+    assert merged.summary()["bev"]["Car"][0.5]["0-20"] == 1.0
+
+
+def test_evaluate_scenes(synthetic_dataset_path):
+    evaluator = evaluate_scenes(
+        CadcDataset.lazy_create_from_path(synthetic_dataset_path, cameras=[]),
+        lambda scene: Predictions(scene.gt3d, np.full(len(scene.gt3d), 0.5))
+    )
+    assert evaluator.frames == 9
+    ap = evaluator.average_precision()
+    assert np.allclose(ap[~np.isnan(ap)], 1)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from dataset import LidarCloud
+from .voxelization import VoxelConfig, voxelize, voxelize_batch
+
+
+def test_voxelize():
+    config = VoxelConfig((1.0, 1.0, 1.0), (0, 0, 0, 4, 4, 2), max_points_per_voxel=2, max_voxels=3)
+    points = np.array([
+        [0.5, 0.5, 0.5, 1],
+        [3.5, 0.5, 0.5, 2],
+        [0.6, 0.6, 0.6, 3],
+        [0.7, 0.7, 0.7, 4],
+        [1.5, 2.5, 1.5, 5],
+        [2.5, 2.5, 1.5, 6],
+        [9.0, 0.0, 0.0, 7],
+    ], dtype=np.float32)
+    voxels = voxelize(points, config)
+    assert list(voxels.grid_size) == [4, 4, 2]
+    assert voxels.coords.tolist() == [[0, 0, 0, 0], [0, 0, 0, 3], [0, 1, 2, 1]]
+    assert voxels.num_points.tolist() == [2, 1, 1]
+    assert voxels.features[0, :, 3].tolist() == [1, 3]
+    assert voxels.point_voxel.tolist() == [0, 1, 0, -1, 2, -1, -1]
+
+    dense = voxels.to_dense()
+    assert dense.shape == (1, 4, 2, 4, 4)
+    assert dense[0, 3, 0, 0, 0] == 2 and dense[0, 3, 1, 2, 1] == 5
+
+
+def test_voxelize_batch_pillars():
+    config = VoxelConfig((2.0, 2.0, 4.0), (-4, -4, -2, 4, 4, 2), max_points_per_voxel=8, max_voxels=100)
+    rng = np.random.default_rng(0)
+    clouds = [LidarCloud(rng.uniform(-4, 4, (50, 4)).astype(np.float32)) for _ in range(3)]
+    voxels = voxelize_batch(clouds, config)
+    assert voxels.batch_size == 3
+    assert set(voxels.coords[:, 0]) == {0, 1, 2}
+    assert np.all(voxels.coords[:, 1] == 0)
+    for b, cloud in enumerate(clouds):
+        single = voxelize(cloud.points, config)
+        assert np.all(voxels.coords[voxels.coords[:, 0] == b, 1:] == single.coords[:, 1:])
+    assert voxels.to_dense().shape == (3, 4, 1, 4, 4)
+    assert voxels.num_points.sum() == (voxels.point_voxel >= 0).sum()
@@ -0,0 +1,134 @@
+import numpy as np
+
+from typing import List, Tuple, Union
+from dataclasses import dataclass
+
+from dataset import LidarCloud
+
+
+@dataclass
+class VoxelConfig:
+    """Voxel grid over point_cloud_range [x_min, y_min, z_min, x_max, y_max, z_max],
+    pillars are voxels with z size equal to the z range"""
+    voxel_size: Tuple[float, float, float] = (0.16, 0.16, 8.0)
+    point_cloud_range: Tuple[float, float, float, float, float, float] = (-51.2, -51.2, -5.0, 51.2, 51.2, 3.0)
+    max_points_per_voxel: int = 32
+    max_voxels: int = 16000
+
+    @property
+    def grid_size(self) -> np.array:
+        """Number of voxels along (x, y, z)"""
+        extent = np.array(self.point_cloud_range[3:]) - np.array(self.point_cloud_range[:3])
+        return np.round(extent / np.array(self.voxel_size)).astype(np.int64)
+
+
+@dataclass
+class Voxels:
+    """Sparse voxelization result
+    features: (v, max_points_per_voxel, c) points of voxels padded with zeros
+    num_points: (v,) number of points kept in every voxel
+    coords: (v, 4) voxel coordinates [batch, z, y, x]
+    point_voxel: (n,) voxel of every input point, -1 for dropped points"""
+    features: np.array
+    num_points: np.array
+    coords: np.array
+    point_voxel: np.array
+    grid_size: np.array
+    batch_size: int
+
+    def mean_features(self) -> np.array:
+        """(v, c) mean of points features in every voxel"""
+        return self.features.sum(axis=1) / np.maximum(self.num_points, 1)[:, None]
+
+    def to_dense(self, features: np.array = None) -> np.array:
+        """
+        :param features: (v, c) per voxel features, mean_features by default
+        :return: dense grid of shape (batch, c, nz, ny, nx)
+        """
+        features = self.mean_features() if features is None else features
+        nx, ny, nz = self.grid_size
+        dense = np.zeros((self.batch_size, features.shape[1], nz, ny, nx), dtype=features.dtype)
+        b, z, y, x = self.coords.T
+        dense[b, :, z, y, x] = features
+        return dense
+
+
+def voxelize(
+        points: np.array,
+        config: VoxelConfig,
+        batch_index: np.array = None,
+        batch_size: int = 1
+) -> Voxels:
+    """Group points into voxels by sorting linear voxel keys, no per point loops
+    :param points: array of shape (n, c) with xyz in first columns
+    :param config: grid and limits, voxels are kept in order of their first point per batch sample
+    :param batch_index: (n,) sample index of every point, all points are one sample by default
+    :param batch_size: number of samples
+    :return: Voxels
+    """
+    grid_size = config.grid_size
+    nx, ny, nz = grid_size
+    n_points = len(points)
+    if batch_index is None:
+        batch_index = np.zeros(n_points, dtype=np.int64)
+
+    coords = np.floor(
+        (points[:, :3] - np.array(config.point_cloud_range[:3])) / np.array(config.voxel_size)
+    ).astype(np.int64)
+    in_range = np.all((coords >= 0) & (coords < grid_size), axis=1)
+    point_ids = np.flatnonzero(in_range)
+    coords = coords[point_ids]
+    keys = ((batch_index[point_ids].astype(np.int64) * nz + coords[:, 2]) * ny + coords[:, 1]) * nx + coords[:, 0]
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    new_voxel = np.empty(len(sorted_keys), dtype=bool)
+    new_voxel[:1] = True
+    np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=new_voxel[1:])
+    starts = np.flatnonzero(new_voxel)
+    voxel_of_sorted = np.cumsum(new_voxel) - 1
+    voxel_keys = sorted_keys[starts]
+    voxel_batch = voxel_keys // (nz * ny * nx)
+
+    # keep first max_voxels voxels of every sample in order of their first point
+    first_point = order[starts]
+    voxel_order = np.lexsort((first_point, voxel_batch))
+    batch_starts = np.searchsorted(voxel_batch[voxel_order], voxel_batch[voxel_order], side="left")
+    keep = (np.arange(len(voxel_order)) - batch_starts) < config.max_voxels
+    kept_voxels = voxel_order[keep]
+    voxel_ids = np.full(len(starts), -1, dtype=np.int64)
+    voxel_ids[kept_voxels] = np.arange(len(kept_voxels))
+
+    rank = np.arange(len(sorted_keys)) - starts[voxel_of_sorted]
+    point_voxel_sorted = voxel_ids[voxel_of_sorted]
+    kept_points = (point_voxel_sorted >= 0) & (rank < config.max_points_per_voxel)
+
+    features = np.zeros((len(kept_voxels), config.max_points_per_voxel, points.shape[1]), dtype=points.dtype)
+    features[point_voxel_sorted[kept_points], rank[kept_points]] = points[point_ids[order[kept_points]]]
+    num_points = np.bincount(point_voxel_sorted[kept_points], minlength=len(kept_voxels)).astype(np.int32)
+
+    point_voxel = np.full(n_points, -1, dtype=np.int64)
+    point_voxel[point_ids[order[kept_points]]] = point_voxel_sorted[kept_points]
+
+    kept_keys = voxel_keys[kept_voxels]
+    x = kept_keys % nx
+    y = kept_keys // nx % ny
+    z = kept_keys // (nx * ny) % nz
+    b = kept_keys // (nx * ny * nz)
+
+    return Voxels(
+        features,
+        num_points,
+        np.stack([b, z, y, x], axis=1).astype(np.int32),
+        point_voxel,
+        grid_size,
+        batch_size
+    )
+
+
+def voxelize_batch(clouds: List[Union[LidarCloud, np.array]], config: VoxelConfig) -> Voxels:
+    """Voxelize several clouds at once, coords[:, 0] is the index of the cloud
+    and point_voxel follows the concatenation of clouds points"""
+    points = [np.asarray(getattr(cloud, "points", cloud)) for cloud in clouds]
+    batch_index = np.repeat(np.arange(len(points)), [len(cloud_points) for cloud_points in points])
+    return voxelize(np.concatenate(points), config, batch_index, len(points))
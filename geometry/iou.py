@@ -0,0 +1,183 @@
+import numpy as np
+
+from typing import Tuple
+
+from .transformations import boxes_straight2rotated
+
+
+def _cross(a: np.array, b: np.array) -> np.array:
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _inside_convex(points: np.array, polygons: np.array) -> np.array:
+    """
+    :param points: array of shape (p, k, 2)
+    :param polygons: convex polygons of shape (p, m, 2) with vertices in order
+    :return: (p, k) mask of points inside or on the border of polygons
+    """
+    edges = np.roll(polygons, -1, axis=1) - polygons
+    cross = _cross(edges[:, None, :, :], points[:, :, None, :] - polygons[:, None, :, :])
+    return np.all(cross >= -1e-9, axis=2) | np.all(cross <= 1e-9, axis=2)
+
+
+def convex_intersection_area(poly_a: np.array, poly_b: np.array) -> np.array:
+    """Intersection area of pairs of convex quadrilaterals
+    :param poly_a: array of shape (p, 4, 2)
+    :param poly_b: array of shape (p, 4, 2)
+    :return: (p,) areas
+    """
+    # vertices of the intersection are vertices of one polygon inside the other and edges crossings
+    r = np.roll(poly_a, -1, axis=1) - poly_a
+    s = np.roll(poly_b, -1, axis=1) - poly_b
+    qp = poly_b[:, None, :, :] - poly_a[:, :, None, :]
+    denom = _cross(r[:, :, None, :], s[:, None, :, :])
+    parallel = np.abs(denom) < 1e-12
+    safe_denom = np.where(parallel, 1, denom)
+    t = _cross(qp, s[:, None, :, :]) / safe_denom
+    u = _cross(qp, r[:, :, None, :]) / safe_denom
+    crossing_valid = ~parallel & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    crossings = poly_a[:, :, None, :] + t[..., None] * r[:, :, None, :]
+
+    points = np.concatenate([poly_a, poly_b, crossings.reshape(-1, 16, 2)], axis=1)
+    valid = np.concatenate([
+        _inside_convex(poly_a, poly_b),
+        _inside_convex(poly_b, poly_a),
+        crossing_valid.reshape(-1, 16)
+    ], axis=1)
+
+    count = valid.sum(axis=1)
+    center = (points * valid[..., None]).sum(axis=1) / np.maximum(count, 1)[:, None]
+    angles = np.arctan2(points[..., 1] - center[:, None, 1], points[..., 0] - center[:, None, 0])
+    angles = np.where(valid, angles, np.inf)
+    order = np.argsort(angles, axis=1)
+    points = np.take_along_axis(points, order[..., None], axis=1)
+    valid = np.take_along_axis(valid, order, axis=1)
+    # invalid points sorted to the end collapse onto the first vertex and add no area
+    points = np.where(valid[..., None], points, points[:, :1, :])
+
+    area = 0.5 * np.abs(_cross(points, np.roll(points, -1, axis=1)).sum(axis=1))
+    return np.where(count >= 3, area, 0.0)
+
+
+def _bev_corners(boxes: np.array) -> np.array:
+    return boxes_straight2rotated(boxes[:, [0, 1, 3, 4, 6]])
+
+
+def _aabb(corners: np.array) -> np.array:
+    return np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+
+
+def overlapping_pairs(boxes_a: np.array, boxes_b: np.array, chunk_size: int = 4096) -> Tuple[np.array, np.array]:
+    """Axis-aligned prefilter, pairs of boxes whose bev bounding rectangles intersect
+    :param boxes_a: array of shape (n, 7) in format [cx, cy, cz, dx, dy, dz, yaw]
+    :param boxes_b: array of shape (m, 7)
+    :return: (index in a, index in b) of candidate pairs
+    """
+    aabb_a = _aabb(_bev_corners(boxes_a))
+    aabb_b = _aabb(_bev_corners(boxes_b))
+    idx_a, idx_b = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for start in range(0, len(aabb_a), chunk_size):
+        chunk = aabb_a[start:start + chunk_size]
+        overlap = (chunk[:, None, 0] <= aabb_b[None, :, 2]) & (aabb_b[None, :, 0] <= chunk[:, None, 2]) & \
+                  (chunk[:, None, 1] <= aabb_b[None, :, 3]) & (aabb_b[None, :, 1] <= chunk[:, None, 3])
+        rows, cols = np.nonzero(overlap)
+        idx_a.append(rows + start)
+        idx_b.append(cols)
+    return np.concatenate(idx_a), np.concatenate(idx_b)
+
+
+def pairs_iou(boxes_a: np.array, boxes_b: np.array, idx_a: np.array, idx_b: np.array,
+              mode: str = "bev", chunk_size: int = 65536) -> np.array:
+    """
+    :param boxes_a: array of shape (n, 7) in format [cx, cy, cz, dx, dy, dz, yaw]
+    :param boxes_b: array of shape (m, 7)
+    :param idx_a: (p,) indexes of pairs in a
+    :param idx_b: (p,) indexes of pairs in b
+    :param mode: 'bev' for rotated iou on xy plane or '3d'
+    :return: (p,) iou of pairs
+    """
+    assert mode in ["bev", "3d"]
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 7)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 7)
+    corners_a = _bev_corners(boxes_a)
+    corners_b = _bev_corners(boxes_b)
+
+    result = np.zeros(len(idx_a))
+    for start in range(0, len(idx_a), chunk_size):
+        a = idx_a[start:start + chunk_size]
+        b = idx_b[start:start + chunk_size]
+        intersection = convex_intersection_area(corners_a[a], corners_b[b])
+        if mode == "bev":
+            area_a = boxes_a[a, 3] * boxes_a[a, 4]
+            area_b = boxes_b[b, 3] * boxes_b[b, 4]
+        else:
+            top = np.minimum(boxes_a[a, 2] + boxes_a[a, 5] / 2, boxes_b[b, 2] + boxes_b[b, 5] / 2)
+            bottom = np.maximum(boxes_a[a, 2] - boxes_a[a, 5] / 2, boxes_b[b, 2] - boxes_b[b, 5] / 2)
+            intersection = intersection * np.maximum(top - bottom, 0)
+            area_a = np.prod(boxes_a[a, 3:6], axis=1)
+            area_b = np.prod(boxes_b[b, 3:6], axis=1)
+        union = area_a + area_b - intersection
+        result[start:start + chunk_size] = intersection / np.maximum(union, 1e-12)
+    return result
+
+
+def boxes_iou(boxes_a: np.array, boxes_b: np.array, mode: str = "bev") -> np.array:
+    """
+    :param boxes_a: array of shape (n, 7) in format [cx, cy, cz, dx, dy, dz, yaw]
+    :param boxes_b: array of shape (m, 7)
+    :param mode: 'bev' for rotated iou on xy plane or '3d'
+    :return: (n, m) iou matrix, only pairs passing the axis-aligned prefilter are computed
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 7)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 7)
+    iou = np.zeros((len(boxes_a), len(boxes_b)))
+    idx_a, idx_b = overlapping_pairs(boxes_a, boxes_b)
+    iou[idx_a, idx_b] = pairs_iou(boxes_a, boxes_b, idx_a, idx_b, mode)
+    return iou
+
+
+def bev_iou(boxes_a: np.array, boxes_b: np.array) -> np.array:
+    return boxes_iou(boxes_a, boxes_b, "bev")
+
+
+def iou_3d(boxes_a: np.array, boxes_b: np.array) -> np.array:
+    return boxes_iou(boxes_a, boxes_b, "3d")
+
+
+def rotated_nms(
+        boxes: np.array,
+        scores: np.array,
+        iou_threshold: float,
+        mode: str = "bev",
+        max_output: int = None
+) -> np.array:
+    """Greedy non maximum suppression of rotated boxes
+    :param boxes: array of shape (n, 7) in format [cx, cy, cz, dx, dy, dz, yaw]
+    :param scores: (n,) scores
+    :param iou_threshold: box is suppressed by a kept box with greater iou
+    :param mode: 'bev' or '3d' iou
+    :param max_output: maximum number of kept boxes
+    :return: indexes of kept boxes in descending order of scores
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 7)
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    sorted_boxes = boxes[order]
+
+    # only prefiltered pairs (i, j), i < j in score order, may suppress each other
+    idx_a, idx_b = overlapping_pairs(sorted_boxes, sorted_boxes)
+    upper = idx_a < idx_b
+    idx_a, idx_b = idx_a[upper], idx_b[upper]
+    overlapping = pairs_iou(sorted_boxes, sorted_boxes, idx_a, idx_b, mode) > iou_threshold
+    idx_a, idx_b = idx_a[overlapping], idx_b[overlapping]
+    neighbors_start = np.searchsorted(idx_a, np.arange(len(boxes) + 1))
+
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    kept = []
+    for idx in range(len(boxes)):
+        if suppressed[idx]:
+            continue
+        kept.append(idx)
+        if max_output is not None and len(kept) >= max_output:
+            break
+        suppressed[idx_b[neighbors_start[idx]:neighbors_start[idx + 1]]] = True
+    return order[np.array(kept, dtype=np.int64)]
@@ -0,0 +1,417 @@
+import numpy as np
+
+from functools import lru_cache
+from typing import Iterator, List, Tuple, Union
+from dataclasses import dataclass
+
+from .transformations import boxes_straight2rotated_3d, rotation_matrices
+
+
+# cells and candidate pairs materialized at once by radius queries, bounds their memory
+CELL_BUDGET = 1 << 16
+PAIR_BUDGET = 1 << 20
+# queries reaching at most this many cells visit a precomputed ring ordered cube of cells
+CUBE_REACH = 2
+
+
+def _budget_chunks(costs: np.array, budget: int) -> List[Tuple[int, int]]:
+    """Consecutive (start, stop) ranges of items, a range costs less than budget
+    plus the cost of its last item"""
+    ends = np.cumsum(costs)
+    chunk_ids = (ends - costs) // max(budget, 1)
+    boundaries = np.flatnonzero(np.diff(chunk_ids)) + 1
+    edges = np.concatenate([[0], boundaries, [len(costs)]]).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+@lru_cache(maxsize=None)
+def _cube_offsets(reach: int) -> Tuple[np.array, np.array]:
+    """Cell offsets of a cube of 2 * reach + 1 cells and their rings, ordered from the center outwards"""
+    axis = np.arange(-reach, reach + 1)
+    offsets = np.stack(np.meshgrid(axis, axis, axis, indexing="ij"), axis=-1).reshape(-1, 3)
+    ring = np.abs(offsets).max(axis=1)
+    order = np.argsort(ring, kind="stable")
+    return offsets[order], ring[order]
+
+
+def _query_volume(reach: np.array, low: np.array, high: np.array, n_cells: int) -> np.array:
+    """(q,) cells a query visits, the whole cube around small reaches and the clipped range
+    or all occupied cells, whichever is fewer, otherwise"""
+    clipped = np.minimum(np.prod(np.maximum(high - low + 1, 0), axis=1), n_cells)
+    return np.where(reach <= CUBE_REACH, (2 * reach + 1) ** 3, clipped)
+
+
+def _ragged_arange(counts: np.array) -> Tuple[np.array, np.array]:
+    """
+    :param counts: (m,) sizes of ranges
+    :return: range owner of every element and position of element inside its range
+    """
+    owners = np.repeat(np.arange(len(counts)), counts)
+    positions = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owners, positions
+
+
+@dataclass
+class GridIndex:
+    """Uniform grid hash over points, points are sorted by cell key once on build
+    and every query only visits points of the cells it touches"""
+    points: np.array
+    cell_size: float
+    origin: np.array
+    dims: np.array
+    order: np.array
+    cell_keys: np.array
+    cell_starts: np.array
+    cell_counts: np.array
+
+    @staticmethod
+    def build(points: np.array, cell_size: float = 1.0) -> "GridIndex":
+        """
+        :param points: array of shape (n, 3+), xyz in first columns
+        :param cell_size: size of grid cell in meters, close to typical query radius works best
+        """
+        xyz = np.asarray(points[:, :3], dtype=np.float64)
+        origin = xyz.min(axis=0) if len(xyz) else np.zeros(3)
+        cells = np.floor((xyz - origin) / cell_size).astype(np.int64)
+        dims = cells.max(axis=0) + 1 if len(xyz) else np.ones(3, dtype=np.int64)
+        keys = (cells[:, 2] * dims[1] + cells[:, 1]) * dims[0] + cells[:, 0]
+        order = np.argsort(keys, kind="stable")
+        cell_keys, cell_starts, cell_counts = np.unique(keys[order], return_index=True, return_counts=True)
+        return GridIndex(xyz, cell_size, origin, dims, order, cell_keys, cell_starts, cell_counts)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell_coords(self, xyz: np.array) -> np.array:
+        return np.floor((xyz - self.origin) / self.cell_size).astype(np.int64)
+
+    def _gather(self, owners: np.array, cells: np.array) -> Tuple[np.array, np.array]:
+        """
+        :param owners: (m,) query index of every visited cell
+        :param cells: (m, 3) integer cell coordinates
+        :return: (query index, point index) candidate pairs
+        """
+        if len(self.cell_keys) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        inside = np.all((cells >= 0) & (cells < self.dims), axis=1)
+        owners, cells = owners[inside], cells[inside]
+        keys = (cells[:, 2] * self.dims[1] + cells[:, 1]) * self.dims[0] + cells[:, 0]
+        pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = self.cell_keys[pos] == keys
+        counts = np.where(found, self.cell_counts[pos], 0)
+        cell_idx, offsets = _ragged_arange(counts)
+        return owners[cell_idx], self.order[self.cell_starts[pos][cell_idx] + offsets]
+
+    def _decode(self, keys: np.array) -> np.array:
+        return np.stack([
+            keys % self.dims[0], keys // self.dims[0] % self.dims[1], keys // (self.dims[0] * self.dims[1])
+        ], axis=1)
+
+    def _cube_cells(self, centers: np.array, reach: int) -> Tuple[np.array, np.array, np.array]:
+        """(query index, position in cell_keys, ring) of occupied cells in cubes around centers,
+        grouped by query and ring ordered. Queries sharing a cell share its lookup"""
+        offsets, ring = _cube_offsets(reach)
+        # cubes of queries outside the grid can still touch it, keys are taken on a padded grid
+        # and centers beyond its border, whose cubes miss the grid, are clipped to it
+        centers = np.clip(centers, -reach - 1, self.dims + reach)
+        padded = self.dims + 2 * reach + 3
+        shifted = centers + reach + 1
+        center_keys = (shifted[:, 2] * padded[1] + shifted[:, 1]) * padded[0] + shifted[:, 0]
+        _, first, inverse = np.unique(center_keys, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        cells = (centers[first, None, :] + offsets).reshape(-1, 3)
+        inside = np.all((cells >= 0) & (cells < self.dims), axis=1)
+        keys = (cells[:, 2] * self.dims[1] + cells[:, 1]) * self.dims[0] + cells[:, 0]
+        pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = inside & (self.cell_keys[pos] == keys)
+        found = found.reshape(len(first), len(offsets))
+        counts = found.sum(axis=1)
+        pos = pos.reshape(len(first), len(offsets))[found]
+        rings = np.broadcast_to(ring, found.shape)[found]
+
+        owners, local = _ragged_arange(counts[inverse])
+        flat = (np.cumsum(counts) - counts)[inverse[owners]] + local
+        return owners, pos[flat], rings[flat]
+
+    def _query_cells(self, centers: np.array, reach: np.array, low: np.array,
+                     high: np.array) -> Tuple[np.array, np.array]:
+        """
+        :param centers: (q, 3) cells of queries
+        :param reach: (q,) search radius of queries in cells
+        :param low, high: (q, 3) inclusive cell ranges of queries clipped to the grid
+        :return: (query index, position in cell_keys) of occupied cells in the ranges,
+            grouped by query and ordered from the query cell outwards
+        """
+        volume = _query_volume(reach, low, high, len(self.cell_keys))
+        cube = reach <= CUBE_REACH
+        # wide ranges test every occupied cell instead of enumerating mostly empty ones
+        wide = ~cube & (volume >= len(self.cell_keys))
+        cube_owners, cube_pos, cube_rings = [], [], []
+        for cube_reach in np.unique(reach[cube]):
+            query_idx = np.flatnonzero(cube & (reach == cube_reach))
+            owners, pos, rings = self._cube_cells(centers[query_idx], int(cube_reach))
+            cube_owners.append(query_idx[owners])
+            cube_pos.append(pos)
+            cube_rings.append(rings)
+        if np.all(cube) and len(cube_owners) == 1:
+            # cells of a single cube are already grouped and ring ordered
+            return cube_owners[0], cube_pos[0]
+
+        owners, cells, rings = [], [], []
+        boxed = np.flatnonzero(~cube & ~wide)
+        sizes = np.maximum(high[boxed] - low[boxed] + 1, 0)
+        box_owners, local = _ragged_arange(np.prod(sizes, axis=1))
+        size_o = sizes[box_owners]
+        box_cells = low[boxed][box_owners] + np.stack([
+            local % size_o[:, 0],
+            local // size_o[:, 0] % size_o[:, 1],
+            local // (size_o[:, 0] * size_o[:, 1])
+        ], axis=1)
+        owners.append(boxed[box_owners])
+        cells.append(box_cells)
+        rings.append(np.abs(box_cells - centers[boxed][box_owners]).max(axis=1))
+
+        owners, cells, rings = np.concatenate(owners), np.concatenate(cells), np.concatenate(rings)
+        inside = np.all((cells >= 0) & (cells < self.dims), axis=1)
+        owners, cells, rings = owners[inside], cells[inside], rings[inside]
+        keys = (cells[:, 2] * self.dims[1] + cells[:, 1]) * self.dims[0] + cells[:, 0]
+        pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = self.cell_keys[pos] == keys
+        owners = np.concatenate([owners[found]] + cube_owners)
+        pos = np.concatenate([pos[found]] + cube_pos)
+        rings = np.concatenate([rings[found]] + cube_rings)
+
+        wide_idx = np.flatnonzero(wide)
+        if len(wide_idx):
+            wide_owners, wide_pos = _ragged_arange(np.full(len(wide_idx), len(self.cell_keys)))
+            wide_owners = wide_idx[wide_owners]
+            coords = self._decode(self.cell_keys[wide_pos])
+            inside = np.all((coords >= low[wide_owners]) & (coords <= high[wide_owners]), axis=1)
+            wide_owners, wide_pos, coords = wide_owners[inside], wide_pos[inside], coords[inside]
+            owners = np.concatenate([owners, wide_owners])
+            pos = np.concatenate([pos, wide_pos])
+            rings = np.concatenate([rings, np.abs(coords - centers[wide_owners]).max(axis=1)])
+
+        order = np.lexsort((rings, owners))
+        return owners[order], pos[order]
+
+    def _radius_pairs(
+            self,
+            queries: np.array,
+            radius: np.array,
+            max_counts: int = None
+    ) -> Iterator[Tuple[np.array, np.array, np.array]]:
+        """Streams (query index, point index, distance) of pairs closer than radius in windows
+        of at most about PAIR_BUDGET candidates, visiting at most about CELL_BUDGET cells at once.
+        Candidates of a query are visited from its own cell outwards and the query is dropped
+        once it has max_counts pairs, so later windows may skip some of its pairs"""
+        if len(self.cell_keys) == 0 or len(queries) == 0:
+            return
+        centers = self._cell_coords(queries)
+        reach = np.ceil(radius / self.cell_size).astype(np.int64)
+        low = np.maximum(centers - reach[:, None], 0)
+        high = np.minimum(centers + reach[:, None], self.dims - 1)
+        volume = _query_volume(reach, low, high, len(self.cell_keys))
+
+        for start, stop in _budget_chunks(volume, CELL_BUDGET):
+            owners, pos = self._query_cells(
+                centers[start:stop], reach[start:stop], low[start:stop], high[start:stop]
+            )
+            counts = self.cell_counts[pos]
+            # rank of the first candidate of every cell among candidates of its query
+            totals = np.bincount(owners, counts, minlength=stop - start).astype(np.int64)
+            firsts = np.cumsum(counts) - counts
+            firsts -= (np.cumsum(totals) - totals)[owners]
+
+            found = np.zeros(stop - start, dtype=np.int64)
+            active = totals > 0
+            rank = 0
+            while active.any():
+                # cells of finished queries and cells already visited are not looked at again
+                keep = active[owners] & (firsts + counts > rank)
+                owners, pos, counts, firsts = owners[keep], pos[keep], counts[keep], firsts[keep]
+                window = max(PAIR_BUDGET // int(active.sum()), 1)
+                if max_counts is not None:
+                    # small windows let dense queries stop after few candidates
+                    window = min(window, max_counts)
+                begin = np.clip(rank - firsts, 0, counts)
+                end = np.clip(rank + window - firsts, 0, counts)
+                cell_idx, offsets = _ragged_arange(end - begin)
+                query_idx = owners[cell_idx]
+                point_idx = self.order[self.cell_starts[pos[cell_idx]] + begin[cell_idx] + offsets]
+                distances = np.linalg.norm(self.points[point_idx] - queries[start + query_idx], axis=1)
+                close = distances <= radius[start + query_idx]
+                query_idx, point_idx, distances = query_idx[close], point_idx[close], distances[close]
+                yield start + query_idx, point_idx, distances
+
+                found += np.bincount(query_idx, minlength=stop - start)
+                rank += window
+                active &= totals > rank
+                if max_counts is not None:
+                    active &= found < max_counts
+
+    def query_radius(
+            self,
+            queries: np.array,
+            radius: Union[float, np.array],
+            return_distances: bool = False
+    ):
+        """
+        :param queries: array of shape (q, 3+)
+        :param radius: scalar or (q,) radius of every query
+        :return: (query index, point index) arrays of all pairs closer than radius,
+            sorted by query, and their distances when return_distances is set
+        """
+        queries = np.asarray(queries[:, :3], dtype=np.float64)
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(queries),))
+        windows = list(self._radius_pairs(queries, radius))
+        query_idx, point_idx, distances = [
+            np.concatenate([window[idx] for window in windows]) if windows else
+            np.zeros(0, dtype=np.float64 if idx == 2 else np.int64)
+            for idx in range(3)
+        ]
+        order = np.argsort(query_idx, kind="stable")
+        query_idx, point_idx, distances = query_idx[order], point_idx[order], distances[order]
+        if return_distances:
+            return query_idx, point_idx, distances
+        return query_idx, point_idx
+
+    def count_neighbors(self, queries: np.array, radius: Union[float, np.array], max_count: int = None) -> np.array:
+        """
+        :param max_count: counting of a query stops once it has at least max_count neighbors,
+            counts are clipped to it
+        :return: (q,) number of points within radius of every query, points count themselves
+        """
+        queries = np.asarray(queries[:, :3], dtype=np.float64)
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(queries),))
+        counts = np.zeros(len(queries), dtype=np.int64)
+        for query_idx, _, _ in self._radius_pairs(queries, radius, max_count):
+            counts += np.bincount(query_idx, minlength=len(queries))
+        return counts if max_count is None else np.minimum(counts, max_count)
+
+    def _scan_knn(self, queries: np.array, k: int) -> Tuple[np.array, np.array]:
+        """k nearest of queries among all points, in chunks of at most about PAIR_BUDGET pairs"""
+        n = len(self.points)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf)
+        take = min(k, n)
+        step = max(PAIR_BUDGET // n, 1)
+        for start in range(0, len(queries), step):
+            dist = np.linalg.norm(self.points[None] - queries[start:start + step, None], axis=2)
+            nearest = np.argpartition(dist, take - 1, axis=1)[:, :take] if take < n else \
+                np.broadcast_to(np.arange(n), (len(dist), n))
+            nearest_dist = np.take_along_axis(dist, nearest, axis=1)
+            order = np.argsort(nearest_dist, axis=1, kind="stable")
+            indices[start:start + step, :take] = np.take_along_axis(nearest, order, axis=1)
+            distances[start:start + step, :take] = np.take_along_axis(nearest_dist, order, axis=1)
+        return indices, distances
+
+    def knn(self, queries: np.array, k: int) -> Tuple[np.array, np.array]:
+        """
+        :param queries: array of shape (q, 3+)
+        :param k: number of neighbors
+        :return: (q, k) point indices and distances sorted by distance,
+            padded with -1 and inf when the cloud has less than k points
+        """
+        queries = np.asarray(queries[:, :3], dtype=np.float64)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf)
+        if len(self) == 0 or k == 0:
+            return indices, distances
+
+        extent = np.linalg.norm(np.maximum(self.dims, 1) * self.cell_size)
+        pending = np.arange(len(queries))
+        # radius grows beyond the distance to the grid box, far queries do not overshoot to the whole cloud
+        box_high = self.origin + self.dims * self.cell_size
+        gap = np.linalg.norm(np.maximum(np.maximum(self.origin - queries, queries - box_high), 0), axis=1)
+        excess = np.full(len(queries), self.cell_size)
+        radius = gap + excess
+        while len(pending):
+            # queries whose range would cover every occupied cell compare against all points once
+            reach = np.ceil(radius[pending] / self.cell_size).astype(np.int64)
+            centers = self._cell_coords(queries[pending])
+            low = np.maximum(centers - reach[:, None], 0)
+            high = np.minimum(centers + reach[:, None], self.dims - 1)
+            volume = _query_volume(reach, low, high, len(self.cell_keys))
+            wide = (reach > CUBE_REACH) & (volume >= len(self.cell_keys))
+            if wide.any():
+                indices[pending[wide]], distances[pending[wide]] = self._scan_knn(queries[pending[wide]], k)
+                pending = pending[~wide]
+                if len(pending) == 0:
+                    break
+            counts = np.zeros(len(pending), dtype=np.int64)
+            # running k nearest of pending queries, merged with every window of pairs
+            best_idx = np.full((len(pending), k), -1, dtype=np.int64)
+            best_dist = np.full((len(pending), k), np.inf)
+            for query_idx, point_idx, dist in self._radius_pairs(queries[pending], radius[pending]):
+                window_counts = np.bincount(query_idx, minlength=len(pending))
+                counts += window_counts
+                # only queries with pairs in the window are merged
+                touched = np.flatnonzero(window_counts)
+                query_idx = np.concatenate([np.repeat(touched, k), query_idx])
+                point_idx = np.concatenate([best_idx[touched].reshape(-1), point_idx])
+                dist = np.concatenate([best_dist[touched].reshape(-1), dist])
+                order = np.lexsort((dist, query_idx))
+                query_idx, point_idx, dist = query_idx[order], point_idx[order], dist[order]
+                rank = np.arange(len(query_idx)) - np.searchsorted(query_idx, query_idx)
+                take = rank < k
+                best_idx[query_idx[take], rank[take]] = point_idx[take]
+                best_dist[query_idx[take], rank[take]] = dist[take]
+
+            far = np.linalg.norm(queries[pending] - self.origin, axis=1) + extent
+            done = (counts >= k) | (radius[pending] >= far)
+            indices[pending[done]] = best_idx[done]
+            distances[pending[done]] = best_dist[done]
+            pending = pending[~done]
+            excess[pending] *= 2
+            radius[pending] = gap[pending] + excess[pending]
+        return indices, distances
+
+    def points_in_boxes(self, boxes: np.array) -> Tuple[np.array, np.array]:
+        """
+        :param boxes: array of shape (m, 7) in format [cx, cy, cz, dx, dy, dz, yaw]
+        :return: (box index, point index) arrays of all points inside rotated boxes
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 7)
+        corners = boxes_straight2rotated_3d(boxes)
+        low = self._cell_coords(corners.min(axis=1))
+        high = self._cell_coords(corners.max(axis=1))
+        low = np.maximum(low, 0)
+        high = np.minimum(high, self.dims - 1)
+        sizes = np.maximum(high - low + 1, 0)
+        if len(self.cell_keys) == 0 or len(boxes) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        # a row of cells along x has consecutive keys, its occupied cells are one range of cell_keys,
+        # so only rows are enumerated and empty cells are never materialized
+        rows = np.where(sizes[:, 0] > 0, sizes[:, 1] * sizes[:, 2], 0)
+        rot = rotation_matrices(boxes[:, 6], 'z')
+        box_parts, point_parts = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for start, stop in _budget_chunks(rows, CELL_BUDGET):
+            row_owners, local = _ragged_arange(rows[start:stop])
+            row_owners += start
+            y = low[row_owners, 1] + local % sizes[row_owners, 1]
+            z = low[row_owners, 2] + local // sizes[row_owners, 1]
+            row_keys = (z * self.dims[1] + y) * self.dims[0]
+            first = np.searchsorted(self.cell_keys, row_keys + low[row_owners, 0])
+            last = np.searchsorted(self.cell_keys, row_keys + high[row_owners, 0], side="right")
+            row_idx, offsets = _ragged_arange(last - first)
+            pos = first[row_idx] + offsets
+            cell_idx, offsets = _ragged_arange(self.cell_counts[pos])
+            box_idx = row_owners[row_idx][cell_idx]
+            point_idx = self.order[self.cell_starts[pos][cell_idx] + offsets]
+
+            # rotate candidates to box frames by -yaw and compare with half sizes
+            local_points = np.einsum(
+                'nji,nj->ni', rot[box_idx], self.points[point_idx] - boxes[box_idx, :3]
+            )
+            inside = np.all(np.abs(local_points) <= boxes[box_idx, 3:6] / 2, axis=1)
+            box_parts.append(box_idx[inside])
+            point_parts.append(point_idx[inside])
+        return np.concatenate(box_parts), np.concatenate(point_parts)
+
+    def count_points_in_boxes(self, boxes: np.array) -> np.array:
+        """(m,) number of points inside every box"""
+        box_idx, _ = self.points_in_boxes(boxes)
+        return np.bincount(box_idx, minlength=len(np.asarray(boxes).reshape(-1, 7)))
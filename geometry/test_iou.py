@@ -0,0 +1,43 @@
+import numpy as np
+
+from .iou import bev_iou, iou_3d, rotated_nms
+
+
+def test_bev_iou():
+    boxes = np.array([
+        [0, 0, 0, 2, 2, 2, 0.0],
+        [1, 0, 0, 2, 2, 2, 0.0],
+        [0, 0, 0, 2, 2, 2, np.pi / 4],
+        [10, 10, 0, 2, 2, 2, 0.3],
+        [0, 0, 0, 2, 2, 2, np.pi / 2],
+    ])
+    iou = bev_iou(boxes, boxes)
+    assert iou.shape == (5, 5)
+    assert np.allclose(np.diag(iou), 1)
+    assert np.allclose(iou, iou.T)
+    assert np.isclose(iou[0, 1], 2 / 6)
+    octagon = 8 * (np.sqrt(2) - 1)
+    assert np.isclose(iou[0, 2], octagon / (8 - octagon))
+    assert np.all(iou[3, [0, 1, 2, 4]] == 0)
+    assert np.isclose(iou[0, 4], 1)
+
+
+def test_iou_3d():
+    boxes_a = np.array([[0, 0, 0, 2, 2, 2, 0.0]])
+    boxes_b = np.array([[0, 0, 1, 2, 2, 2, 0.0], [0, 0, 3, 2, 2, 2, 0.0]])
+    iou = iou_3d(boxes_a, boxes_b)
+    assert np.allclose(iou, [[4 / 12, 0]])
+    assert iou_3d(boxes_a, np.zeros((0, 7))).shape == (1, 0)
+
+
+def test_rotated_nms():
+    boxes = np.array([
+        [0, 0, 0, 4, 2, 1, 0.0],
+        [0.1, 0, 0, 4, 2, 1, 0.05],
+        [5, 5, 0, 4, 2, 1, 0.0],
+        [0, 0.5, 0, 4, 2, 1, 0.0],
+    ])
+    scores = np.array([0.5, 0.9, 0.3, 0.1])
+    assert list(rotated_nms(boxes, scores, 0.5)) == [1, 2]
+    assert list(rotated_nms(boxes, scores, 0.99)) == [1, 0, 2, 3]
+    assert list(rotated_nms(boxes, scores, 0.5, max_output=1)) == [1]
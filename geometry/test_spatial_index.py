@@ -0,0 +1,122 @@
+import numpy as np
+
+from . import spatial_index
+from .spatial_index import GridIndex
+
+
+def brute_force_pairs(points, queries, radius):
+    distances = np.linalg.norm(queries[:, None, :3] - points[None, :, :3], axis=-1)
+    return {tuple(pair) for pair in np.argwhere(distances <= radius)}
+
+
+def test_query_radius():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-5, 5, (500, 4))
+    queries = rng.uniform(-6, 6, (40, 3))
+    index = GridIndex.build(points, cell_size=0.7)
+
+    query_idx, point_idx = index.query_radius(queries, 1.5)
+    assert set(zip(query_idx, point_idx)) == brute_force_pairs(points, queries, 1.5)
+
+    radius = rng.uniform(0.1, 2.0, len(queries))
+    query_idx, point_idx = index.query_radius(queries, radius)
+    expected = {pair for pair in brute_force_pairs(points, queries, 2.0) if
+                np.linalg.norm(queries[pair[0]] - points[pair[1], :3]) <= radius[pair[0]]}
+    assert set(zip(query_idx, point_idx)) == expected
+
+    counts = index.count_neighbors(points, 1.0)
+    assert np.all(counts >= 1)
+
+
+def test_query_radius_in_chunks(monkeypatch):
+    rng = np.random.default_rng(3)
+    points = rng.uniform(-5, 5, (400, 3))
+    # queries far outside the grid, near its border and with radii reaching over the whole grid
+    queries = np.concatenate([rng.uniform(-7, 7, (60, 3)), [[100.0, 100.0, 100.0], [-5.2, 0.0, 0.0]]])
+    radius = np.concatenate([rng.uniform(0.2, 3.0, 50), rng.uniform(10, 20, 10), [1.0, 0.5]])
+    index = GridIndex.build(points, cell_size=0.5)
+    expected = index.query_radius(queries, radius, True)
+
+    monkeypatch.setattr(spatial_index, "CELL_BUDGET", 50)
+    monkeypatch.setattr(spatial_index, "PAIR_BUDGET", 64)
+    chunked = index.query_radius(queries, radius, True)
+    assert set(zip(chunked[0], chunked[1])) == set(zip(expected[0], expected[1]))
+    assert np.all(np.diff(chunked[0]) >= 0)
+    distances = np.linalg.norm(queries[:, None] - points[None], axis=-1)
+    assert set(zip(expected[0], expected[1])) == set(map(tuple, np.argwhere(distances <= radius[:, None])))
+
+    counts = (distances <= radius[:, None]).sum(axis=1)
+    assert np.array_equal(index.count_neighbors(queries, radius), counts)
+    assert np.array_equal(index.count_neighbors(queries, radius, max_count=4), np.minimum(counts, 4))
+
+
+def test_knn(monkeypatch):
+    rng = np.random.default_rng(1)
+    points = rng.uniform(-5, 5, (300, 3))
+    queries = rng.uniform(-8, 8, (20, 3))
+    indices, distances = GridIndex.build(points, cell_size=0.5).knn(queries, 5)
+
+    all_distances = np.linalg.norm(queries[:, None] - points[None], axis=-1)
+    assert np.allclose(distances, np.sort(all_distances, axis=1)[:, :5])
+    assert np.allclose(np.take_along_axis(all_distances, indices, axis=1), distances)
+
+    index = GridIndex.build(points, cell_size=0.5)
+    monkeypatch.setattr(spatial_index, "PAIR_BUDGET", 32)
+    chunked_indices, chunked_distances = index.knn(queries, 5)
+    assert np.allclose(chunked_distances, distances)
+
+    # queries far outside the grid compare against every point
+    far = rng.uniform(-100, 100, (10, 3))
+    far_indices, far_distances = index.knn(far, 5)
+    all_distances = np.linalg.norm(far[:, None] - points[None], axis=-1)
+    assert np.allclose(far_distances, np.sort(all_distances, axis=1)[:, :5])
+    assert np.allclose(np.take_along_axis(all_distances, far_indices, axis=1), far_distances)
+
+    indices, distances = GridIndex.build(points[:3]).knn(queries[:2], 5)
+    assert np.all(indices[:, 3:] == -1) and np.all(np.isinf(distances[:, 3:]))
+
+
+def brute_force_points_in_boxes(points, boxes):
+    expected = set()
+    for idx, (cx, cy, cz, dx, dy, dz, yaw) in enumerate(boxes):
+        shifted = points - [cx, cy, cz]
+        local_x = np.cos(yaw) * shifted[:, 0] + np.sin(yaw) * shifted[:, 1]
+        local_y = -np.sin(yaw) * shifted[:, 0] + np.cos(yaw) * shifted[:, 1]
+        inside = (np.abs(local_x) <= dx / 2) & (np.abs(local_y) <= dy / 2) & (np.abs(shifted[:, 2]) <= dz / 2)
+        expected |= {(idx, point) for point in np.flatnonzero(inside)}
+    return expected
+
+
+def test_points_in_boxes():
+    rng = np.random.default_rng(2)
+    points = rng.uniform(-10, 10, (2000, 3))
+    boxes = np.array([
+        [0, 0, 0, 4, 2, 2, 0.0],
+        [3, 3, 1, 6, 1, 3, np.pi / 4],
+        [50, 50, 0, 1, 1, 1, 0.0],
+    ])
+    box_idx, point_idx = GridIndex.build(points, cell_size=1.0).points_in_boxes(boxes)
+
+    expected = brute_force_points_in_boxes(points, boxes)
+    assert set(zip(box_idx, point_idx)) == expected
+
+    counts = GridIndex.build(points).count_points_in_boxes(boxes)
+    assert counts[2] == 0 and counts.sum() == len(expected)
+
+
+def test_points_in_large_boxes(monkeypatch):
+    rng = np.random.default_rng(3)
+    points = rng.uniform(-20, 20, (3000, 3))
+    boxes = np.array([
+        [0, 0, 0, 30, 30, 6, 0.3],
+        [5, -5, 2, 40, 10, 8, -1.0],
+        [-10, 10, -3, 25, 25, 25, np.pi / 3],
+    ])
+    index = GridIndex.build(points, cell_size=0.2)
+    expected = brute_force_points_in_boxes(points, boxes)
+    box_idx, point_idx = index.points_in_boxes(boxes)
+    assert set(zip(box_idx, point_idx)) == expected and len(box_idx) == len(expected)
+
+    monkeypatch.setattr(spatial_index, "CELL_BUDGET", 100)
+    box_idx, point_idx = index.points_in_boxes(boxes)
+    assert set(zip(box_idx, point_idx)) == expected and len(box_idx) == len(expected)
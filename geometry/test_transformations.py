@@ -0,0 +1,64 @@
+import numpy as np
+
+from .transformations import (
+    rotation_matrices, rotation_matrix, euler_rotation_matrices, make_transforms,
+    compose_transforms, invert_transforms, transform_points,
+    rotate_points_2d, rotate_points_3d, boxes_straight2rotated, boxes_straight2rotated_3d
+)
+
+
+def test_rotation_matrices():
+    angles = np.array([0.0, np.pi / 2, 0.3])
+    rot = rotation_matrices(angles, 'z')
+    assert rot.shape == (3, 3, 3)
+    assert np.allclose(rot[1] @ np.array([1, 0, 0]), [0, 1, 0])
+    for axis in ['x', 'y', 'z']:
+        rot = rotation_matrices(angles, axis)
+        assert np.allclose(rot @ rot.transpose(0, 2, 1), np.eye(3))
+        assert np.allclose(np.linalg.det(rot), 1)
+    assert rotation_matrix(0.3, 'y') is rotation_matrix(0.3, 'y')
+    assert rotation_matrices(angles, 'x', np.float32).dtype == np.float32
+
+    euler = euler_rotation_matrices(np.array([[0.3, 0.2, 0.1]]), 'zyx')
+    expected = rotation_matrix(0.3, 'z') @ rotation_matrix(0.2, 'y') @ rotation_matrix(0.1, 'x')
+    assert np.allclose(euler[0], expected)
+
+
+def test_rotate_points():
+    points = np.array([[[1.0, 0.0]], [[1.0, 0.0]]])
+    rotated = rotate_points_2d(points, np.array([np.pi / 2, np.pi]))
+    assert np.allclose(rotated, [[[0, 1]], [[-1, 0]]])
+
+    points_3d = np.array([[[1.0, 2.0, 3.0]]])
+    angle = np.array([0.4])
+    c, s = np.cos(0.4), np.sin(0.4)
+    assert np.allclose(rotate_points_3d(points_3d, angle, 'z'), [[[c + 2 * s, -s + 2 * c, 3]]])
+
+
+def test_transforms():
+    rng = np.random.default_rng(0)
+    rotations = euler_rotation_matrices(rng.uniform(-np.pi, np.pi, (4, 3)))
+    transforms = make_transforms(rotations, rng.uniform(-5, 5, (4, 3)))
+    points = rng.uniform(-10, 10, (4, 100, 3))
+
+    moved = transform_points(points, transforms)
+    expected = np.einsum('bij,bnj->bni', transforms[:, :3, :3], points) + transforms[:, None, :3, 3]
+    assert np.allclose(moved, expected)
+    assert np.allclose(transform_points(moved, invert_transforms(transforms)), points)
+    assert np.allclose(compose_transforms(invert_transforms(transforms), transforms), np.eye(4))
+
+    points_32 = points.astype(np.float32)
+    result = transform_points(points_32, transforms, out=points_32)
+    assert result is points_32 and result.dtype == np.float32
+    assert np.allclose(result, expected, atol=1e-4)
+
+
+def test_boxes_corners():
+    boxes = np.array([[1.0, 2.0, 3.0, 4.0, 2.0, 1.0, np.pi / 2]])
+    corners_3d = boxes_straight2rotated_3d(boxes)
+    corners_2d = boxes_straight2rotated(boxes[:, [0, 1, 3, 4, 6]])
+    assert corners_3d.shape == (1, 8, 3) and corners_2d.shape == (1, 4, 2)
+    assert np.allclose(corners_3d[0, [0, 1, 5, 4], :2], corners_2d[0])
+    assert np.allclose(corners_2d[0, 0], [2, 0])
+    assert np.allclose(corners_3d.mean(axis=1), boxes[:, :3])
+    assert boxes_straight2rotated_3d(boxes.astype(np.float32)).dtype == np.float32
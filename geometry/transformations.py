@@ -1,4 +1,132 @@
 import numpy as np
+from functools import lru_cache
+
+
+# positions of cos, sin, -sin and one in a rotation matrix around every axis
+_AXIS_LAYOUT = {
+    'x': ([(1, 1), (2, 2)], [(2, 1)], [(1, 2)], [(0, 0)]),
+    'y': ([(0, 0), (2, 2)], [(0, 2)], [(2, 0)], [(1, 1)]),
+    'z': ([(0, 0), (1, 1)], [(1, 0)], [(0, 1)], [(2, 2)]),
+}
+
+_BOX_CORNERS_2D = np.array([[-1, -1], [-1, 1], [1, 1], [1, -1]], dtype=np.float64) / 2
+_BOX_CORNERS_3D = np.array([
+    [-1, -1, -1],
+    [-1, 1, -1],
+    [-1, 1, 1],
+    [-1, -1, 1],
+    [1, -1, -1],
+    [1, 1, -1],
+    [1, 1, 1],
+    [1, -1, 1]
+], dtype=np.float64) / 2
+
+
+def _float_dtype(*arrays) -> np.dtype:
+    dtype = np.result_type(*arrays)
+    return dtype if np.issubdtype(dtype, np.floating) else np.dtype(np.float64)
+
+
+def rotation_matrices(angles: np.array, axis: str = 'z', dtype=None) -> np.array:
+    """
+    :param angles: array of size b with angles
+    :param axis: string one of 'x', 'y' or 'z'
+    :param dtype: dtype of matrices, dtype of angles (or float64 for integer angles) by default
+    :return: array of shape (b, 3, 3) with counterclockwise rotation matrices, sin and cos are computed once
+    """
+    assert axis in _AXIS_LAYOUT
+    angles = np.asarray(angles).reshape(-1)
+    dtype = _float_dtype(angles) if dtype is None else np.dtype(dtype)
+    cos, sin = np.cos(angles).astype(dtype, copy=False), np.sin(angles).astype(dtype, copy=False)
+    cos_idx, sin_idx, neg_sin_idx, one_idx = _AXIS_LAYOUT[axis]
+    rot = np.zeros((len(angles), 3, 3), dtype=dtype)
+    for i, j in cos_idx:
+        rot[:, i, j] = cos
+    for i, j in sin_idx:
+        rot[:, i, j] = sin
+    for i, j in neg_sin_idx:
+        rot[:, i, j] = -sin
+    for i, j in one_idx:
+        rot[:, i, j] = 1
+    return rot
+
+
+@lru_cache(maxsize=1024)
+def _cached_rotation_matrix(angle: float, axis: str, dtype: str) -> np.array:
+    rot = rotation_matrices(np.array([angle]), axis, dtype)[0]
+    rot.flags.writeable = False
+    return rot
+
+
+def rotation_matrix(angle: float, axis: str = 'z', dtype=np.float64) -> np.array:
+    """Cached (3, 3) rotation matrix for a scalar angle, returned array is read-only"""
+    return _cached_rotation_matrix(float(angle), axis, np.dtype(dtype).name)
+
+
+def euler_rotation_matrices(angles: np.array, axes: str = 'zyx', dtype=None) -> np.array:
+    """
+    :param angles: array of shape (b, k) with angles for k axes
+    :param axes: string of k axes, matrix is R[axes[0]] @ R[axes[1]] @ ...
+    :return: array of shape (b, 3, 3)
+    """
+    angles = np.asarray(angles).reshape(-1, len(axes))
+    rot = rotation_matrices(angles[:, 0], axes[0], dtype)
+    for idx in range(1, len(axes)):
+        rot = rot @ rotation_matrices(angles[:, idx], axes[idx], rot.dtype)
+    return rot
+
+
+def make_transforms(rotations: np.array, translations: np.array = None) -> np.array:
+    """
+    :param rotations: array of shape (b, 3, 3) or (3, 3)
+    :param translations: array of shape (b, 3) or (3,), zero by default
+    :return: homogeneous transforms of shape (b, 4, 4) or (4, 4)
+    """
+    rotations = np.asarray(rotations)
+    dtype = _float_dtype(rotations) if translations is None else _float_dtype(rotations, translations)
+    transforms = np.zeros(rotations.shape[:-2] + (4, 4), dtype=dtype)
+    transforms[..., :3, :3] = rotations
+    if translations is not None:
+        transforms[..., :3, 3] = translations
+    transforms[..., 3, 3] = 1
+    return transforms
+
+
+def compose_transforms(*transforms: np.array) -> np.array:
+    """
+    :param transforms: arrays of shape (b, 4, 4) or (4, 4), broadcasted against each other
+    :return: transform applying the last given transform first, T[0] @ T[1] @ ...
+    """
+    result = np.asarray(transforms[0])
+    for transform in transforms[1:]:
+        result = np.matmul(result, transform)
+    return result
+
+
+def invert_transforms(transforms: np.array) -> np.array:
+    """
+    :param transforms: rigid transforms of shape (b, 4, 4) or (4, 4)
+    :return: inverse transforms computed as [R^T, -R^T t]
+    """
+    transforms = np.asarray(transforms)
+    rotations_t = np.swapaxes(transforms[..., :3, :3], -1, -2)
+    return make_transforms(rotations_t, -np.matmul(rotations_t, transforms[..., :3, 3:])[..., 0])
+
+
+def transform_points(points: np.array, transforms: np.array, out: np.array = None) -> np.array:
+    """Apply rigid transforms to point sets keeping dtype of points
+    :param points: array of shape (b, n, 3) or (n, 3), float32 points stay float32
+    :param transforms: array of shape (b, 4, 4) or (4, 4), cast to dtype of points
+    :param out: output array of points shape, may be points itself for in-place transformation
+    :return: transformed points
+    """
+    dtype = _float_dtype(points)
+    transforms = np.asarray(transforms)
+    rotations_t = np.swapaxes(transforms[..., :3, :3], -1, -2).astype(dtype, copy=False)
+    translations = transforms[..., None, :3, 3].astype(dtype, copy=False)
+    out = np.matmul(points, rotations_t, out=out)
+    out += translations
+    return out
 
 
 def rotate_points_2d(points: np.array, angle: np.array) -> np.array:
@@ -8,12 +136,8 @@ def rotate_points_2d(points: np.array, angle: np.array) -> np.array:
     :param angle: array of size b with angles
     :return: return array of shape (b, n, 2) in which all points in batch rotated by angle
     """
-    rot = np.array([
-        [np.cos(angle), np.sin(angle)],
-        [-np.sin(angle), np.cos(angle)]
-    ])
-
-    return points @ rot.transpose(2, 0, 1)
+    rot = rotation_matrices(angle, 'z', _float_dtype(points, np.asarray(angle)))[:, :2, :2]
+    return points @ rot.transpose(0, 2, 1)
 
 
 def rotate_points_3d(points: np.array, angle: np.array, axis: str) -> np.array:
@@ -25,26 +149,7 @@ def rotate_points_3d(points: np.array, angle: np.array, axis: str) -> np.array:
     :return: return array of shape (b, n, z) in which all points in batch rotated by angle
     """
     assert axis in ['x', 'y', 'z']
-    if axis == 'z':
-        rot = np.array([
-            [np.cos(angle), -np.sin(angle), np.zeros_like(angle)],
-            [np.sin(angle), np.cos(angle), np.zeros_like(angle)],
-            [np.zeros_like(angle), np.zeros_like(angle), np.ones_like(angle)]
-        ])
-    if axis == 'y':
-        rot = np.array([
-            [np.cos(angle), np.zeros_like(angle), np.sin(angle)],
-            [np.zeros_like(angle), np.ones_like(angle), np.zeros_like(angle)],
-            [-np.sin(angle), np.zeros_like(angle), np.cos(angle)],
-        ])
-    if axis == 'x':
-        rot = np.array([
-            [np.ones_like(angle), np.zeros_like(angle), np.zeros_like(angle)],
-            [np.zeros_like(angle), np.cos(angle), -np.sin(angle)],
-            [np.zeros_like(angle), np.sin(angle), np.cos(angle)],
-        ])
-
-    return points @ rot.transpose(2, 0, 1)
+    return points @ rotation_matrices(angle, axis, _float_dtype(points, np.asarray(angle)))
 
 
 def boxes_straight2rotated(boxes: np.array) -> np.array:
@@ -53,10 +158,11 @@ def boxes_straight2rotated(boxes: np.array) -> np.array:
         :return np.array with 4 rotated points for each box, shape (n,4,2)
     """
 
-    cx, cy, dx, dy, yaw = boxes[:, :5].transpose(1, 0)
-    dx, dy = dx / 2, dy / 2
-    new_d = translate_points_2d(np.array([[-dx, -dy], [-dx, dy], [dx, dy], [dx, -dy]]).transpose(2, 0, 1), yaw)
-    rotated_boxes = new_d + np.expand_dims(np.array([cx, cy]), 0).transpose(2, 0, 1)
+    dtype = _float_dtype(boxes)
+    corners = _BOX_CORNERS_2D.astype(dtype) * boxes[:, None, 2:4]
+    rot = rotation_matrices(boxes[:, 4], 'z', dtype)[:, :2, :2]
+    rotated_boxes = corners @ rot.transpose(0, 2, 1)
+    rotated_boxes += boxes[:, None, 0:2]
 
     return rotated_boxes
 
@@ -67,22 +173,11 @@ def boxes_straight2rotated_3d(boxes: np.array) -> np.array:
         :return np.array with 8 rotated points for each box, shape (n,8,3)
     """
 
-    cx, cy, cz, dx, dy, dz, yaw = boxes[:, :7].transpose(1, 0)
-    dx, dy, dz = dx / 2, dy / 2, dz / 2
-    new_d = rotate_points_3d(np.array([
-        [-dx, -dy, -dz],
-        [-dx, dy, -dz],
-        [-dx, dy, dz],
-        [-dx, -dy, dz],
-        [dx, -dy, -dz],
-        [dx, dy, -dz],
-        [dx, dy, dz],
-        [dx, -dy, dz]
-    ]).transpose(2, 0, 1), yaw, axis='z')
-
-    rotated_boxes = new_d + np.expand_dims(np.array([cx, cy, cz]), 0).transpose(2, 0, 1)
+    dtype = _float_dtype(boxes)
+    corners = _BOX_CORNERS_3D.astype(dtype) * boxes[:, None, 3:6]
+    transforms = make_transforms(rotation_matrices(boxes[:, 6], 'z', dtype), boxes[:, 0:3])
 
-    return rotated_boxes
+    return transform_points(corners, transforms, out=corners)
 
 
 def boxes_rotated2cxcydxdy(
@@ -1,10 +1,10 @@
 import math
 import numpy as np
 from PIL import Image
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
-from dataset import LidarCloud, BBox
-from geometry.transformations import rotate_points_2d
+from dataset import LidarCloud, BBox, GT3D, range_mask
+from geometry.transformations import boxes_straight2rotated
 
 
 def create_empty_bev(
@@ -19,6 +19,118 @@ def create_empty_bev(
     return image
 
 
+BEV_REDUCTIONS = (
+    "count", "density", "max_height", "min_height", "mean_height", "mean_intensity", "max_intensity", "color"
+)
+
+
+def bev_pixel_coords(
+        points: np.array,
+        scene_size: List[int],
+        image_size: List[int]
+) -> Tuple[np.array, np.array, np.array]:
+    """
+    :param points: array of shape (n, 2+) with x, y in first columns
+    :param scene_size: half sizes of the scene [x, y] in meters, scene is centered at zero
+    :param image_size: [h, w] of bev image, x goes along columns and y along rows
+    :return: rows and cols of points inside scene and boolean mask of these points
+    """
+    active_points_indexes = range_mask(points, [-scene_size[0], -scene_size[1], scene_size[0], scene_size[1]])
+    filtered_points = points[active_points_indexes]
+
+    w_step = 2 * scene_size[0] / image_size[1]
+    h_step = 2 * scene_size[1] / image_size[0]
+    cols = np.floor((filtered_points[:, 0] + scene_size[0]) / w_step).astype(np.int64)
+    rows = np.floor((filtered_points[:, 1] + scene_size[1]) / h_step).astype(np.int64)
+    np.clip(cols, 0, image_size[1] - 1, out=cols)
+    np.clip(rows, 0, image_size[0] - 1, out=rows)
+    return rows, cols, active_points_indexes
+
+
+def _reduce_sorted(flat: np.array, values: np.array, size: int, take_max: bool, empty_value: float) -> np.array:
+    result = np.full(size, empty_value, dtype=np.float32)
+    if len(flat) == 0:
+        return result
+    order = np.lexsort((values, flat))
+    flat_sorted = flat[order]
+    if take_max:
+        group_edge = np.append(flat_sorted[1:] != flat_sorted[:-1], True)
+    else:
+        group_edge = np.insert(flat_sorted[1:] != flat_sorted[:-1], 0, True)
+    result[flat_sorted[group_edge]] = values[order][group_edge]
+    return result
+
+
+def rasterize_bev(
+        pcl: LidarCloud,
+        scene_size: List[int],
+        image_size: List[int],
+        reductions: Tuple[str, ...] = ("max_height", "mean_intensity", "density"),
+        empty_value: float = 0.0,
+        density_norm: float = 64.0,
+        points_colors: np.array = None
+) -> np.array:
+    """Vectorized bev feature map of a point cloud
+    :param pcl: cloud, intensity is taken from the 4th column of points when needed
+    :param scene_size: half sizes of the scene [x, y] in meters
+    :param image_size: [h, w] of the map
+    :param reductions: per pixel reductions from BEV_REDUCTIONS, one channel each,
+        color gives one channel per column of points_colors
+    :param empty_value: value of pixels without points for height, intensity and color channels
+    :param density_norm: density channel is min(1, log(1 + count) / log(density_norm))
+    :param points_colors: (n,) or (n, c) per point values of the color reduction,
+        a pixel keeps the value of its last point as in draw_pcl_on_bev
+    :return: float32 array of shape (h, w, channels)
+    """
+    for reduction in reductions:
+        assert reduction in BEV_REDUCTIONS, reduction
+    assert "color" not in reductions or points_colors is not None, "color reduction needs points_colors"
+    points = pcl.points
+    h, w = int(image_size[0]), int(image_size[1])
+    rows, cols, mask = bev_pixel_coords(points, scene_size, [h, w])
+    flat = rows * w + cols
+    count = np.bincount(flat, minlength=h * w)
+    occupied = count > 0
+
+    def heights():
+        return points[mask, 2].astype(np.float32)
+
+    def intensities():
+        return points[mask, 3].astype(np.float32)
+
+    def mean(values):
+        result = np.full(h * w, empty_value, dtype=np.float32)
+        result[occupied] = np.bincount(flat, weights=values, minlength=h * w)[occupied] / count[occupied]
+        return result
+
+    channels = []
+    for reduction in reductions:
+        if reduction == "count":
+            channel = count.astype(np.float32)
+        elif reduction == "density":
+            channel = np.minimum(1.0, np.log1p(count) / np.log(density_norm)).astype(np.float32)
+        elif reduction == "max_height":
+            channel = _reduce_sorted(flat, heights(), h * w, True, empty_value)
+        elif reduction == "min_height":
+            channel = _reduce_sorted(flat, heights(), h * w, False, empty_value)
+        elif reduction == "mean_height":
+            channel = mean(heights())
+        elif reduction == "mean_intensity":
+            channel = mean(intensities())
+        elif reduction == "max_intensity":
+            channel = _reduce_sorted(flat, intensities(), h * w, True, empty_value)
+        else:
+            colors = np.asarray(points_colors).reshape(len(points), -1)
+            channel = np.full((h * w, colors.shape[1]), empty_value, dtype=np.float32)
+            # repeated pixels keep the value of the last point
+            channel[flat] = colors[mask]
+        channels.append(channel.reshape(h, w, -1))
+
+    if not channels:
+        return np.zeros((h, w, 0), dtype=np.float32)
+    return np.concatenate(channels, axis=-1)
+
+
 def draw_pcl_on_bev(
         image: np.array,
         pcl: LidarCloud,
@@ -27,66 +139,121 @@ def draw_pcl_on_bev(
 ) -> np.array:
 
     points = pcl.xyz
-    image_size = list(image.shape[:2])
+    rows, cols, active_points_indexes = bev_pixel_coords(points, scene_size, list(image.shape[:2]))
     if points_colors is None:
-        points_colors = np.zeros([points.shape[0], 3], dtype=np.int8)
-        points_colors.fill(255)
+        image[rows, cols, :] = 255
+    else:
+        # repeated pixels keep the color of the last point, as with sequential drawing
+        image[rows, cols, :] = points_colors[active_points_indexes]
 
-    active_points_indexes = np.logical_and(
-        np.abs(points[:, 0]) < scene_size[0],
-        np.abs(points[:, 1]) < scene_size[1],
-    )
-    filtered_points = points[active_points_indexes]
-    points_colors = points_colors[active_points_indexes]
+    return image
 
-    w_step = 2 * scene_size[0] / image_size[0]
-    h_step = 2 * scene_size[1] / image_size[1]
-    x = np.floor((filtered_points[:, 0] + scene_size[0]) / w_step).astype(np.int32)
-    y = np.floor((filtered_points[:, 1  ] + scene_size[1]) / h_step).astype(np.int32)
 
-    coords = np.vstack([x, y]).T
+def bev_boxes_array(bboxes: Union[GT3D, List[BBox], np.array]) -> np.array:
+    """
+    :param bboxes: GT3D, list of BBox or array (n, 7) [cx, cy, cz, dx, dy, dz, yaw] or (n, 5) [cx, cy, dx, dy, yaw]
+    :return: array (n, 5) in format [cx, cy, dx, dy, yaw]
+    """
+    if isinstance(bboxes, GT3D):
+        boxes = bboxes.data
+    elif isinstance(bboxes, np.ndarray):
+        boxes = bboxes
+    else:
+        boxes = GT3D(list(bboxes)).data
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(len(boxes), -1)
+    if boxes.shape[1] == 7:
+        boxes = boxes[:, [0, 1, 3, 4, 6]]
+    assert boxes.shape[1] == 5
+    return boxes
 
-    for (x, y), color in zip(coords, points_colors):
-        image[y, x, :] = color
 
-    return image
+def _boxes_colors(colors: np.array, n: int) -> np.array:
+    if colors is None:
+        colors = np.full([n, 3], 255, dtype=np.uint8)
+    colors = np.asarray(colors)
+    if colors.ndim == 1:
+        colors = np.broadcast_to(colors, (n, 3))
+    return colors
 
 
-def draw_bboxes_on_bev(
-        image: np.array,
-        bboxes: List[BBox],
-        scene_size: List[int],
-        boxes_colors: np.array = None,
-) -> np.array:
+def _fill_polygons(image: np.array, corners: np.array, colors: np.array, alpha: float):
+    h, w = image.shape[:2]
+    col_min = np.clip(np.floor(corners[:, :, 0].min(axis=1)), 0, w).astype(np.int64)
+    col_max = np.clip(np.ceil(corners[:, :, 0].max(axis=1)), 0, w).astype(np.int64)
+    row_min = np.clip(np.floor(corners[:, :, 1].min(axis=1)), 0, h).astype(np.int64)
+    row_max = np.clip(np.ceil(corners[:, :, 1].max(axis=1)), 0, h).astype(np.int64)
+    widths = col_max - col_min
+    areas = widths * (row_max - row_min)
+    total = int(areas.sum())
+    if total == 0:
+        return
 
-    image_size = list(image.shape[:2])
+    box_idx = np.repeat(np.arange(len(corners)), areas)
+    local = np.arange(total) - np.repeat(np.cumsum(areas) - areas, areas)
+    rows = row_min[box_idx] + local // widths[box_idx]
+    cols = col_min[box_idx] + local % widths[box_idx]
 
-    angles = []
-    points = []
-    centers = []
-    for bbox in bboxes:
-        angles.append(bbox.yaw)
-        points.append(bbox.vertices_2d - bbox.dimensions[:2])
-        centers.append(bbox.dimensions[:2])
+    # pixel center is inside of a convex polygon when it is on the same side of all edges
+    centers = np.stack([cols + 0.5, rows + 0.5], axis=-1)
+    starts = corners[box_idx]
+    edges = np.roll(corners, -1, axis=1)[box_idx] - starts
+    to_center = centers[:, None, :] - starts
+    cross = edges[:, :, 0] * to_center[:, :, 1] - edges[:, :, 1] * to_center[:, :, 0]
+    inside = np.logical_or(np.all(cross >= 0, axis=1), np.all(cross <= 0, axis=1))
 
-    rotated_points = rotate_points_2d(np.array(points), angles)
+    rows, cols, box_idx = rows[inside], cols[inside], box_idx[inside]
+    if alpha >= 1:
+        image[rows, cols] = colors[box_idx]
+    else:
+        image[rows, cols] = (alpha * colors[box_idx] + (1 - alpha) * image[rows, cols]).astype(image.dtype)
 
-    active_points_indexes = np.logical_and(
-        np.abs(points[:, 0]) < scene_size[0],
-        np.abs(points[:, 1]) < scene_size[1],
-    )
-    filtered_points = points[active_points_indexes]
-    points_colors = points_colors[active_points_indexes]
 
-    w_step = 2 * scene_size[0] / image_size[0]
-    h_step = 2 * scene_size[1] / image_size[1]
-    x = np.floor((filtered_points[:, 0] + scene_size[0]) / w_step).astype(np.int32)
-    y = np.floor((filtered_points[:, 1] + scene_size[1]) / h_step).astype(np.int32)
+def _draw_outlines(image: np.array, corners: np.array, colors: np.array):
+    h, w = image.shape[:2]
+    starts = corners.reshape(-1, 2)
+    deltas = (np.roll(corners, -1, axis=1) - corners).reshape(-1, 2)
+    steps = np.ceil(np.abs(deltas).max(axis=1)).astype(np.int64)
+    steps = np.minimum(steps, 2 * max(h, w)) + 1
+    total = int(steps.sum())
+
+    edge_idx = np.repeat(np.arange(len(starts)), steps)
+    t = (np.arange(total) - np.repeat(np.cumsum(steps) - steps, steps)) / np.maximum(steps - 1, 1)[edge_idx]
+    samples = starts[edge_idx] + t[:, None] * deltas[edge_idx]
+    cols = np.floor(samples[:, 0]).astype(np.int64)
+    rows = np.floor(samples[:, 1]).astype(np.int64)
+    inside = (cols >= 0) & (cols < w) & (rows >= 0) & (rows < h)
+    image[rows[inside], cols[inside]] = colors[edge_idx[inside] // 4]
+
+
+def draw_bboxes_on_bev(
+        image: np.array,
+        bboxes: Union[GT3D, List[BBox], np.array],
+        scene_size: List[int],
+        boxes_colors: np.array = None,
+        fill_colors: np.array = None,
+        fill_alpha: float = 1.0,
+) -> np.array:
+    """Draw rotated boxes footprints on bev image, all boxes are processed at once
+    :param image: bev image of shape (h, w, 3)
+    :param bboxes: GT3D, list of BBox or boxes array, see bev_boxes_array
+    :param scene_size: half sizes of the scene [x, y] in meters, as in draw_pcl_on_bev
+    :param boxes_colors: outline color (3,) or colors (n, 3), white by default
+    :param fill_colors: fill footprints with color (3,) or colors (n, 3), not filled by default
+    :param fill_alpha: opacity of filled footprints
+    :return: image
+    """
+    boxes = bev_boxes_array(bboxes)
+    if len(boxes) == 0:
+        return image
+    h, w = image.shape[:2]
 
-    coords = np.vstack([x, y]).T
+    corners = boxes_straight2rotated(boxes)
+    corners[:, :, 0] = (corners[:, :, 0] + scene_size[0]) * (w / (2 * scene_size[0]))
+    corners[:, :, 1] = (corners[:, :, 1] + scene_size[1]) * (h / (2 * scene_size[1]))
 
-    for (x, y), color in zip(coords, points_colors):
-        image[y, x, :] = color
+    if fill_colors is not None:
+        _fill_polygons(image, corners, _boxes_colors(fill_colors, len(boxes)), fill_alpha)
+    _draw_outlines(image, corners, _boxes_colors(boxes_colors, len(boxes)))
 
     return image
 
@@ -0,0 +1,69 @@
+import numpy as np
+
+from dataset import LidarCloud
+from .bev import create_empty_bev, draw_pcl_on_bev, draw_bboxes_on_bev, rasterize_bev
+
+
+def test_draw_pcl_on_bev():
+    pcl = LidarCloud(np.array([
+        [-9.5, -9.5, 0.0, 0.0],
+        [9.5, -9.5, 0.0, 0.0],
+        [9.5, 9.5, 0.0, 0.0],
+        [20.0, 0.0, 0.0, 0.0],
+    ], dtype=np.float32))
+    colors = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255], [1, 1, 1]], dtype=np.uint8)
+    image = draw_pcl_on_bev(create_empty_bev([10, 20]), pcl, [10, 10], colors)
+    assert list(image[0, 0]) == [255, 0, 0]
+    assert list(image[0, 19]) == [0, 255, 0]
+    assert list(image[9, 19]) == [0, 0, 255]
+    assert image.sum() == 3 * 255
+
+
+def test_rasterize_bev_reductions():
+    pcl = LidarCloud(np.array([
+        [0.5, 0.5, 1.0, 0.2],
+        [0.6, 0.6, 3.0, 0.4],
+        [-0.5, -0.5, -1.0, 1.0],
+    ], dtype=np.float32))
+    bev = rasterize_bev(pcl, [1, 1], [2, 2], ("count", "max_height", "min_height", "mean_intensity"))
+    assert bev.shape == (2, 2, 4)
+    assert list(bev[1, 1]) == [2, 3, 1, np.float32(0.3)]
+    assert list(bev[0, 0]) == [1, -1, -1, 1]
+    assert np.all(bev[0, 1] == 0)
+
+
+def test_draw_bboxes_on_bev():
+    boxes = np.array([
+        [0.0, 0.0, 0.0, 8.0, 4.0, 1.0, 0.0],
+        [0.0, 0.0, 0.0, 8.0, 4.0, 1.0, np.pi / 2],
+        [100.0, 100.0, 0.0, 1.0, 1.0, 1.0, 0.3],
+    ])
+    image = draw_bboxes_on_bev(create_empty_bev([20, 20]), boxes[:1], [10, 10],
+                               boxes_colors=[255, 0, 0], fill_colors=[0, 255, 0])
+    assert np.all(image[8, 6:15] == [255, 0, 0]) and np.all(image[8:13, 6] == [255, 0, 0])
+    assert np.all(image[9:12, 7:14] == [0, 255, 0])
+    assert image[:8].sum() == 0 and image[:, :6].sum() == 0
+
+    rotated = draw_bboxes_on_bev(create_empty_bev([20, 20]), boxes[1:], [10, 10], fill_colors=[0, 255, 0])
+    assert np.all(rotated[7:14, 9:12, 1] == 255)
+    assert rotated[:, :8].sum() == 0 and rotated[:6].sum() == 0
+
+    far_away = draw_bboxes_on_bev(create_empty_bev([20, 20]), boxes[2:], [10, 10], fill_colors=[0, 255, 0])
+    assert far_away.sum() == 0
+
+
+def test_rasterize_bev_color():
+    pcl = LidarCloud(np.array([
+        [0.5, 0.5, 1.0, 0.2],
+        [0.6, 0.6, 3.0, 0.4],
+        [-0.5, -0.5, -1.0, 1.0],
+    ], dtype=np.float32))
+    colors = np.array([[255, 0, 0], [0, 255, 0], [0, 0, 255]], dtype=np.uint8)
+    bev = rasterize_bev(pcl, [1, 1], [2, 2], ("count", "color"), empty_value=-1, points_colors=colors)
+    assert bev.shape == (2, 2, 4)
+    assert list(bev[1, 1]) == [2, 0, 255, 0]
+    assert list(bev[0, 0]) == [1, 0, 0, 255]
+    assert list(bev[0, 1]) == [0, -1, -1, -1]
+
+    labels = rasterize_bev(pcl, [1, 1], [2, 2], ("color",), points_colors=np.array([7, 8, 9]))
+    assert labels.shape == (2, 2, 1) and labels[1, 1, 0] == 8